@@ -0,0 +1,126 @@
+import time
+from dataclasses import dataclass, field
+import nlp
+
+@dataclass
+class AnalysisResult:
+    text: str
+    sentiment: str = "neutral"
+    keywords: list = field(default_factory=list)
+    named_entities: list = field(default_factory=list)
+    complexity: str = "Low"
+    entities: list = field(default_factory=list)  # spaCy (text, label) pairs, sent along with the prompt
+    timings: dict = field(default_factory=dict)  # stage name -> milliseconds
+
+    @property
+    def total_ms(self):
+        return sum(self.timings.values())
+
+    def as_dict(self):
+        # Shape expected by ChatUI.update_analysis_display
+        return {
+            "sentiment": self.sentiment,
+            "keywords": self.keywords,
+            "named_entities": self.named_entities,
+            "complexity": self.complexity,
+            "entities": self.entities,
+            "timings": dict(self.timings),
+        }
+
+def timed_stage(timings, name, fn, *args):
+    start = time.perf_counter()
+    try:
+        return fn(*args)
+    except Exception as e:
+        raise Exception(f"Error in {name} stage: {str(e)}")
+    finally:
+        timings[name] = (time.perf_counter() - start) * 1000
+
+class AnalysisPipeline:
+    # Tokenizes, sentence-splits and POS-tags a message once, then feeds every analyzer from that
+    # shared document instead of letting each nlp.* helper redo the work
+    def __init__(self, spacy_model=None, num_keywords=5, use_spacy=True):
+        self._spacy_model = spacy_model
+        self.num_keywords = num_keywords
+        self.use_spacy = use_spacy
+
+    @property
+    def spacy_model(self):
+        # Shared, lazily loaded en_core_web_sm unless a model was passed in
+        if self._spacy_model is None and self.use_spacy:
+            return nlp.resources.get("spacy")
+        return self._spacy_model
+
+    def analyze(self, text):
+        result = AnalysisResult(text=text)
+
+        def stage(name, fn, *args):
+            return timed_stage(result.timings, name, fn, *args)
+
+        words = stage("tokenize", nlp.tokenize_words, text)
+        sentences = stage("sentences", nlp.tokenize_sentences, text)
+        if not words:
+            return result
+
+        pos_tags = stage("pos_tag", nlp.pos_tag_words, words)
+        result.sentiment = stage("sentiment", self._sentiment, text)
+        result.keywords = stage("keywords", nlp.keywords_from_tokens, words, self.num_keywords)
+        result.named_entities = stage("named_entities", nlp.entities_from_pos_tags, pos_tags)
+        result.complexity = stage("complexity", nlp.complexity_from_tokens, words, sentences)
+        if self.use_spacy:
+            result.entities = stage("spacy", self._spacy_entities, text)
+        return result
+
+    def analyze_batch(self, texts, n_process=1, batch_size=64):
+        # Same analysis for many messages at once: one tagger call and one spaCy nlp.pipe over the
+        # whole batch. Stage timings are the batch totals split evenly across its messages.
+        results = [AnalysisResult(text=text) for text in texts]
+        timings = {}
+
+        def stage(name, fn, *args):
+            return timed_stage(timings, name, fn, *args)
+
+        words = stage("tokenize", lambda: [nlp.tokenize_words(text) for text in texts])
+        sentences = stage("sentences", lambda: [nlp.tokenize_sentences(text) for text in texts])
+        live = [i for i, w in enumerate(words) if w]
+        if live:
+            tagger = nlp.resources.get("pos_tagger")
+            pos_tags = stage("pos_tag", tagger.tag_sents, [words[i] for i in live])
+
+            def sentiment():
+                vader = nlp.resources.get("vader")
+                for i in live:
+                    results[i].sentiment = nlp.sentiment_label(vader.polarity_scores(texts[i]))
+
+            def keywords():
+                for i in live:
+                    results[i].keywords = nlp.keywords_from_tokens(words[i], self.num_keywords)
+
+            def named_entities():
+                for i, tags in zip(live, pos_tags):
+                    results[i].named_entities = nlp.entities_from_pos_tags(tags)
+
+            def complexity():
+                for i in live:
+                    results[i].complexity = nlp.complexity_from_tokens(words[i], sentences[i])
+
+            stage("sentiment", sentiment)
+            stage("keywords", keywords)
+            stage("named_entities", named_entities)
+            stage("complexity", complexity)
+            if self.use_spacy:
+                docs = stage("spacy", lambda: list(self.spacy_model.pipe(
+                    [texts[i] for i in live], n_process=n_process, batch_size=batch_size)))
+                for i, doc in zip(live, docs):
+                    results[i].entities = [(ent.text, ent.label_) for ent in doc.ents]
+
+        for result in results:
+            result.timings = {name: ms / len(texts) for name, ms in timings.items()}
+        return results
+
+    def _sentiment(self, text):
+        return nlp.sentiment_label(nlp.resources.get("vader").polarity_scores(text))
+
+    def _spacy_entities(self, text):
+        doc = self.spacy_model(text)
+        return [(ent.text, ent.label_) for ent in doc.ents]
@@ -1,10 +1,32 @@
-from groq import Groq
+import os
+import threading
 
 # Store your API key here
 API_KEY = "your_Groq_API_key"
 
-# Create Groq client
-client = Groq(api_key=API_KEY)
-
 # Llama 3 8B model
 MODEL = "llama3-groq-70b-8192-tool-use-preview"
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    # Create the Groq client on first use so importing this module stays cheap
+    # (IRIS_FAKE_LLM=1 swaps in a local fake that streams canned replies)
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if os.environ.get("IRIS_FAKE_LLM"):
+                    from fake_llm import FakeGroq
+                    _client = FakeGroq()
+                else:
+                    from groq import Groq
+                    _client = Groq(api_key=API_KEY)
+    return _client
+
+def __getattr__(name):
+    # Keeps `api.client` working for existing callers
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
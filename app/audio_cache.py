@@ -0,0 +1,165 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import wave
+from collections import OrderedDict
+from tts import Clip
+
+def default_cache_dir():
+    return os.environ.get("IRIS_TTS_CACHE", os.path.join(os.path.expanduser("~"), ".iris", "tts-cache"))
+
+def audio_key(engine, text, voice, rate, volume):
+    payload = json.dumps([engine, " ".join(text.split()), voice, rate, round(float(volume), 3)], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def wav_layout(buffer):
+    # (channels, sample rate, sample width, PCM offset, PCM length) of a RIFF/WAVE file, read from
+    # its chunks without copying the audio
+    if buffer[:4] != b"RIFF" or buffer[8:12] != b"WAVE":
+        raise Exception("Not a WAV file")
+    fmt = None
+    position = 12
+    while position + 8 <= len(buffer):
+        chunk_id, size = struct.unpack_from("<4sI", buffer, position)
+        if chunk_id == b"fmt ":
+            channels, sample_rate = struct.unpack_from("<HI", buffer, position + 10)
+            bits, = struct.unpack_from("<H", buffer, position + 22)
+            fmt = (channels, sample_rate, bits // 8)
+        elif chunk_id == b"data" and fmt is not None:
+            return fmt + (position + 8, min(size, len(buffer) - position - 8))
+        position += 8 + size + (size & 1)
+    raise Exception("WAV file has no audio")
+
+class AudioCache:
+    # Synthesized sentences as WAV files named by the hash of (engine, text, voice, rate, volume),
+    # evicted least recently used past `max_bytes`. Hits are played straight from a memory map.
+    # File modification times record recency, so the LRU order survives restarts.
+    def __init__(self, directory=None, max_bytes=200 * 2 ** 20):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self.load()
+
+    key = staticmethod(audio_key)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".wav")
+
+    def load(self):
+        found = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".wav"):
+                stat = os.stat(os.path.join(self.directory, filename))
+                found.append((stat.st_mtime, filename[:-4], stat.st_size))
+        with self.lock:
+            for _, key, size in sorted(found):
+                self.entries[key] = size
+                self.total_bytes += size
+            self._evict()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+        try:
+            with open(self.path(key), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            os.utime(self.path(key))
+            channels, sample_rate, sample_width, offset, length = wav_layout(mapped)
+        except Exception as e:
+            # Deleted or truncated behind our back: forget it and synthesize again
+            print(f"Error reading cached speech: {str(e)}")
+            with self.lock:
+                self.total_bytes -= self.entries.pop(key, 0)
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return Clip(memoryview(mapped)[offset:offset + length], sample_rate, sample_width, channels)
+
+    def put(self, key, clip):
+        fd, temp = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f, wave.open(f, "wb") as wav:
+                wav.setnchannels(clip.channels)
+                wav.setsampwidth(clip.sample_width)
+                wav.setframerate(clip.sample_rate)
+                wav.writeframes(clip.pcm)
+            os.replace(temp, self.path(key))
+        except Exception:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+        size = os.path.getsize(self.path(key))
+        with self.lock:
+            self.total_bytes += size - self.entries.pop(key, 0)
+            self.entries[key] = size
+            self._evict()
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass  # Still mapped for playback on Windows; the next load() picks it up again
+
+    def clear(self):
+        with self.lock:
+            for key in self.entries:
+                try:
+                    os.remove(self.path(key))
+                except OSError:
+                    pass
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "evictions": self.evictions,
+            }
+
+def benchmark(spec="silent", phrases=20, repeats=5):
+    # Synthesis time for phrases spoken repeatedly, without the cache and through it
+    from tts import create_synthesizer
+    synthesizer = create_synthesizer(spec)
+    texts = [f"Phrase number {i}, said again and again by Iris." for i in range(phrases)]
+    with tempfile.TemporaryDirectory() as directory:
+        cache = AudioCache(directory)
+        for label, use_cache in (("no cache", False), ("cache", True)):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                for text in texts:
+                    if use_cache:
+                        key = cache.key(synthesizer.name, text, *synthesizer.settings())
+                        if cache.get(key) is None:
+                            cache.put(key, synthesizer.synthesize(text))
+                    else:
+                        synthesizer.synthesize(text)
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"{synthesizer.name} {label:<9} {elapsed / (phrases * repeats):7.2f} ms per sentence")
+        print(cache.stats())
+
+if __name__ == "__main__":
+    import sys
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else "silent")
@@ -0,0 +1,124 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+_STOP = object()
+
+class BatcherClosed(Exception):
+    pass
+
+class MicroBatcher:
+    # Collects requests from any thread for up to `window_ms`, then hands them to `process_batch` as
+    # one list. process_batch must return one result per item, in order. submit() returns a
+    # concurrent.futures.Future (wrap it with asyncio.wrap_future from async code).
+    def __init__(self, process_batch, window_ms=5.0, max_batch=64, name="iris-batcher"):
+        self.process_batch = process_batch
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.batches = self.items = 0
+        self.closed = False
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def submit(self, item):
+        future = Future()
+        with self.lock:
+            if self.closed:
+                future.set_exception(BatcherClosed("Batcher closed"))
+            else:
+                self.queue.put((item, future))
+        return future
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.queue.put(_STOP)
+        self.thread.join()
+        self._fail_pending()
+
+    def _fail_pending(self):
+        # Whatever was queued behind the stop marker would otherwise wait forever
+        while True:
+            try:
+                entry = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            if entry is not _STOP and entry[1].set_running_or_notify_cancel():
+                entry[1].set_exception(BatcherClosed("Batcher closed"))
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self.queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    # Whatever is already queued joins the batch even once the window has passed
+                    timeout = deadline - time.monotonic()
+                    entry = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+
+            live = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not live:
+                continue
+            try:
+                results = self.process_batch([item for item, _ in live])
+                for (_, future), result in zip(live, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in live:
+                    future.set_exception(e)
+            self.batches += 1
+            self.items += len(live)
+
+    def stats(self):
+        return {"batches": self.batches, "items": self.items,
+                "mean_batch": self.items / self.batches if self.batches else 0.0}
+
+def benchmark(windows=(0, 2, 5, 10, 20), messages=2000, clients=64):
+    # Analysis throughput in messages/second: one at a time vs micro-batched at several windows.
+    # Needs the NLTK data and en_core_web_sm installed.
+    from analysis import AnalysisPipeline
+    import nlp
+
+    pipeline = AnalysisPipeline()
+    nlp.resources.warm_up(background=False)
+    texts = [f"Message {i}: Ada Lovelace met Charles Babbage in London to talk about engines. "
+             f"It went {'well' if i % 2 else 'badly'}." for i in range(messages)]
+
+    def run(batcher):
+        per_client = messages // clients
+
+        def client(offset):
+            for i in range(offset * per_client, (offset + 1) * per_client):
+                batcher.submit(texts[i]).result()
+
+        threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        batcher.close()
+        return per_client * clients / elapsed, batcher.stats()["mean_batch"]
+
+    rate, _ = run(MicroBatcher(lambda items: [pipeline.analyze(text) for text in items], max_batch=1))
+    print(f"{'unbatched':>12}: {rate:8.1f} msg/s")
+    for window in windows:
+        rate, mean_batch = run(MicroBatcher(pipeline.analyze_batch, window_ms=window))
+        print(f"{f'{window} ms window':>12}: {rate:8.1f} msg/s (mean batch {mean_batch:.1f})")
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+def normalize_messages(messages):
+    # Whitespace differences should not turn an identical question into a cache miss
+    return [{"role": m["role"], "content": " ".join(str(m["content"]).split())} for m in messages]
+
+def cache_key(messages, model, params):
+    payload = json.dumps(
+        {"model": model, "params": params, "messages": normalize_messages(messages)},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    # Two tiers: an in-memory LRU and an optional SQLite file shared across restarts.
+    # Only temperature=0 requests are cached unless cache_sampled=True.
+    def __init__(self, max_entries=256, ttl=24 * 3600, db_path=None, max_db_entries=10000, cache_sampled=False):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_db_entries = max_db_entries
+        self.cache_sampled = cache_sampled
+        self.enabled = True
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.disk_hits = self.misses = 0
+        self.db = None
+        self._writes = 0
+        if db_path:
+            self.open_db(db_path)
+
+    def open_db(self, db_path):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.db.commit()
+
+    def is_cacheable(self, params):
+        return self.enabled and (self.cache_sampled or params.get("temperature", 1) == 0)
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            entry = self.memory.get(key)
+            if entry is not None:
+                response, created = entry
+                if now - created <= self.ttl:
+                    self.memory.move_to_end(key)
+                    self.hits += 1
+                    return response
+                del self.memory[key]
+
+            if self.db is not None:
+                row = self.db.execute(
+                    "SELECT response, created FROM responses WHERE key = ? AND created >= ?",
+                    (key, now - self.ttl),
+                ).fetchone()
+                if row is not None:
+                    self.db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                    self.db.commit()
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, response):
+        now = time.time()
+        with self.lock:
+            self._remember(key, response, now)
+            if self.db is not None:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, created, accessed) VALUES (?, ?, ?, ?)",
+                    (key, response, now, now),
+                )
+                self._writes += 1
+                if self._writes % 64 == 0:
+                    self._evict_db(now)
+                self.db.commit()
+
+    def _remember(self, key, response, created):
+        self.memory[key] = (response, created)
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_entries:
+            self.memory.popitem(last=False)
+
+    def _evict_db(self, now):
+        self.db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        self.db.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_db_entries,),
+        )
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            if self.db is not None:
+                self.db.execute("DELETE FROM responses")
+                self.db.commit()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self.memory),
+            }
@@ -0,0 +1,248 @@
+import math
+import queue
+import threading
+import time
+import wave
+from array import array
+from collections import deque
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2  # 16-bit mono PCM throughout
+FRAME_MS = 30
+
+def frame_energy(frame):
+    samples = array('h', frame)
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+class MicrophoneSource:
+    # Keeps one PyAudio input stream open (through speech_recognition) for the life of the capture
+    def __init__(self, sample_rate=SAMPLE_RATE, frame_ms=FRAME_MS, device_index=None):
+        import speech_recognition as sr
+        self.sample_rate = sample_rate
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self.microphone = sr.Microphone(device_index=device_index, sample_rate=sample_rate,
+                                        chunk_size=self.frame_samples)
+        self.microphone.__enter__()
+
+    def read(self):
+        return self.microphone.stream.read(self.frame_samples)
+
+    def close(self):
+        self.microphone.__exit__(None, None, None)
+
+class WavFileSource:
+    # Fake microphone: plays 16-bit mono WAV files frame by frame, optionally in real time, with
+    # `gap_ms` of silence after each file. read() returns b"" once everything has been played.
+    def __init__(self, *paths, frame_ms=FRAME_MS, realtime=False, gap_ms=1000):
+        self.frames = deque()
+        self.sample_rate = None
+        for path in paths:
+            with wave.open(path, "rb") as wav:
+                if wav.getnchannels() != 1 or wav.getsampwidth() != SAMPLE_WIDTH:
+                    raise Exception(f"{path}: expected 16-bit mono audio")
+                if self.sample_rate not in (None, wav.getframerate()):
+                    raise Exception(f"{path}: all files must share one sample rate")
+                self.sample_rate = wav.getframerate()
+                frame_bytes = self.sample_rate * frame_ms // 1000 * SAMPLE_WIDTH
+                data = wav.readframes(wav.getnframes())
+            for i in range(0, len(data) - frame_bytes + 1, frame_bytes):
+                self.frames.append(data[i:i + frame_bytes])
+            self.frames.extend([b"\0" * frame_bytes] * (gap_ms // frame_ms))
+        self.frame_seconds = frame_ms / 1000
+        self.realtime = realtime
+        # Played faster than real time, the file only advances while a capture is listening
+        self.live = realtime
+
+    def read(self):
+        if not self.frames:
+            return b""
+        if self.realtime:
+            time.sleep(self.frame_seconds)
+        return self.frames.popleft()
+
+    def close(self):
+        self.frames.clear()
+
+class EnergyVAD:
+    # Energy-threshold voice activity detection against a noise floor that keeps adapting to the
+    # room between utterances, so no per-press calibration is needed
+    def __init__(self, ratio=3.0, min_energy=150.0, adapt=0.05):
+        self.ratio = ratio
+        self.min_energy = min_energy
+        self.adapt = adapt
+        self.noise_floor = None
+
+    @property
+    def threshold(self):
+        return max(self.min_energy, (self.noise_floor or 0.0) * self.ratio)
+
+    def is_speech(self, frame):
+        energy = frame_energy(frame)
+        if self.noise_floor is None:
+            self.noise_floor = energy
+        voiced = energy > self.threshold
+        if not voiced:
+            self.noise_floor += self.adapt * (energy - self.noise_floor)
+        return voiced
+
+class VoiceCapture:
+    # Reads a source continuously on its own thread. Recent audio sits in a ring buffer so an
+    # utterance includes `preroll_ms` from before speech was detected; an utterance ends after
+    # `end_silence_ms` of silence. Only armed captures (listen()) are delivered.
+    # With a `stream_factory` (a streaming stt backend's stream method) frames are also fed to a
+    # recognizer as they arrive, and its partial results replace the periodic re-recognition.
+    # `on_speech` is called from the capture thread when an armed utterance begins.
+    def __init__(self, source, recognize=None, vad=None, frame_ms=FRAME_MS, preroll_ms=300,
+                 start_ms=90, end_silence_ms=600, max_utterance_ms=15000, partial_interval_ms=1000,
+                 stream_factory=None, on_speech=None):
+        self.source = source
+        self.sample_rate = source.sample_rate
+        self.recognize = recognize
+        self.stream_factory = stream_factory
+        self.on_speech = on_speech
+        self.vad = vad or EnergyVAD()
+        self.preroll = deque(maxlen=max(1, preroll_ms // frame_ms))
+        self.start_frames = max(1, start_ms // frame_ms)
+        self.end_frames = max(1, end_silence_ms // frame_ms)
+        self.max_frames = max_utterance_ms // frame_ms
+        self.partial_frames = partial_interval_ms // frame_ms if partial_interval_ms else 0
+        self.frame_seconds = frame_ms / 1000
+        self.utterances = queue.Queue()
+        self.armed = threading.Event()
+        self.speech_started = threading.Event()  # an armed utterance has begun
+        self.on_partial = None
+        self.partial_busy = threading.Lock()
+        self.running = False
+        self.ended = False
+        self.thread = None
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.thread = threading.Thread(target=self._run, name="iris-capture", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+        self.source.close()
+
+    def listen(self, timeout=10, on_partial=None):
+        # Returns (pcm_bytes, speech_end_time, recognizer_stream) for the next utterance; the caller
+        # must finish() the stream when there is one. Raises TimeoutError if nobody starts speaking
+        # within `timeout` seconds; once they have, the utterance may run up to max_utterance_ms.
+        if self.ended:
+            raise EOFError("Audio source ended")
+        while not self.utterances.empty():
+            self._discard(self.utterances.get_nowait())
+        self.on_partial = on_partial
+        self.speech_started.clear()
+        self.armed.set()
+        self.start()
+        try:
+            try:
+                utterance = self.utterances.get(timeout=timeout)
+            except queue.Empty:
+                if not self.speech_started.is_set():
+                    raise TimeoutError("No speech detected")
+                try:
+                    utterance = self.utterances.get(timeout=self.max_frames * self.frame_seconds + 1)
+                except queue.Empty:
+                    raise TimeoutError("Speech did not end")
+        finally:
+            self.armed.clear()
+            self.on_partial = None
+        if utterance is None:
+            raise EOFError("Audio source ended")
+        return utterance
+
+    def _discard(self, utterance):
+        # An utterance nobody collected still has to release its recognizer stream
+        if utterance is not None and utterance[2] is not None:
+            try:
+                utterance[2].finish()
+            except Exception:
+                pass
+
+    def _run(self):
+        speech = []
+        stream = None
+        voiced_run = silent_run = 0
+        in_speech = False
+        live = getattr(self.source, "live", True)
+        while self.running:
+            if not live and not in_speech and not self.armed.wait(0.05):
+                continue
+            frame = self.source.read()
+            if not frame:
+                self.ended = True
+                self.utterances.put(None)
+                break
+            voiced = self.vad.is_speech(frame)
+
+            if not in_speech:
+                self.preroll.append(frame)
+                voiced_run = voiced_run + 1 if voiced else 0
+                if voiced_run >= self.start_frames and self.armed.is_set():
+                    in_speech = True
+                    self.speech_started.set()
+                    speech = list(self.preroll)
+                    silent_run = 0
+                    if self.on_speech is not None:
+                        self.on_speech()
+                    stream = self._start_stream(b"".join(speech))
+                continue
+
+            speech.append(frame)
+            silent_run = 0 if voiced else silent_run + 1
+            if stream is not None:
+                self._feed(stream, frame)
+            elif self.partial_frames and len(speech) % self.partial_frames == 0:
+                self._partial(b"".join(speech))
+            if silent_run >= self.end_frames or len(speech) >= self.max_frames:
+                # Drop the trailing silence; recognition can start right away
+                audio = b"".join(speech[:len(speech) - silent_run] if silent_run else speech)
+                self.utterances.put((audio, time.perf_counter(), stream))
+                stream = None
+                in_speech = False
+                voiced_run = 0
+                self.preroll.clear()
+
+    def _start_stream(self, audio):
+        if self.stream_factory is None:
+            return None
+        try:
+            stream = self.stream_factory(self.sample_rate)
+        except Exception as e:
+            print(f"Error starting speech recognizer: {str(e)}")
+            return None
+        self._feed(stream, audio)
+        return stream
+
+    def _feed(self, stream, audio):
+        partial = stream.accept(audio)
+        callback = self.on_partial
+        if partial and callback is not None:
+            callback(partial)
+
+    def _partial(self, audio):
+        # Recognize the audio so far on a side thread; skip if the previous partial is still running
+        callback = self.on_partial
+        if callback is None or self.recognize is None or not self.partial_busy.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                text = self.recognize(audio, self.sample_rate)
+                if text:
+                    callback(text)
+            except Exception:
+                pass  # Partial results are best effort; the final recognition reports errors
+            finally:
+                self.partial_busy.release()
+
+        threading.Thread(target=run, daemon=True).start()
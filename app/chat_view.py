@@ -0,0 +1,282 @@
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from PyQt6.QtWidgets import QAbstractScrollArea, QApplication
+from PyQt6.QtGui import QColor, QFont, QFontMetrics, QPainter, QStaticText, QTextOption, QTransform
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QPointF, QRect, QTimer
+
+SENDER_COLORS = {"Iris": "#6495ED"}
+DEFAULT_SENDER_COLOR = "#34C759"
+NOTE_COLOR = "#808080"
+
+class ChatModel(QAbstractListModel):
+    # Every message's full text, as [sender, text] rows; sender None is a note. Streamed text is
+    # buffered and applied at most once per frame, so a burst of deltas costs one repaint.
+    SenderRole = Qt.ItemDataRole.UserRole + 1
+
+    def __init__(self, parent=None, frame_ms=16):
+        super().__init__(parent)
+        self.messages = []
+        self.pending = {}  # row -> text not yet applied
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(frame_ms)
+        self.flush_timer.timeout.connect(self.flush)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.messages)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.messages):
+            return None
+        sender, text = self.messages[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return text
+        if role == self.SenderRole:
+            return sender
+        return None
+
+    def append_message(self, sender, text):
+        self.flush()
+        row = len(self.messages)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.messages.append([sender, text])
+        self.endInsertRows()
+        return row
+
+    def append_text(self, row, text):
+        self.pending[row] = self.pending.get(row, "") + text
+        if not self.flush_timer.isActive():
+            self.flush_timer.start()
+
+    def flush(self):
+        self.flush_timer.stop()
+        pending, self.pending = self.pending, {}
+        for row, text in pending.items():
+            if row < len(self.messages):
+                self.messages[row][1] += text
+                index = self.index(row)
+                self.dataChanged.emit(index, index)
+
+    def clear(self):
+        self.flush_timer.stop()
+        self.beginResetModel()
+        self.messages = []
+        self.pending = {}
+        self.endResetModel()
+
+class ChatView(QAbstractScrollArea):
+    # Virtualized chat log: row heights are measured once per message (and again only when the width
+    # changes) into a running total, and paintEvent draws just the rows that intersect the viewport,
+    # so appending stays O(1) however long the conversation gets. Laid-out text is kept for at most
+    # `max_rendered` recently painted rows; the model always keeps the full text.
+    # Stays pinned to the newest message unless the user has scrolled up.
+    MARGIN = 8
+    SPACING = 10
+
+    def __init__(self, parent=None, max_rendered=200):
+        super().__init__(parent)
+        self.model = None
+        self.max_rendered = max_rendered
+        self.rendered = OrderedDict()  # row -> (text length, width, QStaticText)
+        self.tops = [0]  # tops[i] is the y of row i; tops[-1] is the content height
+        self.layout_width = None
+        self.follow = True
+        # Re-measuring every row is O(n), so wait for the window to stop resizing
+        self.relayout_timer = QTimer(self)
+        self.relayout_timer.setSingleShot(True)
+        self.relayout_timer.setInterval(50)
+        self.relayout_timer.timeout.connect(self._relayout)
+        self.verticalScrollBar().setSingleStep(20)
+        self.verticalScrollBar().valueChanged.connect(self._scrolled)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+
+    def setModel(self, model):
+        if self.model is not None:
+            self.model.rowsInserted.disconnect(self._rows_inserted)
+            self.model.dataChanged.disconnect(self._data_changed)
+            self.model.modelReset.disconnect(self._relayout)
+        self.model = model
+        model.rowsInserted.connect(self._rows_inserted)
+        model.dataChanged.connect(self._data_changed)
+        model.modelReset.connect(self._relayout)
+        self._relayout()
+
+    def clear(self):
+        self.model.clear()
+
+    def _text_width(self):
+        return max(1, self.viewport().width() - 2 * self.MARGIN)
+
+    def _fonts(self):
+        bold = QFont(self.font())
+        bold.setBold(True)
+        italic = QFont(self.font())
+        italic.setItalic(True)
+        return bold, italic
+
+    def _measure(self, row):
+        sender, text = self.model.messages[row]
+        bold, italic = self._fonts()
+        width = self._text_width()
+        if sender is None:
+            return int(self._static_text(row, text, width, italic).size().height()) + self.SPACING
+        body = self._static_text(row, text, width, self.font()).size().height()
+        return QFontMetrics(bold).height() + int(body) + self.SPACING
+
+    def _relayout(self):
+        self.relayout_timer.stop()
+        self.layout_width = self._text_width()
+        self.rendered.clear()
+        self.tops = [0]
+        for row in range(self.model.rowCount() if self.model is not None else 0):
+            self.tops.append(self.tops[-1] + self._measure(row))
+        self._update_scrollbar()
+
+    def _rows_inserted(self, parent, first, last):
+        if first != len(self.tops) - 1:
+            self._relayout()  # Not an append; the chat log only ever appends
+            return
+        for row in range(first, last + 1):
+            self.tops.append(self.tops[-1] + self._measure(row))
+        self._update_scrollbar()
+
+    def _data_changed(self, top_left, bottom_right):
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            delta = self._measure(row) - (self.tops[row + 1] - self.tops[row])
+            if delta:
+                # Streaming only ever grows the last row, so this loop is normally a single step
+                for i in range(row + 1, len(self.tops)):
+                    self.tops[i] += delta
+        self._update_scrollbar()
+
+    def _update_scrollbar(self):
+        scrollbar = self.verticalScrollBar()
+        height = self.viewport().height()
+        scrollbar.setPageStep(height)
+        scrollbar.setRange(0, max(0, self.tops[-1] - height + self.MARGIN))
+        if self.follow:
+            scrollbar.setValue(scrollbar.maximum())
+        self.viewport().update()
+
+    def _static_text(self, row, text, width, font):
+        # Word-wrapping is the expensive part of painting, so it is done once per row and text and
+        # shared between measuring and painting
+        entry = self.rendered.get(row)
+        if entry is not None and entry[0] == len(text) and entry[1] == width:
+            self.rendered.move_to_end(row)
+            return entry[2]
+        static = QStaticText(text)
+        static.setTextFormat(Qt.TextFormat.PlainText)
+        static.setTextWidth(width)
+        option = QTextOption()
+        option.setWrapMode(QTextOption.WrapMode.WrapAtWordBoundaryOrAnywhere)
+        static.setTextOption(option)
+        static.prepare(QTransform(), font)
+        self.rendered[row] = (len(text), width, static)
+        self.rendered.move_to_end(row)
+        while len(self.rendered) > self.max_rendered:
+            self.rendered.popitem(last=False)
+        return static
+
+    def _scrolled(self, value):
+        self.follow = value >= self.verticalScrollBar().maximum()
+        self.viewport().update()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if self.model is not None and self._text_width() != self.layout_width:
+            self.relayout_timer.start()
+        self._update_scrollbar()
+
+    def paintEvent(self, event):
+        if self.model is None:
+            return
+        painter = QPainter(self.viewport())
+        offset = self.verticalScrollBar().value() - self.MARGIN
+        height = self.viewport().height()
+        width = self._text_width()
+        bold, italic = self._fonts()
+        text_color = self.palette().text().color()
+        header = QFontMetrics(bold).height()
+        row = max(0, bisect_right(self.tops, offset) - 1)
+        while row < len(self.tops) - 1 and self.tops[row] - offset < height:
+            sender, text = self.model.messages[row]
+            y = self.tops[row] - offset
+            if sender is None:
+                painter.setFont(italic)
+                painter.setPen(QColor(NOTE_COLOR))
+                painter.drawStaticText(QPointF(self.MARGIN, y), self._static_text(row, text, width, italic))
+            else:
+                painter.setFont(bold)
+                painter.setPen(QColor(SENDER_COLORS.get(sender, DEFAULT_SENDER_COLOR)))
+                painter.drawText(QRect(self.MARGIN, y, width, header), 0, f"{sender}:")
+                painter.setFont(self.font())
+                painter.setPen(text_color)
+                painter.drawStaticText(QPointF(self.MARGIN, y + header), self._static_text(row, text, width, self.font()))
+            row += 1
+        painter.end()
+
+def benchmark(messages=10000, checkpoints=(100, 1000, 5000, 10000), window=50, deltas=50):
+    # Latency of one append, including the repaint, as the log grows; then, with the log full, a
+    # streamed reply of `deltas` chunks and a window resize. QTextEdit (the old chat pane) for comparison.
+    import sys
+    from PyQt6.QtWidgets import QTextEdit
+    from PyQt6.QtGui import QTextCursor
+    app = QApplication.instance() or QApplication(sys.argv)
+    text = "This is message number {} in a long conversation, long enough to wrap onto a second line or so."
+
+    def run(label, widget, append, begin_stream, stream):
+        widget.resize(800, 600)
+        widget.show()
+        samples = []
+        for n in range(1, messages + 1):
+            start = time.perf_counter()
+            append(n)
+            app.processEvents()
+            samples.append((time.perf_counter() - start) * 1000)
+            if n in checkpoints:
+                recent = sorted(samples[-window:])
+                print(f"{label:<10} {n:>6} messages: append + repaint median {recent[len(recent) // 2]:6.2f} ms, "
+                      f"max {recent[-1]:6.2f} ms")
+        begin_stream()
+        start = time.perf_counter()
+        for i in range(deltas):
+            stream(f"word{i} ")
+            app.processEvents()
+        print(f"{label:<10} streamed reply of {deltas} deltas: {(time.perf_counter() - start) * 1000:7.1f} ms")
+        start = time.perf_counter()
+        widget.resize(700, 600)
+        app.processEvents()
+        if getattr(widget, "relayout_timer", None) is not None and widget.relayout_timer.isActive():
+            widget._relayout()
+        print(f"{label:<10} resize with {messages} messages: {(time.perf_counter() - start) * 1000:7.1f} ms")
+        widget.hide()
+
+    model = ChatModel()
+    view = ChatView()
+    view.setModel(model)
+    streamed = []
+    run("ChatView", view,
+        lambda n: model.append_message("Iris" if n % 2 else "You", text.format(n)),
+        lambda: streamed.append(model.append_message("Iris", "")),
+        lambda delta: model.append_text(streamed[0], delta))
+
+    edit = QTextEdit()
+    edit.setReadOnly(True)
+
+    def append_html(n):
+        edit.append(f'<p style="margin-bottom: 10px;"><span style="color: #6495ED; font-weight: bold;">Iris:</span> '
+                    f'{text.format(n)}</p>')
+        edit.verticalScrollBar().setValue(edit.verticalScrollBar().maximum())
+
+    def insert_text(delta):
+        cursor = QTextCursor(edit.document())
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(delta)
+        edit.verticalScrollBar().setValue(edit.verticalScrollBar().maximum())
+
+    run("QTextEdit", edit, append_html, lambda: append_html(0), insert_text)
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,145 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+# Offline stand-in for the Groq client: answers every request with a canned reply,
+# emitted in small chunks on a timer when stream=True. Enable it with IRIS_FAKE_LLM=1.
+DEFAULT_REPLY = ("Hello! I'm Iris, running against a local fake model. "
+                 "Streaming lets you read this sentence while the next one is still arriving. "
+                 "Ask me anything you like.")
+
+class FakeCompletions:
+    def __init__(self, reply, chunk_size, delay, first_token_delay):
+        self.reply = reply
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.first_token_delay = first_token_delay
+        self.calls = []
+
+    def create(self, model, messages, stream=False, **kwargs):
+        self.calls.append({"model": model, "messages": messages, "stream": stream, **kwargs})
+        reply = self.reply(messages) if callable(self.reply) else self.reply
+        if stream:
+            return self._stream(reply)
+        # A full completion costs roughly as long as streaming all of it
+        time.sleep(self.first_token_delay + self.delay * (len(reply) // self.chunk_size))
+        message = SimpleNamespace(role="assistant", content=reply)
+        return SimpleNamespace(choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")])
+
+    def _stream(self, reply):
+        time.sleep(self.first_token_delay)
+        for i in range(0, len(reply), self.chunk_size):
+            delta = SimpleNamespace(role="assistant", content=reply[i:i + self.chunk_size])
+            yield SimpleNamespace(choices=[SimpleNamespace(index=0, delta=delta, finish_reason=None)])
+            time.sleep(self.delay)
+        delta = SimpleNamespace(role=None, content=None)
+        yield SimpleNamespace(choices=[SimpleNamespace(index=0, delta=delta, finish_reason="stop")])
+
+class FakeGroq:
+    def __init__(self, reply=DEFAULT_REPLY, chunk_size=8, delay=0.02, first_token_delay=0.2):
+        self.chat = SimpleNamespace(completions=FakeCompletions(reply, chunk_size, delay, first_token_delay))
+
+class FakeAPIServer(ThreadingHTTPServer):
+    # Local stand-in for Groq's OpenAI-compatible HTTP API (POST .../chat/completions), for exercising
+    # gateway.LLMGateway. `failures` is a list of status codes returned, in order, before succeeding;
+    # `drops` a list of chunk counts after which streamed replies, in order, hang up midway.
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address=("127.0.0.1", 0), reply=DEFAULT_REPLY, latency=0.05, chunk_size=8,
+                 chunk_delay=0.01, failures=None, drops=None):
+        super().__init__(address, FakeAPIHandler)
+        self.reply = reply
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.failures = list(failures or [])
+        self.drops = list(drops or [])
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/openai/v1"
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name="fake-llm-api", daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address):
+        # Hedged or cancelled requests hang up early; that is expected, not an error
+        import sys
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection pooling is observable
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with server.lock:
+            server.requests += 1
+            status = server.failures.pop(0) if server.failures else 200
+        latency = server.latency() if callable(server.latency) else server.latency
+        time.sleep(latency)
+
+        if not self.path.endswith("/chat/completions"):
+            return self._send_json(404, {"error": {"message": "not found"}})
+        if status != 200:
+            return self._send_json(status, {"error": {"message": f"injected {status}"}})
+
+        reply = server.reply(body.get("messages", [])) if callable(server.reply) else server.reply
+        if not body.get("stream"):
+            return self._send_json(200, {
+                "id": "fake",
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+            })
+
+        with server.lock:
+            drop_after = server.drops.pop(0) if server.drops else None
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for n, i in enumerate(range(0, len(reply), server.chunk_size)):
+            if n == drop_after:
+                self.close_connection = True  # no terminating chunk: the client sees a broken stream
+                return
+            chunk = {"choices": [{"index": 0, "delta": {"content": reply[i:i + server.chunk_size]}, "finish_reason": None}]}
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n")
+            time.sleep(server.chunk_delay)
+        self._write_chunk("data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+if __name__ == "__main__":
+    import sys
+    server = FakeAPIServer(("127.0.0.1", int(sys.argv[1]) if len(sys.argv) > 1 else 8765))
+    print(f"Fake LLM API on {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,270 @@
+import asyncio
+import json
+import random
+import time
+from collections import deque
+import httpx
+import api
+
+GROQ_BASE_URL = "https://api.groq.com/openai/v1"
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+class GatewayError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+class CircuitOpen(GatewayError):
+    pass
+
+class LatencyHistogram:
+    BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+
+    def __init__(self, window=1000):
+        self.counts = [0] * len(self.BUCKETS_MS)
+        self.samples = deque(maxlen=window)  # recent samples, for percentiles
+
+    def record(self, ms):
+        for i, bound in enumerate(self.BUCKETS_MS):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+        self.samples.append(ms)
+
+    def percentile(self, p):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def snapshot(self):
+        return {
+            "count": sum(self.counts),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "buckets": {f"<={bound}": count for bound, count in zip(self.BUCKETS_MS, self.counts)},
+        }
+
+class CircuitBreaker:
+    # Opens after `failure_threshold` consecutive failures; after `reset_timeout` seconds lets one
+    # trial request through (half-open) and closes again if it succeeds
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.failures >= self.failure_threshold or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        # The trial request ended without an outcome (closed or cancelled by its caller): let the
+        # next request be the trial instead
+        self.trial_in_flight = False
+
+class LLMGateway:
+    # Async client for Groq's OpenAI-compatible chat API: pooled keep-alive connections, retries with
+    # jittered exponential backoff on 429/5xx and transport errors, optional hedging, circuit breaker
+    def __init__(self, api_key=None, base_url=GROQ_BASE_URL, model=None, timeout=30.0, max_retries=3,
+                 backoff_base=0.5, backoff_max=8.0, hedge_percentile=None, hedge_min_samples=20,
+                 max_connections=20, max_keepalive=10, breaker=None, transport=None):
+        self.model = model or api.MODEL
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyHistogram()
+        self.first_token_latency = LatencyHistogram()
+        self.retries = self.hedges = self.hedge_wins = 0
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Authorization": f"Bearer {api_key or api.API_KEY}"},
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+            transport=transport,
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    def payload(self, messages, stream=False, **params):
+        return {"model": self.model, "messages": messages, "stream": stream, **params}
+
+    async def chat(self, messages, **params):
+        data = await self._hedged(self.payload(messages, **params))
+        try:
+            return data["choices"][0]["message"]["content"].strip()
+        except (KeyError, IndexError, TypeError) as e:
+            raise GatewayError(f"Malformed response: {str(e)}")
+
+    async def stream_chat(self, messages, **params):
+        # Retries only happen before the first delta is yielded; a stream broken after that is an
+        # error, since retrying would hand the consumer the start of the reply a second time
+        payload = self.payload(messages, stream=True, **params)
+        for attempt in range(self.max_retries + 1):
+            trial = self._check_breaker()
+            start = time.perf_counter()
+            retry_after = None
+            first = True
+            try:
+                async with self.client.stream("POST", "/chat/completions", json=payload) as response:
+                    if response.status_code == 200:
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            data = line[5:].strip()
+                            if data == "[DONE]":
+                                break
+                            choices = json.loads(data).get("choices") or []
+                            delta = choices[0].get("delta", {}).get("content") if choices else None
+                            if delta:
+                                if first:
+                                    self.first_token_latency.record((time.perf_counter() - start) * 1000)
+                                    first = False
+                                yield delta
+                        self.breaker.record_success()
+                        self.latency.record((time.perf_counter() - start) * 1000)
+                        return
+                    await response.aread()
+                    error = self._status_error(response)
+                    retry_after = self._retry_after(response)
+            except httpx.TransportError as e:
+                if not first:
+                    self.breaker.record_failure()
+                    raise GatewayError(f"Stream broken after the reply started: {str(e)}")
+                error = GatewayError(f"Transport error: {str(e)}")
+            finally:
+                if trial:
+                    self.breaker.release_trial()
+            self.breaker.record_failure()
+            await self._backoff_or_raise(attempt, error, retry_after)
+
+    async def _hedged(self, payload):
+        # Fire a duplicate request if the first is slower than the recent latency percentile
+        delay = None
+        if self.hedge_percentile is not None and len(self.latency.samples) >= self.hedge_min_samples:
+            delay = self.latency.percentile(self.hedge_percentile) / 1000
+        primary = asyncio.ensure_future(self._with_retries(payload))
+        if delay is None:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        self.hedges += 1
+        backup = asyncio.ensure_future(self._with_retries(payload))
+        pending = {primary, backup}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is backup:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _with_retries(self, payload):
+        for attempt in range(self.max_retries + 1):
+            trial = self._check_breaker()
+            start = time.perf_counter()
+            retry_after = None
+            try:
+                response = await self.client.post("/chat/completions", json=payload)
+            except httpx.TransportError as e:
+                error = GatewayError(f"Transport error: {str(e)}")
+            except BaseException:
+                # Cancelled, e.g. the losing side of a hedge
+                if trial:
+                    self.breaker.release_trial()
+                raise
+            else:
+                if response.status_code == 200:
+                    self.breaker.record_success()
+                    self.latency.record((time.perf_counter() - start) * 1000)
+                    return response.json()
+                error = self._status_error(response)
+                retry_after = self._retry_after(response)
+            self.breaker.record_failure()
+            await self._backoff_or_raise(attempt, error, retry_after)
+
+    def _check_breaker(self):
+        # Returns whether this request is the half-open trial
+        trial = self.breaker.state == "half_open"
+        if not self.breaker.allow():
+            raise CircuitOpen("LLM API circuit is open after repeated failures")
+        return trial
+
+    def _status_error(self, response):
+        error = GatewayError(f"API returned {response.status_code}", status=response.status_code)
+        if response.status_code not in RETRYABLE_STATUS:
+            # Client errors are our fault, not the service's: don't retry or trip the breaker
+            self.breaker.record_success()
+            raise error
+        return error
+
+    def _retry_after(self, response):
+        try:
+            return float(response.headers.get("Retry-After", ""))
+        except ValueError:
+            return None
+
+    async def _backoff_or_raise(self, attempt, error, retry_after=None):
+        if attempt >= self.max_retries:
+            raise error
+        self.retries += 1
+        # Full jitter, but never sooner than the server asked for
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        await asyncio.sleep(delay)
+
+    def stats(self):
+        return {
+            "latency_ms": self.latency.snapshot(),
+            "first_token_ms": self.first_token_latency.snapshot(),
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "circuit": self.breaker.state,
+        }
@@ -1,112 +1,302 @@
+import os
 import sys
-import spacy
+from startup import StartupTimer, STARTUP_BUDGET_MS
+startup_timer = StartupTimer()
+import time
 import threading
+import uuid
 from PyQt6.QtWidgets import QApplication
-from PyQt6.QtCore import QObject, pyqtSignal, QThread, QTimer
+from PyQt6.QtCore import Qt, QObject, pyqtSignal, QThread, QTimer, QEvent
 from ui import ChatUI
 import api
 import nlp
+from analysis import AnalysisPipeline
+from memory import ConversationMemory
+from retrieval import ConversationArchive
+from store import ConversationStore
 from speech import SpeechHandler
+import tracing
+from tracing import tracer
+from workers import WorkerPool, PoolBusy, JobCancelled
+startup_timer.mark("imports")
 
 class ChatController(QObject):
     update_chat = pyqtSignal(str, str)
-    update_voice_input = pyqtSignal(str)
+    update_voice_partial = pyqtSignal(str)
+    voice_input_done = pyqtSignal(str, object)
+    hide_voice_input = pyqtSignal()
     show_typing_indicator = pyqtSignal()
     hide_typing_indicator = pyqtSignal()
     show_error = pyqtSignal(str)
     update_analysis = pyqtSignal(dict)
+    begin_stream = pyqtSignal(str)
+    update_stream = pyqtSignal(str)
+    end_stream = pyqtSignal()
+    history_page = pyqtSignal(list, bool)
+    history_touched = pyqtSignal(str, str)
+    conversation_loaded = pyqtSignal(str, list, object)
 
     def __init__(self):
         super().__init__()
-        self.nlp_model = spacy.load("en_core_web_sm")
+        self.analysis_pipeline = AnalysisPipeline()
         
         self.chat_ui = ChatUI()
         self.speech_handler = SpeechHandler()
+        # Analysis, LLM calls and voice capture run here instead of on the GUI thread
+        self.workers = WorkerPool(max_workers=3, max_pending=6)
 
         self.setup_connections()
-        self.conversation_history = []
+        self.conversation_history = ConversationMemory(context_budget=nlp.CONTEXT_BUDGET)
+        self.streaming = True  # Show and speak the reply while it is still being generated
+        self.session_id = uuid.uuid4().hex
+        self._archive = None
+        self.archive_lock = threading.Lock()
+        self._store = None
+        self.store_lock = threading.Lock()
+        self.session_saved = False  # whether the current conversation is in the store yet
+        self.history_query = ""
+        self.history_cursor = None
+        self.history_done = False
 
     def setup_connections(self):
-        self.chat_ui.send_button.clicked.connect(self.process_user_input)
+        self.chat_ui.send_button.clicked.connect(lambda: self.process_user_input())
         self.chat_ui.voice_input_button.clicked.connect(self.start_voice_input)
         self.update_chat.connect(self.chat_ui.display_message)
-        self.update_voice_input.connect(self.chat_ui.update_voice_input_text)
+        self.update_voice_partial.connect(self.chat_ui.update_voice_partial_text)
+        self.voice_input_done.connect(self.submit_voice_input)
+        self.hide_voice_input.connect(self.chat_ui.hide_voice_input_modal)
         self.show_typing_indicator.connect(self.chat_ui.show_typing_indicator)
         self.hide_typing_indicator.connect(self.chat_ui.hide_typing_indicator)
         self.show_error.connect(self.chat_ui.show_error_message)
         self.update_analysis.connect(self.chat_ui.update_analysis_display)
+        self.begin_stream.connect(self.chat_ui.begin_streamed_message)
+        self.update_stream.connect(self.chat_ui.append_streamed_text)
+        self.end_stream.connect(self.chat_ui.end_streamed_message)
         self.chat_ui.voice_combo.currentTextChanged.connect(self.change_voice)
         self.chat_ui.clear_history_button.clicked.connect(self.clear_history)
         self.chat_ui.history_list.itemClicked.connect(self.load_history_item)
+        self.chat_ui.history_search.textChanged.connect(self.search_history)
+        self.chat_ui.history_end_reached.connect(self.load_more_history)
+        self.history_page.connect(self.chat_ui.show_history)
+        self.history_touched.connect(self.chat_ui.add_to_history)
+        self.conversation_loaded.connect(self.show_loaded_conversation)
+
+    @property
+    def nlp_model(self):
+        return nlp.resources.get("spacy")
 
     def process_text(self, text):
         try:
-            doc = self.nlp_model(text)
-            entities = [(ent.text, ent.label_) for ent in doc.ents]
+            with tracing.span("spacy.process_text", chars=len(text)) as span:
+                doc = self.nlp_model(text)
+                entities = [(ent.text, ent.label_) for ent in doc.ents]
+                span.set(entities=len(entities))
             return entities
         except Exception as e:
             self.show_error.emit(f"Error processing text: {str(e)}")
             return []
 
-    def process_user_input(self):
+    def process_user_input(self, turn=None):
+        # `turn` is passed in when the message was spoken, so recognition is part of the same trace
         user_input = self.chat_ui.get_user_input()
         if user_input.lower() == 'exit':
             QApplication.quit()
         else:
             self.update_chat.emit("You", user_input)
             self.conversation_history.append({"role": "user", "content": user_input})
-            self.analyze_input(user_input)
-            self.generate_response(user_input)
+            self.save_message("You", user_input)
+            history = self.conversation_history.context_messages()
+            self.show_typing_indicator.emit()
+            # A new message supersedes whatever turn is still being analyzed, streamed or spoken
+            self.speech_handler.stop_speaking()
+            try:
+                self.workers.submit("turn", self.run_turn, user_input, history, turn or tracer.start_turn(),
+                                    on_error=lambda e: self.show_error.emit(f"Error generating response: {str(e)}"))
+            except PoolBusy as e:
+                self.hide_typing_indicator.emit()
+                self.show_error.emit(str(e))
+
+    def run_turn(self, job, user_input, history, turn):
+        try:
+            with tracer.activate(turn):
+                analysis = self.analyze_input(user_input)
+                job.check()
+                self.generate_response(job, user_input, history, analysis.entities if analysis else None)
+        finally:
+            tracer.end_turn(turn, chars=len(user_input), cancelled=job.cancelled)
+            if not job.cancelled:
+                self.hide_typing_indicator.emit()
 
     def analyze_input(self, user_input):
+        # One shared pass: the spaCy entities it returns are reused for the prompt
         try:
-            sentiment = nlp.analyze_sentiment(user_input)
-            keywords = nlp.extract_keywords(user_input)
-            named_entities = nlp.extract_named_entities(user_input)
-            complexity = nlp.analyze_text_complexity(user_input)
-            
-            analysis = {
-                "sentiment": sentiment,
-                "keywords": keywords,
-                "named_entities": named_entities,
-                "complexity": complexity
-            }
-            self.update_analysis.emit(analysis)
+            with tracing.span("analysis") as span:
+                analysis = self.analysis_pipeline.analyze(user_input)
+                span.set(**{f"{stage}_ms": round(ms, 2) for stage, ms in analysis.timings.items()})
+            self.update_analysis.emit(analysis.as_dict())
+            return analysis
         except Exception as e:
             self.show_error.emit(f"Error analyzing input: {str(e)}")
+            return None
 
-    def generate_response(self, user_input):
-        self.show_typing_indicator.emit()
-        
-        def response_thread():
-            try:
-                entities = self.process_text(user_input)
-                response = nlp.generate_response(user_input, entities, self.conversation_history)
-                
-                self.conversation_history.append({"role": "assistant", "content": response})
-                self.update_chat.emit("Iris", response)
-                self.speech_handler.speak(response)
-            except Exception as e:
-                self.show_error.emit(f"Error generating response: {str(e)}")
-            finally:
-                self.hide_typing_indicator.emit()
+    @property
+    def archive(self):
+        # Past exchanges from the conversation store, loaded on first use from a worker rather than
+        # during startup
+        store = self.store
+        with self.archive_lock:
+            if self._archive is None:
+                embed = None
+                if os.environ.get("IRIS_ARCHIVE_EMBEDDINGS"):
+                    from semantic_cache import spacy_embedder
+                    embed = spacy_embedder
+                self._archive = ConversationArchive(store, embed=embed)
+            return self._archive
+
+    @property
+    def store(self):
+        # Every conversation, for the history panel; opening it reads nothing but the schema
+        with self.store_lock:
+            if self._store is None:
+                self._store = ConversationStore()
+            return self._store
+
+    def save_message(self, sender, text):
+        try:
+            self.store.add_message(self.session_id, sender, text)
+        except Exception as e:
+            print(f"Error saving conversation: {str(e)}")
+            return
+        if not self.session_saved:
+            self.session_saved = True
+            self.history_touched.emit(" ".join(text.split())[:40], self.session_id)
+
+    def load_history(self, append=False):
+        # One page of conversations, or of search results, fetched on a worker
+        if append and self.history_done:
+            return
+        query = self.history_query
+        cursor = self.history_cursor if append else None
+
+        def history_job(job):
+            if query:
+                entries = self.store.search(query, limit=100)
+                done = True
+            else:
+                entries = self.store.conversations(limit=50, before=cursor)
+                done = len(entries) < 50
+            job.check()
+            if entries and not query:
+                self.history_cursor = (entries[-1]["updated"], entries[-1]["id"])
+            self.history_done = done
+            self.history_page.emit(entries, append)
+
+        try:
+            self.workers.submit("history", history_job,
+                                on_error=lambda e: self.show_error.emit(f"Error loading history: {str(e)}"))
+        except PoolBusy:
+            pass  # The list is refreshed on the next scroll or keystroke
+
+    def load_more_history(self):
+        self.load_history(append=True)
+
+    def search_history(self, text):
+        self.history_query = text.strip()
+        self.history_done = False
+        self.load_history()
+
+    def recall(self, user_input, history):
+        try:
+            in_prompt = {message["content"] for message in history}
+            with tracing.span("recall"):
+                return self.archive.retrieve(user_input, k=3, exclude=in_prompt)
+        except Exception as e:
+            print(f"Error retrieving past conversations: {str(e)}")
+            return []
+
+    def generate_response(self, job, user_input, history, entities=None):
+        if entities is None:
+            entities = self.process_text(user_input)
+        retrieved = self.recall(user_input, history)
+        job.check()
+        if self.streaming:
+            response = self.stream_response(job, user_input, entities, history, retrieved)
+        else:
+            response = nlp.generate_response(user_input, entities, history, retrieved=retrieved)
+            job.check()
+            self.update_chat.emit("Iris", response)
+            self.speech_handler.speak(response)
+
+        self.conversation_history.append({"role": "assistant", "content": response})
+        self.save_message("Iris", response)
+        try:
+            self.archive.add(user_input, response, session=self.session_id)
+        except Exception as e:
+            print(f"Error archiving conversation: {str(e)}")
 
-        threading.Thread(target=response_thread).start()
+    def stream_response(self, job, user_input, entities, history, retrieved=None):
+        # Append deltas to the chat pane as they arrive and hand each finished sentence to TTS. Time to
+        # the first token and to the first sentence queued for speech go to the tracer (and the
+        # latency panel) as first_token and first_sentence.
+        started = time.perf_counter()
+        started_ns = int(started * 1e9)
+        first_token = first_sentence = False
+        sentences = nlp.SentenceBuffer()
+        parts = []
+        self.begin_stream.emit("Iris")
+        try:
+            for delta in nlp.stream_response(user_input, entities, history, retrieved=retrieved):
+                job.check()
+                if not first_token:
+                    first_token = True
+                    tracer.record("first_token", started_ns)
+                    self.hide_typing_indicator.emit()
+                parts.append(delta)
+                self.update_stream.emit(delta)
+                for sentence in sentences.feed(delta):
+                    if not first_sentence:
+                        first_sentence = True
+                        tracer.record("first_sentence", started_ns)
+                    self.speech_handler.speak(sentence, started)
+            rest = sentences.flush()
+            if rest:
+                if not first_sentence:
+                    tracer.record("first_sentence", started_ns)
+                self.speech_handler.speak(rest, started)
+        finally:
+            self.end_stream.emit()
+        return "".join(parts).strip()
 
     def start_voice_input(self):
-        def voice_input_thread():
+        # Only capture and recognition run on the pool; the widgets are touched on the GUI thread,
+        # through signals from the job
+        def voice_input_job(job):
+            turn = tracer.start_turn("voice")
             try:
-                self.chat_ui.show_voice_input_modal()
-                text = self.speech_handler.listen()
-                self.update_voice_input.emit(text)
-                self.chat_ui.user_input.setText(text)
-                self.process_user_input()  # Automatically process voice input
+                with tracer.activate(turn):
+                    text = self.speech_handler.listen(on_partial=self.update_voice_partial.emit)
+                job.check()
+                self.voice_input_done.emit(text, turn)
+            except JobCancelled:
+                tracer.end_turn(turn, cancelled=True)
+                self.hide_voice_input.emit()
+                raise
             except Exception as e:
+                tracer.end_turn(turn, error=str(e))
+                self.hide_voice_input.emit()
                 self.show_error.emit(f"Error processing voice input: {str(e)}")
-            finally:
-                self.chat_ui.hide_voice_input_modal()
 
-        threading.Thread(target=voice_input_thread).start()
+        self.chat_ui.show_voice_input_modal()
+        try:
+            self.workers.submit("voice", voice_input_job)
+        except PoolBusy as e:
+            self.chat_ui.hide_voice_input_modal()
+            self.show_error.emit(str(e))
+
+    def submit_voice_input(self, text, turn):
+        # Runs on the GUI thread once the transcript is in
+        self.chat_ui.update_voice_input_text(text)
+        self.process_user_input(turn)  # Automatically process voice input
 
     def change_voice(self, voice):
         try:
@@ -115,19 +305,109 @@ class ChatController(QObject):
             self.show_error.emit(f"Error changing voice: {str(e)}")
 
     def clear_history(self):
+        # Starts a new conversation; the cleared one stays in the store and the history list
+        self.workers.cancel("turn")
+        self.speech_handler.stop_speaking()
         self.conversation_history.clear()
         self.chat_ui.conversation.clear()
-        self.chat_ui.history_list.clear()
+        self.session_id = uuid.uuid4().hex
+        self.session_saved = False
 
     def load_history_item(self, item):
-        # Implement logic to load and display the selected history item
-        selected_text = item.text()
-        self.chat_ui.conversation.append(f"<p style='color: #808080;'><i>Loading history: {selected_text}</i></p>")
+        conversation_id = item.data(Qt.ItemDataRole.UserRole)
+        if conversation_id is None:
+            return
+        self.chat_ui.display_note(f"Loading history: {item.text()}")
+
+        def load_job(job):
+            # Reopen the conversation where it left off: the chat pane shows its latest messages
+            # and the prompt memory is rebuilt from them, older turns folded into the summary
+            messages = self.store.messages(conversation_id, limit=500)
+            memory = ConversationMemory(context_budget=nlp.CONTEXT_BUDGET)
+            for message in messages:
+                role = "user" if message["sender"] == "You" else "assistant"
+                memory.append({"role": role, "content": message["text"]})
+                job.check()
+            self.conversation_loaded.emit(conversation_id, messages, memory)
+
+        try:
+            self.workers.submit("history-load", load_job,
+                                on_error=lambda e: self.show_error.emit(f"Error loading conversation: {str(e)}"))
+        except PoolBusy as e:
+            self.show_error.emit(str(e))
+
+    def show_loaded_conversation(self, conversation_id, messages, memory):
+        self.workers.cancel("turn")
+        self.speech_handler.stop_speaking()
+        self.hide_typing_indicator.emit()
+        self.session_id = conversation_id
+        self.session_saved = True
+        self.conversation_history = memory
+        self.chat_ui.show_conversation(messages)
+
+    def show_latency_panel(self, interval_ms=1000):
+        # Live p50/p95/p99 per traced stage, refreshed while the tab is on screen
+        self.chat_ui.add_latency_tab()
+        self.latency_timer = QTimer(self)
+        self.latency_timer.timeout.connect(self.refresh_latency_panel)
+        self.latency_timer.start(interval_ms)
+
+    def refresh_latency_panel(self):
+        if self.chat_ui.latency_tab.isVisible():
+            self.chat_ui.update_latency_display(tracing.format_stats(tracer.stats()))
+
+    def close_store(self):
+        # Commits whatever is still queued
+        if self._store is not None:
+            self._store.close()
+
+class FirstPaintWatcher(QObject):
+    def __init__(self, callback):
+        super().__init__()
+        self.callback = callback
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Type.Paint and self.callback is not None:
+            callback, self.callback = self.callback, None
+            QTimer.singleShot(0, callback)
+        return False
 
 def main():
+    # --fast-start / IRIS_FAST_START=1: skip the background warm-up, load models on first message
+    fast_start = "--fast-start" in sys.argv or bool(os.environ.get("IRIS_FAST_START"))
+    startup_check = "--startup-check" in sys.argv
+    # --latency-panel / IRIS_LATENCY_PANEL=1: a Latency tab next to the analysis tabs
+    latency_panel = "--latency-panel" in sys.argv or bool(os.environ.get("IRIS_LATENCY_PANEL"))
+    budget_ms = int(os.environ.get("IRIS_STARTUP_BUDGET_MS", STARTUP_BUDGET_MS))
+
     app = QApplication(sys.argv)
+    startup_timer.mark("QApplication")
     controller = ChatController()
+    if latency_panel:
+        controller.show_latency_panel()
+    startup_timer.mark("ChatController")
+
+    def on_first_paint():
+        startup_timer.mark("first paint")
+        if startup_check or os.environ.get("IRIS_STARTUP_REPORT"):
+            print(startup_timer.report(budget_ms), flush=True)
+        if startup_check:
+            app.exit(0 if startup_timer.marks[-1][1] <= budget_ms else 1)
+        else:
+            controller.load_history()
+            if not fast_start:
+                # Load spaCy, VADER, the tagger and the NE chunker now that the window is up
+                nlp.resources.warm_up()
+
+    paint_watcher = FirstPaintWatcher(on_first_paint)
+    controller.chat_ui.installEventFilter(paint_watcher)
     controller.chat_ui.show()
+    app.aboutToQuit.connect(controller.workers.shutdown)
+    app.aboutToQuit.connect(controller.speech_handler.shutdown)
+    app.aboutToQuit.connect(controller.close_store)
+    app.aboutToQuit.connect(tracer.flush)
+    if nlp.semantic_cache is not None:
+        app.aboutToQuit.connect(nlp.semantic_cache.save)
     sys.exit(app.exec())
 
 if __name__ == "__main__":
@@ -0,0 +1,96 @@
+import re
+import threading
+from collections import deque
+
+WORD = re.compile(r"\w+|[^\w\s]")
+
+def count_tokens(text):
+    # Close enough to the Llama tokenizer for budgeting: ~1.3 tokens per word, never below chars/4
+    words = len(WORD.findall(text))
+    return max(int(words * 1.3 + 0.5), len(text) // 4) + 4  # + per-message overhead
+
+def fit_to_budget(messages, budget):
+    # Newest messages first until the budget is spent, returned in chronological order
+    kept = []
+    used = 0
+    for message in reversed(messages):
+        tokens = count_tokens(message["content"])
+        if kept and used + tokens > budget:
+            break
+        kept.append(message)
+        used += tokens
+    kept.reverse()
+    return kept
+
+class ConversationMemory:
+    # Recent turns are kept verbatim in a ring buffer sized by a token budget; turns that fall out
+    # of it are condensed into a rolling summary, so memory stays bounded in long sessions
+    def __init__(self, context_budget=1200, summary_budget=300, max_turns=100, summarize=None):
+        # context_budget covers both the summary and the verbatim turns
+        self.context_budget = context_budget
+        self.summary_budget = summary_budget
+        self.turn_budget = max(context_budget - summary_budget, 0)
+        self.summarize = summarize or default_summarize
+        self.turns = deque(maxlen=max_turns)  # (role, content, tokens)
+        self.turn_tokens = 0
+        self.summary = deque()  # (line, tokens)
+        self.summary_tokens = 0
+        self.total_turns = 0
+        self.lock = threading.Lock()
+
+    def append(self, message):
+        tokens = count_tokens(message["content"])
+        with self.lock:
+            if len(self.turns) == self.turns.maxlen:
+                self._fold(*self.turns.popleft())
+            self.turns.append((message["role"], message["content"], tokens))
+            self.turn_tokens += tokens
+            self.total_turns += 1
+            # Always keep the newest turn, even when it alone exceeds the budget
+            while self.turn_tokens > self.turn_budget and len(self.turns) > 1:
+                self._fold(*self.turns.popleft())
+
+    def _fold(self, role, content, tokens):
+        self.turn_tokens -= tokens
+        speaker = "User" if role == "user" else "Iris"
+        line = f"{speaker}: {self.summarize(content)}"
+        line_tokens = count_tokens(line)
+        self.summary.append((line, line_tokens))
+        self.summary_tokens += line_tokens
+        while self.summary_tokens > self.summary_budget and self.summary:
+            _, dropped = self.summary.popleft()
+            self.summary_tokens -= dropped
+
+    def context_messages(self):
+        # Snapshot to send with the next request: summary of older turns, then recent turns verbatim
+        with self.lock:
+            messages = []
+            if self.summary:
+                summary = "\n".join(line for line, _ in self.summary)
+                messages.append({"role": "system", "content": f"Summary of earlier conversation:\n{summary}"})
+            messages.extend({"role": role, "content": content} for role, content, _ in self.turns)
+            return messages
+
+    def context_tokens(self):
+        return self.turn_tokens + self.summary_tokens
+
+    def clear(self):
+        with self.lock:
+            self.turns.clear()
+            self.summary.clear()
+            self.turn_tokens = self.summary_tokens = 0
+            self.total_turns = 0
+
+    def __len__(self):
+        return len(self.turns)
+
+    def __iter__(self):
+        return iter(self.context_messages())
+
+def default_summarize(text):
+    import nlp
+    try:
+        return nlp.summarize_text(text, max_length=120)
+    except Exception:
+        # NLTK data unavailable: fall back to plain truncation
+        return text if len(text) <= 120 else text[:120] + '...'
@@ -1,76 +1,383 @@
-from api import client, MODEL
-import nltk
-from nltk.sentiment import SentimentIntensityAnalyzer
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from nltk.probability import FreqDist
-from nltk.tag import pos_tag
-from nltk.chunk import ne_chunk
-
-# Download necessary NLTK data
-nltk.download('punkt')
-nltk.download('averaged_perceptron_tagger')
-nltk.download('maxent_ne_chunker')
-nltk.download('words')
-nltk.download('stopwords')
-nltk.download('vader_lexicon')
-
-def generate_response(user_input, entities, conversation_history):
+import os
+import re
+import threading
+import time
+from collections import Counter
+import api
+from cache import ResponseCache, cache_key
+from memory import fit_to_budget
+import tracing
+
+# NLTK data each analyzer needs: name -> (download package, path under nltk_data) alternatives,
+# newest NLTK layout first. Presence is checked against the local data directories only.
+NLTK_DATA = {
+    'punkt': [('punkt_tab', 'tokenizers/punkt_tab/english/'), ('punkt', 'tokenizers/punkt')],
+    'averaged_perceptron_tagger': [('averaged_perceptron_tagger_eng', 'taggers/averaged_perceptron_tagger_eng/'),
+                                   ('averaged_perceptron_tagger', 'taggers/averaged_perceptron_tagger')],
+    'maxent_ne_chunker': [('maxent_ne_chunker_tab', 'chunkers/maxent_ne_chunker_tab/english_ace_multiclass/'),
+                          ('maxent_ne_chunker', 'chunkers/maxent_ne_chunker')],
+    'words': [('words', 'corpora/words')],
+    'stopwords': [('stopwords', 'corpora/stopwords')],
+    'vader_lexicon': [('vader_lexicon', 'sentiment/vader_lexicon.zip')],
+}
+
+_nltk_present = set()
+
+def missing_nltk_data(names=None):
+    import nltk
+    missing = []
+    for name in names or NLTK_DATA:
+        if name in _nltk_present:
+            continue
+        for _, path in NLTK_DATA[name]:
+            try:
+                nltk.data.find(path)
+                _nltk_present.add(name)
+                break
+            except LookupError:
+                pass
+        else:
+            missing.append(name)
+    return missing
+
+def ensure_nltk_data(*names, download=None):
+    # Never touches the network unless asked to (download=True or IRIS_NLTK_DOWNLOAD=1)
+    missing = missing_nltk_data(names)
+    if not missing:
+        return
+    if download is None:
+        download = bool(os.environ.get("IRIS_NLTK_DOWNLOAD"))
+    if not download:
+        raise Exception(f"Missing NLTK data: {', '.join(missing)}. Run 'python nlp.py --download' once to fetch it.")
+
+    import nltk
+    for name in missing:
+        for package, _ in NLTK_DATA[name]:
+            if nltk.download(package, quiet=True):
+                break
+    still_missing = missing_nltk_data(missing)
+    if still_missing:
+        raise Exception(f"Could not download NLTK data: {', '.join(still_missing)}")
+
+class ResourceRegistry:
+    # Loads each model/lexicon once, on first use, and shares it across threads
+    def __init__(self):
+        self.loaders = {}
+        self.values = {}
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def register(self, name, loader):
+        self.loaders[name] = loader
+
+    def get(self, name):
+        try:
+            return self.values[name]
+        except KeyError:
+            pass
+        with self.lock:
+            lock = self.locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self.values:
+                try:
+                    self.values[name] = self.loaders[name]()
+                except Exception as e:
+                    raise Exception(f"Error loading {name}: {str(e)}")
+        return self.values[name]
+
+    def is_loaded(self, name):
+        return name in self.values
+
+    def warm_up(self, names=None, background=True):
+        # Load everything ahead of the first message; failures are left for get() to report later
+        def load_all():
+            for name in names or list(self.loaders):
+                try:
+                    self.get(name)
+                except Exception as e:
+                    print(f"Warm-up skipped {name}: {str(e)}")
+
+        if not background:
+            load_all()
+            return None
+        thread = threading.Thread(target=load_all, name="iris-warmup", daemon=True)
+        thread.start()
+        return thread
+
+def _load_vader():
+    ensure_nltk_data('vader_lexicon')
+    from nltk.sentiment import SentimentIntensityAnalyzer
+    return SentimentIntensityAnalyzer()
+
+def _load_stopwords():
+    ensure_nltk_data('stopwords')
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words('english'))
+
+def _load_pos_tagger():
+    ensure_nltk_data('averaged_perceptron_tagger')
+    from nltk.tag import PerceptronTagger
+    return PerceptronTagger()
+
+def _load_ne_chunker():
+    ensure_nltk_data('maxent_ne_chunker', 'words')
+    try:
+        # NLTK >= 3.9 builds the chunker from JSON parameters on every ne_chunk call
+        from nltk.chunk import ne_chunker
+        return ne_chunker()
+    except ImportError:
+        import nltk
+        return nltk.data.load('chunkers/maxent_ne_chunker/english_ace_multiclass.pickle')
+
+def _load_tokenizers():
+    ensure_nltk_data('punkt')
+    from nltk.tokenize import word_tokenize, sent_tokenize
+    return word_tokenize, sent_tokenize
+
+def _load_spacy_model():
+    import spacy
+    return spacy.load("en_core_web_sm")
+
+resources = ResourceRegistry()
+resources.register("tokenizers", _load_tokenizers)
+resources.register("vader", _load_vader)
+resources.register("stopwords", _load_stopwords)
+resources.register("pos_tagger", _load_pos_tagger)
+resources.register("ne_chunker", _load_ne_chunker)
+resources.register("spacy", _load_spacy_model)
+
+def tokenize_words(text):
+    return resources.get("tokenizers")[0](text)
+
+def tokenize_sentences(text):
+    return resources.get("tokenizers")[1](text)
+
+def pos_tag_words(words):
+    return resources.get("pos_tagger").tag(words)
+
+# Prompt tokens allowed for conversation history
+CONTEXT_BUDGET = 1200
+
+# Sampling temperature for replies (IRIS_TEMPERATURE); at 0 replies are deterministic and cached
+TEMPERATURE = float(os.environ.get("IRIS_TEMPERATURE", 0.7))
+
+# Exact-match cache for repeated prompts; IRIS_RESPONSE_CACHE_DB adds a persistent SQLite tier.
+# Sampled replies (temperature > 0) are only cached with IRIS_RESPONSE_CACHE=sampled, which
+# trades reply variety for repeated questions being answered instantly.
+response_cache = ResponseCache(db_path=os.environ.get("IRIS_RESPONSE_CACHE_DB"),
+                               cache_sampled=os.environ.get("IRIS_RESPONSE_CACHE") == "sampled")
+response_cache.enabled = os.environ.get("IRIS_RESPONSE_CACHE") != "off"
+
+# Near-duplicate question cache over local embeddings, off unless IRIS_SEMANTIC_CACHE is set
+# (to a file path for persistence, or to 1 for memory only). Questions are matched within the same
+# preceding turn only, so a follow-up never gets another conversation's answer.
+semantic_cache = None
+if os.environ.get("IRIS_SEMANTIC_CACHE"):
+    from semantic_cache import SemanticCache
+    _semantic_path = os.environ["IRIS_SEMANTIC_CACHE"]
+    semantic_cache = SemanticCache(
+        path=None if _semantic_path == "1" else _semantic_path,
+        threshold=float(os.environ.get("IRIS_SEMANTIC_THRESHOLD", 0.92)),
+    )
+
+# Sentence ends: terminal punctuation (optionally closed by a quote/bracket) followed by whitespace
+SENTENCE_END = re.compile(r'(?<=[.!?])["\')\]]*\s+')
+# A period after one of these, or after an initial, does not end the sentence ("Dr. Smith", "e.g. this")
+ABBREVIATIONS = frozenset("mr mrs ms dr prof sr jr st mt vs etc e.g i.e approx no nos fig inc ltd co corp dept "
+                          "est jan feb mar apr jun jul aug sep sept oct nov dec".split())
+LAST_WORD = re.compile(r'([\w.]+)\.$')
+
+def build_messages(user_input, entities, conversation_history, retrieved=None):
     # Prepare the messages for the API
     messages = [
         {"role": "system", "content": "You are Iris, an advanced AI assistant. Respond concisely and helpfully."}
     ]
-    messages.extend(conversation_history[-5:])  # Include last 5 messages for context
+    if retrieved:
+        # Relevant exchanges from past conversations, see retrieval.ConversationArchive
+        recalled = "\n\n".join(f"User: {e['question']}\nIris: {e['answer']}" for e in retrieved)
+        messages.append({"role": "system", "content": f"Relevant earlier exchanges:\n{recalled}"})
+    # Include as much recent context as fits the token budget (a ConversationMemory is already trimmed)
+    messages.extend(fit_to_budget(list(conversation_history), CONTEXT_BUDGET))
     messages.append({"role": "user", "content": f"User input: {user_input}\nDetected entities: {entities}"})
+    return messages
+
+def generation_params(temperature=None):
+    return {
+        "temperature": TEMPERATURE if temperature is None else temperature,
+        "max_tokens": 150,
+        "top_p": 1,
+        "frequency_penalty": 0,
+        "presence_penalty": 0,
+    }
+
+def cached_response(user_input, messages, params):
+    with tracing.span("response_cache") as span:
+        key, cached = _cached_response(user_input, messages, params)
+        span.set(hit=cached is not None)
+    return key, cached
+
+def _cached_response(user_input, messages, params):
+    # Exact match on the full request first, then (if enabled) a near-duplicate of the question
+    key = None
+    if response_cache.is_cacheable(params):
+        key = cache_key(messages, api.MODEL, params)
+        cached = response_cache.get(key)
+        if cached is not None:
+            return key, cached
+    if semantic_cache is not None:
+        hit = semantic_cache.lookup(user_input, previous_turn(messages))
+        if hit is not None:
+            return key, hit[0]
+    return key, None
+
+def store_response(key, user_input, text, messages=()):
+    if key is not None:
+        response_cache.put(key, text)
+    if semantic_cache is not None:
+        semantic_cache.add(user_input, text, previous_turn(messages))
+
+def previous_turn(messages):
+    # The last exchange before the new message (its question and Iris's answer), which the meaning of
+    # a follow-up like "and tomorrow?" depends on; "" at the start of a conversation
+    for i in range(len(messages) - 2, -1, -1):
+        if messages[i]["role"] == "assistant":
+            question = messages[i - 1]["content"] if i and messages[i - 1]["role"] == "user" else ""
+            return f"{question}\n{messages[i]['content']}"
+    return ""
+
+def generate_response(user_input, entities, conversation_history, temperature=None, retrieved=None):
+    messages = build_messages(user_input, entities, conversation_history, retrieved)
+    params = generation_params(temperature)
+
+    key, cached = cached_response(user_input, messages, params)
+    if cached is not None:
+        return cached
 
     try:
-        response = client.chat.completions.create(
-            model=MODEL,
-            messages=messages,
-            temperature=0.7,
-            max_tokens=150,
-            top_p=1,
-            frequency_penalty=0,
-            presence_penalty=0
-        )
-        return response.choices[0].message.content.strip()
+        with tracing.span("groq", model=api.MODEL, stream=False) as span:
+            response = api.get_client().chat.completions.create(
+                model=api.MODEL,
+                messages=messages,
+                **params
+            )
+            text = response.choices[0].message.content.strip()
+            span.set(chars=len(text))
     except Exception as e:
         raise Exception(f"Error calling API: {str(e)}")
 
+    store_response(key, user_input, text, messages)
+    return text
+
+def stream_response(user_input, entities, conversation_history, llm_client=None, temperature=None, retrieved=None):
+    # Same request as generate_response, but yields the text deltas as they arrive
+    messages = build_messages(user_input, entities, conversation_history, retrieved)
+    params = generation_params(temperature)
+
+    key, cached = cached_response(user_input, messages, params)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    try:
+        # The span covers the whole stream, including time the consumer spends between deltas
+        with tracing.span("groq", model=api.MODEL, stream=True) as span:
+            stream = (llm_client or api.get_client()).chat.completions.create(
+                model=api.MODEL,
+                messages=messages,
+                stream=True,
+                **params
+            )
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not parts:
+                        span.set(first_token_ms=round((time.perf_counter_ns() - span.start_ns) / 1e6, 1))
+                    parts.append(delta)
+                    yield delta
+            span.set(chars=sum(len(part) for part in parts))
+    except Exception as e:
+        raise Exception(f"Error calling API: {str(e)}")
+
+    # Only complete replies are cached; an abandoned stream never reaches this point
+    if parts:
+        store_response(key, user_input, "".join(parts).strip(), messages)
+
+class SentenceBuffer:
+    # Collects streamed deltas and hands back whole sentences as soon as they are complete
+    def __init__(self):
+        self.buffer = ""
+
+    def feed(self, delta):
+        self.buffer += delta
+        sentences = []
+        start = 0
+        for match in SENTENCE_END.finditer(self.buffer):
+            if not self._ends_sentence(start, match):
+                continue
+            sentence = self.buffer[start:match.end()].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def _ends_sentence(self, start, match):
+        # Text continuing in lowercase never starts a new sentence; a period also needs the word
+        # before it to be more than an abbreviation or an initial
+        following = self.buffer[match.end():match.end() + 1]
+        if following.islower():
+            return False
+        word = LAST_WORD.search(self.buffer, start, match.start())
+        if word is None:
+            return True
+        word = word.group(1).lower()
+        if word.isdigit() and self.buffer[start:match.start()].rsplit("\n", 1)[-1].strip() == word + ".":
+            return False  # a list item's number
+        return not (word in ABBREVIATIONS or (len(word) == 1 and word.isalpha()))
+
+    def flush(self):
+        rest = self.buffer.strip()
+        self.buffer = ""
+        return rest
+
 def analyze_sentiment(text):
     try:
-        sia = SentimentIntensityAnalyzer()
-        sentiment_scores = sia.polarity_scores(text)
-        
-        if sentiment_scores['compound'] > 0.05:
-            return "positive"
-        elif sentiment_scores['compound'] < -0.05:
-            return "negative"
-        else:
-            return "neutral"
+        return sentiment_label(resources.get("vader").polarity_scores(text))
     except Exception as e:
         raise Exception(f"Error analyzing sentiment: {str(e)}")
 
+def sentiment_label(sentiment_scores):
+    if sentiment_scores['compound'] > 0.05:
+        return "positive"
+    elif sentiment_scores['compound'] < -0.05:
+        return "negative"
+    else:
+        return "neutral"
+
 def extract_keywords(text, num_keywords=5):
     try:
-        # Tokenize and remove stopwords
-        stop_words = set(stopwords.words('english'))
-        words = word_tokenize(text.lower())
-        words = [word for word in words if word.isalnum() and word not in stop_words]
-
-        # Get frequency distribution
-        fdist = FreqDist(words)
-
-        # Return top N keywords
-        keywords = [word for word, _ in fdist.most_common(num_keywords)]
-        return keywords
+        return keywords_from_tokens(tokenize_words(text.lower()), num_keywords)
     except Exception as e:
         raise Exception(f"Error extracting keywords: {str(e)}")
 
+def keywords_from_tokens(words, num_keywords=5):
+    # Remove stopwords
+    stop_words = resources.get("stopwords")
+    words = [word for word in (w.lower() for w in words) if word.isalnum() and word not in stop_words]
+
+    # Get frequency distribution
+    fdist = Counter(words)
+
+    # Return top N keywords
+    return [word for word, _ in fdist.most_common(num_keywords)]
+
 def summarize_text(text, max_length=50):
     try:
         # Tokenize sentences
-        sentences = nltk.sent_tokenize(text)
+        sentences = tokenize_sentences(text)
         
         # Get the first two sentences or up to max_length characters
         summary = ' '.join(sentences[:2])
@@ -83,41 +390,52 @@ def summarize_text(text, max_length=50):
 def extract_named_entities(text):
     try:
         # Tokenize and tag parts of speech
-        words = word_tokenize(text)
-        pos_tags = pos_tag(words)
-        
-        # Perform named entity recognition
-        named_entities = ne_chunk(pos_tags)
-        
-        # Extract named entities
-        entities = []
-        for chunk in named_entities:
-            if hasattr(chunk, 'label'):
-                entity = ' '.join(c[0] for c in chunk)
-                entity_type = chunk.label()
-                entities.append((entity, entity_type))
-        
-        return entities
+        words = tokenize_words(text)
+        pos_tags = pos_tag_words(words)
+        return entities_from_pos_tags(pos_tags)
     except Exception as e:
         raise Exception(f"Error extracting named entities: {str(e)}")
 
+def entities_from_pos_tags(pos_tags):
+    # Perform named entity recognition
+    named_entities = resources.get("ne_chunker").parse(pos_tags)
+
+    # Extract named entities
+    entities = []
+    for chunk in named_entities:
+        if hasattr(chunk, 'label'):
+            entity = ' '.join(c[0] for c in chunk)
+            entity_type = chunk.label()
+            entities.append((entity, entity_type))
+
+    return entities
+
 def analyze_text_complexity(text):
     try:
-        words = word_tokenize(text)
-        sentences = nltk.sent_tokenize(text)
-        
-        # Calculate average word length
-        avg_word_length = sum(len(word) for word in words) / len(words)
-        
-        # Calculate average sentence length
-        avg_sentence_length = len(words) / len(sentences)
-        
-        # Determine complexity based on these metrics
-        if avg_word_length > 5 and avg_sentence_length > 20:
-            return "High"
-        elif avg_word_length > 4 and avg_sentence_length > 15:
-            return "Medium"
-        else:
-            return "Low"
+        words = tokenize_words(text)
+        sentences = tokenize_sentences(text)
+        return complexity_from_tokens(words, sentences)
     except Exception as e:
-        raise Exception(f"Error analyzing text complexity: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Error analyzing text complexity: {str(e)}")
+
+def complexity_from_tokens(words, sentences):
+    # Calculate average word length
+    avg_word_length = sum(len(word) for word in words) / len(words)
+
+    # Calculate average sentence length
+    avg_sentence_length = len(words) / len(sentences)
+
+    # Determine complexity based on these metrics
+    if avg_word_length > 5 and avg_sentence_length > 20:
+        return "High"
+    elif avg_word_length > 4 and avg_sentence_length > 15:
+        return "Medium"
+    else:
+        return "Low"
+
+if __name__ == "__main__":
+    import sys
+    if "--download" in sys.argv:
+        ensure_nltk_data(*NLTK_DATA, download=True)
+    missing = missing_nltk_data()
+    print(f"Missing NLTK data: {', '.join(missing)}" if missing else "All NLTK data present")
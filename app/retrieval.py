@@ -0,0 +1,132 @@
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+
+WORD = re.compile(r"[a-z0-9]+")
+FALLBACK_STOPWORDS = frozenset(
+    "a an and are as at be but by do does for from how i in is it me my of on or so that the this to "
+    "was what when where which who why with you your".split()
+)
+
+def index_terms(text, num_keywords=10):
+    import nlp
+    try:
+        return nlp.extract_keywords(text, num_keywords)
+    except Exception:
+        # NLTK data unavailable: plain lowercase words minus a small stopword list
+        words = [w for w in WORD.findall(text.lower()) if w not in FALLBACK_STOPWORDS]
+        return list(dict.fromkeys(words))[:num_keywords]
+
+class ConversationArchive:
+    # Past exchanges (a user message and Iris' reply) from the ConversationStore, with an inverted
+    # keyword index and an optional embedding index that are both updated incrementally per exchange.
+    # Each exchange's keywords and embedding are saved with it in the store, so loading the archive
+    # never re-runs keyword extraction or the embedder over the history.
+    def __init__(self, store, embed=None, terms=index_terms):
+        self.store = store
+        self.embed = embed
+        self.terms = terms
+        self.exchanges = []
+        self.postings = defaultdict(set)  # term -> exchange ids
+        self.vectors = None
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        import numpy as np
+        for row_id, question, answer, session, timestamp, terms, vector in self.store.exchanges():
+            exchange = {"question": question, "answer": answer, "session": session, "time": timestamp,
+                        "terms": terms}
+            if self.embed is not None:
+                if vector is None:
+                    # Archived before embeddings were turned on: embed it once and keep the result
+                    vector = self._embed(question)
+                    self.store.set_exchange_vector(row_id, vector.tobytes())
+                else:
+                    vector = np.frombuffer(vector, dtype=np.float32)
+            self._index(exchange, vector)
+
+    def add(self, question, answer, session=None):
+        exchange = {
+            "question": question,
+            "answer": answer,
+            "session": session,
+            "time": time.time(),
+            "terms": self.terms(question + " " + answer),
+        }
+        vector = self._embed(question) if self.embed is not None else None
+        with self.lock:
+            self._index(exchange, vector)
+        # Queued behind the messages themselves; the store links it to them when it writes
+        self.store.add_exchange(session, exchange["terms"], vector.tobytes() if vector is not None else None)
+        return exchange
+
+    def _embed(self, text):
+        import numpy as np
+        vector = np.asarray(self.embed(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _index(self, exchange, vector=None):
+        exchange_id = len(self.exchanges)
+        exchange["id"] = exchange_id
+        self.exchanges.append(exchange)
+        for term in exchange["terms"]:
+            self.postings[term].add(exchange_id)
+        if vector is not None:
+            self._add_vector(exchange_id, vector)
+
+    def _add_vector(self, exchange_id, vector):
+        import numpy as np
+        if self.vectors is None:
+            self.vectors = np.zeros((max(64, exchange_id + 1), vector.shape[0]), dtype=np.float32)
+        elif exchange_id >= self.vectors.shape[0]:
+            # Grow geometrically so appends stay amortized O(1)
+            grown = np.zeros((self.vectors.shape[0] * 2, self.vectors.shape[1]), dtype=np.float32)
+            grown[:exchange_id] = self.vectors[:exchange_id]
+            self.vectors = grown
+        self.vectors[exchange_id] = vector
+
+    def retrieve(self, query, k=3, exclude=(), min_score=0.1):
+        # Top-k past exchanges by idf-weighted keyword overlap, blended with cosine similarity when
+        # an embedder is configured. `exclude` holds question texts already in the prompt.
+        query_terms = self.terms(query)
+        with self.lock:
+            total = len(self.exchanges)
+            if not total:
+                return []
+            scores = defaultdict(float)
+            for term in query_terms:
+                ids = self.postings.get(term)
+                if ids:
+                    idf = math.log(1 + total / len(ids))
+                    for exchange_id in ids:
+                        scores[exchange_id] += idf
+            if scores:
+                top = max(scores.values())
+                for exchange_id in scores:
+                    scores[exchange_id] /= top
+
+            if self.embed is not None and self.vectors is not None:
+                import numpy as np
+                vector = np.asarray(self.embed(query), dtype=np.float32)
+                norm = np.linalg.norm(vector)
+                if norm:
+                    similarities = self.vectors[:total] @ (vector / norm)
+                    for exchange_id in np.argpartition(-similarities, min(k * 4, total) - 1)[:k * 4]:
+                        scores[int(exchange_id)] += float(similarities[exchange_id])
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            results = []
+            for exchange_id, score in ranked:
+                if score < min_score or len(results) == k:
+                    break
+                exchange = self.exchanges[exchange_id]
+                if exchange["question"] not in exclude:
+                    results.append(exchange)
+            return results
+
+    def __len__(self):
+        return len(self.exchanges)
@@ -0,0 +1,164 @@
+import json
+import os
+import re
+import threading
+import time
+import zlib
+import numpy as np
+
+TOKEN = re.compile(r"[a-z0-9']+")
+
+def spacy_embedder(text):
+    import nlp
+    return nlp.resources.get("spacy")(text).vector
+
+class HashingEmbedder:
+    # Dependency-free fallback: signed hashed bag of words and word bigrams
+    def __init__(self, dim=256):
+        self.dim = dim
+
+    def __call__(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        words = TOKEN.findall(text.lower())
+        for feature in words + [a + " " + b for a, b in zip(words, words[1:])]:
+            h = zlib.crc32(feature.encode("utf-8"))
+            vector[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        return vector
+
+def context_id(context):
+    # Fingerprint of the conversation a question was asked in (nlp.previous_turn); 0 for none
+    context = " ".join((context or "").lower().split())
+    return zlib.crc32(context.encode("utf-8")) if context else 0
+
+class SemanticCache:
+    # Answers near-duplicate questions from earlier replies. Embeddings are kept L2-normalized in one
+    # (capacity, dim) float32 matrix, so a lookup is a single matrix-vector product. With a path the
+    # matrix lives in a memory-mapped .npy file and the answers in a JSON sidecar.
+    # A question only matches one asked after the same preceding turn (`context`): "and tomorrow?"
+    # means something different in every conversation.
+    def __init__(self, embed=None, capacity=10000, threshold=0.92, path=None):
+        self.embed = embed or spacy_embedder
+        self.capacity = capacity
+        self.threshold = threshold
+        self.path = path
+        self.lock = threading.Lock()
+        self.vectors = None
+        self.questions = []
+        self.answers = []
+        self.last_used = np.zeros(capacity, dtype=np.float64)
+        self.contexts = np.zeros(capacity, dtype=np.int64)
+        self.size = 0
+        self.hits = self.misses = 0
+        if path and os.path.exists(path + ".json"):
+            self.load()
+
+    def _embed(self, text):
+        vector = np.asarray(self.embed(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _ensure_storage(self, dim):
+        if self.vectors is not None:
+            return
+        if self.path:
+            self.vectors = np.lib.format.open_memmap(self.path + ".npy", mode="w+", dtype=np.float32,
+                                                     shape=(self.capacity, dim))
+        else:
+            self.vectors = np.zeros((self.capacity, dim), dtype=np.float32)
+
+    def lookup(self, text, context=""):
+        # Returns (answer, similarity) for the closest cached question above the threshold, else None
+        vector = self._embed(text)
+        with self.lock:
+            if self.size == 0 or not vector.any():
+                self.misses += 1
+                return None
+            similarities = self.vectors[:self.size] @ vector
+            similarities[self.contexts[:self.size] != context_id(context)] = -np.inf
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.last_used[best] = time.time()
+            self.hits += 1
+            return self.answers[best], float(similarities[best])
+
+    def add(self, question, answer, context=""):
+        vector = self._embed(question)
+        if not vector.any():
+            return
+        with self.lock:
+            self._ensure_storage(vector.shape[0])
+            if self.size < self.capacity:
+                slot = self.size
+                self.size += 1
+                self.questions.append(question)
+                self.answers.append(answer)
+            else:
+                # Evict the least recently used entry
+                slot = int(np.argmin(self.last_used[:self.size]))
+                self.questions[slot] = question
+                self.answers[slot] = answer
+            self.vectors[slot] = vector
+            self.last_used[slot] = time.time()
+            self.contexts[slot] = context_id(context)
+
+    def save(self):
+        if not self.path or self.vectors is None:
+            return
+        with self.lock:
+            self.vectors.flush()
+            with open(self.path + ".json", "w", encoding="utf-8") as f:
+                json.dump({
+                    "threshold": self.threshold,
+                    "questions": self.questions,
+                    "answers": self.answers,
+                    "last_used": self.last_used[:self.size].tolist(),
+                    "contexts": self.contexts[:self.size].tolist(),
+                }, f)
+
+    def load(self):
+        with open(self.path + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+        vectors = np.load(self.path + ".npy", mmap_mode="r+")
+        size = min(len(meta["questions"]), vectors.shape[0], self.capacity)
+        if vectors.shape[0] != self.capacity:
+            # Capacity changed since the file was written: copy into a freshly sized map
+            old = np.array(vectors[:size])
+            del vectors
+            vectors = np.lib.format.open_memmap(self.path + ".npy", mode="w+", dtype=np.float32,
+                                                shape=(self.capacity, old.shape[1]))
+            vectors[:size] = old
+        self.vectors = vectors
+        self.questions = meta["questions"][:size]
+        self.answers = meta["answers"][:size]
+        self.last_used[:size] = meta["last_used"][:size]
+        self.contexts[:size] = meta.get("contexts", [0] * size)[:size]
+        self.size = size
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "entries": self.size,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+def benchmark(sizes=(10000, 100000), dim=96, lookups=200):
+    # Lookup latency over random unit vectors (spaCy's en_core_web_sm vectors are 96-d)
+    rng = np.random.default_rng(0)
+    for size in sizes:
+        queries = rng.standard_normal((lookups, dim)).astype(np.float32)
+        cache = SemanticCache(embed=lambda i: queries[i], capacity=size)
+        cache._ensure_storage(dim)
+        vectors = rng.standard_normal((size, dim)).astype(np.float32)
+        cache.vectors[:] = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+        cache.questions = [""] * size
+        cache.answers = [""] * size
+        cache.size = size
+
+        start = time.perf_counter()
+        for i in range(lookups):
+            cache.lookup(i)
+        elapsed = (time.perf_counter() - start) / lookups
+        print(f"{size:>7} entries: {elapsed * 1000:.3f} ms per lookup")
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,361 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict, deque
+import nlp
+from analysis import AnalysisPipeline
+from batching import MicroBatcher
+from gateway import LLMGateway, GatewayError, LatencyHistogram
+from memory import ConversationMemory
+
+# Headless Iris: the same nlp analysis, prompt building, caches and sentence chunking as the
+# PyQt app, served to many sessions over WebSocket.
+#
+# Client -> server: {"type": "message", "text": "..."} | {"type": "reset"}
+# Server -> client: session, analysis, delta, sentence (ready for TTS), done, error
+
+class Session:
+    def __init__(self, session_id):
+        self.id = session_id
+        self.memory = ConversationMemory(context_budget=nlp.CONTEXT_BUDGET)
+        self.last_seen = time.monotonic()
+        self.connections = 0
+
+class FairScheduler:
+    # Round-robin across sessions: each session's jobs run one at a time and in order, and at most
+    # `max_concurrent` jobs run overall, so one chatty session cannot starve the others
+    def __init__(self, max_concurrent=32, max_queued_per_session=4):
+        self.max_concurrent = max_concurrent
+        self.max_queued_per_session = max_queued_per_session
+        self.queues = {}  # session id -> deque of (job factory, future)
+        self.ready = deque()  # session ids with queued work and nothing running
+        self.running = {}  # session id -> task of its running job
+        self.wakeup = asyncio.Event()
+        self.workers = []
+
+    def start(self):
+        self.workers = [asyncio.ensure_future(self._worker()) for _ in range(self.max_concurrent)]
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+    def submit(self, session_id, job):
+        queue = self.queues.setdefault(session_id, deque())
+        if len(queue) >= self.max_queued_per_session:
+            raise RuntimeError("Too many messages queued for this session, please wait.")
+        future = asyncio.get_running_loop().create_future()
+        queue.append((job, future))
+        if session_id not in self.running and session_id not in self.ready:
+            self.ready.append(session_id)
+            self.wakeup.set()
+        return future
+
+    def cancel_session(self, session_id):
+        # Drops the session's queued jobs and cancels the one running
+        for _, future in self.queues.pop(session_id, ()):
+            future.cancel()
+        if session_id in self.ready:
+            self.ready.remove(session_id)
+        task = self.running.get(session_id)
+        if task is not None:
+            task.cancel()
+
+    async def _worker(self):
+        while True:
+            while not self.ready:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            session_id = self.ready.popleft()
+            queue = self.queues.get(session_id)
+            if not queue:
+                continue
+            job, future = queue.popleft()
+            task = None
+            if not future.cancelled():
+                # Run as its own task so cancel_session can stop it without stopping this worker
+                task = self.running[session_id] = asyncio.ensure_future(job())
+            try:
+                if task is not None:
+                    await asyncio.wait({task})
+            except asyncio.CancelledError:
+                task.cancel()
+                future.cancel()
+                raise
+            finally:
+                self.running.pop(session_id, None)
+                if self.queues.get(session_id):
+                    self.ready.append(session_id)
+                    self.wakeup.set()
+                elif session_id in self.queues:
+                    del self.queues[session_id]
+            if task is None or future.cancelled():
+                continue
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+
+class ChatServer:
+    def __init__(self, gateway, max_sessions=1000, max_concurrent=32, analysis_window_ms=5.0,
+                 analysis_processes=1, analyze=True, session_ttl=1800):
+        self.gateway = gateway
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self.analyze = analyze
+        self.sessions = OrderedDict()
+        self.scheduler = FairScheduler(max_concurrent=max_concurrent)
+        # NLTK/spaCy work is CPU-bound and shares the process-wide nlp.resources models; messages
+        # arriving together from different sessions are analyzed as one batch
+        self.analysis_pipeline = AnalysisPipeline()
+        self.analyzer = MicroBatcher(
+            lambda texts: self.analysis_pipeline.analyze_batch(texts, n_process=analysis_processes),
+            window_ms=analysis_window_ms,
+        )
+        self.turn_latency = LatencyHistogram()
+        self.turns = 0
+
+    def session(self, session_id=None):
+        now = time.monotonic()
+        session = self.sessions.get(session_id) if session_id else None
+        if session is None:
+            self._expire(now)
+            if len(self.sessions) >= self.max_sessions:
+                raise RuntimeError("Server is at its session limit, try again later.")
+            session = Session(session_id or uuid.uuid4().hex)
+            self.sessions[session.id] = session
+        self.sessions.move_to_end(session.id)
+        session.last_seen = now
+        return session
+
+    def _expire(self, now):
+        # Sessions are kept in least-recently-seen order; connected ones never expire, but the idle
+        # sessions after them still can
+        for session in list(self.sessions.values()):
+            if session.connections:
+                continue
+            if now - session.last_seen < self.session_ttl:
+                break
+            self.scheduler.cancel_session(session.id)
+            del self.sessions[session.id]
+
+    async def handle(self, websocket):
+        path = websocket.request.path if websocket.request else ""
+        requested = None
+        if "session=" in path:
+            requested = path.split("session=", 1)[1].split("&", 1)[0]
+        try:
+            session = self.session(requested)
+        except RuntimeError as e:
+            await websocket.send(json.dumps({"type": "error", "message": str(e)}))
+            return
+        session.connections += 1
+        send_lock = asyncio.Lock()
+
+        async def send(event):
+            async with send_lock:
+                await websocket.send(json.dumps(event))
+
+        await send({"type": "session", "id": session.id})
+        try:
+            async for raw in websocket:
+                try:
+                    event = json.loads(raw)
+                except ValueError:
+                    await send({"type": "error", "message": "Messages must be JSON"})
+                    continue
+                if event.get("type") == "reset":
+                    self.scheduler.cancel_session(session.id)
+                    session.memory.clear()
+                    continue
+                text = str(event.get("text", "")).strip()
+                if event.get("type") != "message" or not text:
+                    await send({"type": "error", "message": "Expected {\"type\": \"message\", \"text\": ...}"})
+                    continue
+                try:
+                    future = self.scheduler.submit(session.id, lambda text=text: self.run_turn(session, text, send))
+                except RuntimeError as e:
+                    await send({"type": "error", "message": str(e)})
+                    continue
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        finally:
+            session.connections -= 1
+            session.last_seen = time.monotonic()
+            if not session.connections:
+                # Nobody is left to read the replies: don't spend LLM calls on them
+                self.scheduler.cancel_session(session.id)
+
+    async def run_turn(self, session, text, send):
+        try:
+            await self._turn(session, text, send)
+        except Exception as e:
+            # Report anything unexpected, or the client waits for a done event forever
+            try:
+                await send({"type": "error", "message": f"Error generating response: {str(e)}"})
+            except Exception:
+                pass
+
+    async def _turn(self, session, text, send):
+        started = time.perf_counter()
+        session.memory.append({"role": "user", "content": text})
+        history = session.memory.context_messages()
+
+        entities = []
+        if self.analyze:
+            try:
+                analysis = await asyncio.wrap_future(self.analyzer.submit(text))
+                entities = analysis.entities
+                await send({"type": "analysis", **analysis.as_dict()})
+            except Exception as e:
+                await send({"type": "analysis", "error": str(e)})
+
+        messages = nlp.build_messages(text, entities, history)
+        params = nlp.generation_params()
+        key, cached = nlp.cached_response(text, messages, params)
+        sentences = nlp.SentenceBuffer()
+        parts = []
+        first_token = None
+        try:
+            deltas = self._replay(cached) if cached is not None else self.gateway.stream_chat(messages, **params)
+            async for delta in deltas:
+                if first_token is None:
+                    first_token = (time.perf_counter() - started) * 1000
+                parts.append(delta)
+                await send({"type": "delta", "text": delta})
+                for sentence in sentences.feed(delta):
+                    await send({"type": "sentence", "text": sentence})
+        except GatewayError as e:
+            await send({"type": "error", "message": f"Error calling API: {str(e)}"})
+            return
+        rest = sentences.flush()
+        if rest:
+            await send({"type": "sentence", "text": rest})
+
+        response = "".join(parts).strip()
+        if cached is None:
+            nlp.store_response(key, text, response, messages)
+        session.memory.append({"role": "assistant", "content": response})
+        total = (time.perf_counter() - started) * 1000
+        self.turn_latency.record(total)
+        self.turns += 1
+        await send({"type": "done", "text": response, "first_token_ms": first_token, "total_ms": total})
+
+    async def _replay(self, text):
+        yield text
+
+    def stats(self):
+        return {
+            "sessions": len(self.sessions),
+            "turns": self.turns,
+            "turn_ms": self.turn_latency.snapshot(),
+            "queued": sum(len(q) for q in self.scheduler.queues.values()),
+            "running": len(self.scheduler.running),
+            "analysis_batches": self.analyzer.stats(),
+            "gateway": self.gateway.stats(),
+        }
+
+    def process_request(self, connection, request):
+        # Plain HTTP on the same port: /health and /stats; everything else upgrades to WebSocket
+        if request.path in ("/health", "/stats"):
+            body = {"status": "ok"} if request.path == "/health" else self.stats()
+            response = connection.respond(200, json.dumps(body) + "\n")
+            response.headers["Content-Type"] = "application/json"
+            return response
+        return None
+
+    async def serve(self, host="127.0.0.1", port=8766, ready=None):
+        from websockets.asyncio.server import serve
+        self.scheduler.start()
+        try:
+            async with serve(self.handle, host, port, process_request=self.process_request,
+                             max_size=2 ** 20, ping_interval=20) as server:
+                if ready is not None:
+                    ready.set_result(server)
+                await asyncio.Future()
+        finally:
+            await self.scheduler.stop()
+            self.analyzer.close()
+
+async def benchmark(sessions=200, messages=3, max_concurrent=64):
+    # Many concurrent WebSocket sessions against the local stub LLM API, without NLTK analysis
+    from websockets.asyncio.client import connect
+    from fake_llm import FakeAPIServer
+
+    nlp.response_cache.enabled = False
+    api_server = FakeAPIServer(latency=0.2, chunk_delay=0.005).start()
+    gateway = LLMGateway(api_key="stub", base_url=api_server.base_url, max_connections=max_concurrent,
+                         max_keepalive=max_concurrent)
+    server = ChatServer(gateway, max_concurrent=max_concurrent, analyze=False)
+    ready = asyncio.get_running_loop().create_future()
+    server_task = asyncio.ensure_future(server.serve(port=0, ready=ready))
+    ws_server = await ready
+    port = list(ws_server.sockets)[0].getsockname()[1]
+
+    first_tokens = LatencyHistogram(window=sessions * messages)
+    errors = []
+
+    async def client(i):
+        async with connect(f"ws://127.0.0.1:{port}/", max_size=2 ** 20) as ws:
+            json.loads(await ws.recv())
+            for n in range(messages):
+                sent = time.perf_counter()
+                await ws.send(json.dumps({"type": "message", "text": f"Session {i} message {n}"}))
+                first = None
+                while True:
+                    event = json.loads(await ws.recv())
+                    if event["type"] == "delta" and first is None:
+                        first = (time.perf_counter() - sent) * 1000
+                    if event["type"] == "error":
+                        errors.append(event["message"])
+                        break
+                    if event["type"] == "done":
+                        first_tokens.record(first)
+                        break
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(sessions)))
+    elapsed = time.perf_counter() - start
+    turns = sessions * messages
+    snapshot = first_tokens.snapshot()
+    print(f"{sessions} sessions x {messages} messages: {turns / elapsed:.1f} turns/s, "
+          f"time to first token p50 {snapshot['p50']:.0f} ms, p95 {snapshot['p95']:.0f} ms, "
+          f"p99 {snapshot['p99']:.0f} ms, {len(errors)} errors")
+
+    server_task.cancel()
+    await asyncio.gather(server_task, return_exceptions=True)
+    await gateway.aclose()
+    api_server.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless Iris chat server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--max-sessions", type=int, default=1000)
+    parser.add_argument("--max-concurrent", type=int, default=32, help="LLM calls in flight across all sessions")
+    parser.add_argument("--no-analysis", action="store_true", help="skip NLTK/spaCy input analysis")
+    parser.add_argument("--base-url", default=os.environ.get("IRIS_LLM_BASE_URL"))
+    parser.add_argument("--bench", type=int, metavar="SESSIONS", help="run the concurrency benchmark instead")
+    args = parser.parse_args()
+
+    if args.bench:
+        asyncio.run(benchmark(sessions=args.bench))
+        return
+
+    async def run():
+        kwargs = {"base_url": args.base_url} if args.base_url else {}
+        async with LLMGateway(max_connections=args.max_concurrent, **kwargs) as gateway:
+            server = ChatServer(gateway, max_sessions=args.max_sessions, max_concurrent=args.max_concurrent,
+                                analyze=not args.no_analysis)
+            print(f"Iris server on ws://{args.host}:{args.port}/")
+            await server.serve(args.host, args.port)
+
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    main()
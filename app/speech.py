@@ -1,72 +1,139 @@
-import speech_recognition as sr
-import pyttsx3
+import os
 import threading
-import queue
+import stt
+import tracing
+import tts
+from capture import VoiceCapture, MicrophoneSource, WavFileSource
 
 class SpeechHandler:
     def __init__(self):
-        self.recognizer = sr.Recognizer()
-        self.engine = pyttsx3.init()
-        self.engine.setProperty('rate', 150)
-        self.engine.setProperty('volume', 0.8)
-        self.speech_queue = queue.Queue()
-        self.speech_thread = threading.Thread(target=self._process_speech_queue, daemon=True)
-        self.speech_thread.start()
-        self.is_speaking = False
-
-    def listen(self):
-        with sr.Microphone() as source:
-            print("Listening...")
-            try:
-                self.recognizer.adjust_for_ambient_noise(source, duration=0.5)
-                audio = self.recognizer.listen(source, timeout=5, phrase_time_limit=5)
-                text = self.recognizer.recognize_google(audio)
-                print("You said:", text)
-                return text
-            except sr.UnknownValueError:
-                raise Exception("Sorry, I couldn't understand that.")
-            except sr.RequestError as e:
-                raise Exception(f"Could not request results; {str(e)}")
-
-    def speak(self, text):
-        self.speech_queue.put(text)
-
-    def _process_speech_queue(self):
-        while True:
-            text = self.speech_queue.get()
-            try:
-                self.is_speaking = True
-                self.engine.say(text)
-                self.engine.runAndWait()
-            except Exception as e:
-                print(f"Error in text-to-speech: {str(e)}")
-            finally:
-                self.is_speaking = False
-            self.speech_queue.task_done()
+        # The speech-to-text backend and the text-to-speech engine are loaded on first use
+        self._tts = None
+        self.engine_lock = threading.Lock()
+        self._capture = None
+        self._stt = None
+        self.capture_lock = threading.Lock()
+        self.on_first_audio = None
+
+    @property
+    def tts(self):
+        with self.engine_lock:
+            if self._tts is None:
+                synthesizer = tts.create_synthesizer()
+                self._tts = tts.TTSPipeline(synthesizer, tts.create_player(synthesizer),
+                                            on_first_audio=self._first_audio, cache=self._audio_cache())
+        return self._tts
+
+    def _audio_cache(self):
+        # IRIS_TTS_CACHE=off disables it; IRIS_TTS_CACHE_MB caps its size on disk (default 200)
+        if os.environ.get("IRIS_TTS_CACHE") == "off":
+            return None
+        try:
+            from audio_cache import AudioCache
+            return AudioCache(max_bytes=int(os.environ.get("IRIS_TTS_CACHE_MB", "200")) * 2 ** 20)
+        except Exception as e:
+            print(f"Error opening speech cache: {str(e)}")
+            return None
+
+    @property
+    def synthesizer(self):
+        return self.tts.synthesizer
+
+    @property
+    def is_speaking(self):
+        return self._tts is not None and self._tts.speaking
+
+    def _first_audio(self, ms):
+        if self.on_first_audio is not None:
+            self.on_first_audio(ms)
+
+    @property
+    def stt(self):
+        # Speech-to-text backend picked by IRIS_STT (see stt.py), created on first use
+        with self.capture_lock:
+            if self._stt is None:
+                self._stt = stt.get_backend()
+            return self._stt
+
+    def voice_capture(self):
+        # One capture stream for the whole session: no re-opening or re-calibrating per press.
+        # IRIS_FAKE_MIC=a.wav,b.wav plays WAV files instead of the microphone.
+        backend = self.stt
+        with self.capture_lock:
+            if self._capture is None:
+                if os.environ.get("IRIS_FAKE_MIC"):
+                    source = WavFileSource(*os.environ["IRIS_FAKE_MIC"].split(","), realtime=True)
+                else:
+                    source = MicrophoneSource()
+                # Barge-in: Iris stops talking as soon as the user starts
+                self._capture = VoiceCapture(source, recognize=self.recognize, on_speech=self.stop_speaking,
+                                             stream_factory=backend.stream if backend.streaming else None).start()
+            return self._capture
+
+    def listen(self, on_partial=None, timeout=5):
+        capture = self.voice_capture()
+        print("Listening...")
+        try:
+            # From the button press until the end of speech is detected
+            with tracing.span("stt.capture", timeout_s=timeout) as span:
+                audio, speech_end, stream = capture.listen(timeout=timeout, on_partial=on_partial)
+                span.set(audio_ms=len(audio) * 500 // capture.sample_rate, streaming=stream is not None)
+                span.end_ns = int(speech_end * 1e9)
+        except (TimeoutError, EOFError):
+            raise Exception("Sorry, I didn't hear anything.")
+        # From the end of speech until the text is ready
+        with tracing.span("stt.recognize", backend=type(self.stt).__name__) as span:
+            span.start_ns = int(speech_end * 1e9)
+            text = stream.finish() if stream is not None else self.recognize(audio, capture.sample_rate)
+        if not text:
+            raise Exception("Sorry, I couldn't understand that.")
+        print("You said:", text)
+        return text
+
+    def recognize(self, audio, sample_rate):
+        return self.stt.transcribe(audio, sample_rate)
+
+    def shutdown(self):
+        if self._capture is not None:
+            self._capture.stop()
+        if self._stt is not None:
+            self._stt.close()
+        if self._tts is not None:
+            self._tts.close()
+
+    def speak(self, text, started=None):
+        # Split into sentences and played as they are synthesized; `started` is when the user's
+        # wait began, for the time-to-first-audio measurement
+        self.tts.speak(text, started)
 
     def stop_speaking(self):
-        self.engine.stop()
-        with self.speech_queue.mutex:
-            self.speech_queue.queue.clear()
+        if self._tts is not None:
+            self._tts.interrupt()
 
     def change_voice(self, gender='female'):
         try:
-            voices = self.engine.getProperty('voices')
-            if gender.lower() == 'male':
-                self.engine.setProperty('voice', voices[0].id)
-            else:
-                self.engine.setProperty('voice', voices[1].id)
+            synthesizer = self.synthesizer
+            voices = synthesizer.voices()
+            with synthesizer.lock:
+                if gender.lower() == 'male':
+                    synthesizer.voice = voices[0]
+                else:
+                    synthesizer.voice = voices[1]
         except Exception as e:
             raise Exception(f"Error changing voice: {str(e)}")
 
     def adjust_speech_rate(self, rate):
         try:
-            self.engine.setProperty('rate', rate)
+            synthesizer = self.synthesizer
+            with synthesizer.lock:
+                synthesizer.rate = rate
         except Exception as e:
             raise Exception(f"Error adjusting speech rate: {str(e)}")
 
     def adjust_volume(self, volume):
         try:
-            self.engine.setProperty('volume', volume)
+            synthesizer = self.synthesizer
+            with synthesizer.lock:
+                synthesizer.volume = volume
         except Exception as e:
-            raise Exception(f"Error adjusting volume: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Error adjusting volume: {str(e)}")
@@ -0,0 +1,74 @@
+import os
+import re
+import subprocess
+import sys
+import time
+
+# Cold start budget: from the top of main.py to the first paint of ChatUI
+STARTUP_BUDGET_MS = 1500
+
+IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)')
+
+class StartupTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.marks = []
+
+    def mark(self, name):
+        self.marks.append((name, self.elapsed_ms()))
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def report(self, budget_ms=STARTUP_BUDGET_MS):
+        lines = ["Startup timing:"]
+        previous = 0.0
+        for name, ms in self.marks:
+            lines.append(f"  {name:<20} {ms:8.1f} ms  (+{ms - previous:.1f})")
+            previous = ms
+        if self.marks:
+            status = "OK" if self.marks[-1][1] <= budget_ms else "OVER BUDGET"
+            lines.append(f"  budget {budget_ms} ms: {status}")
+        return "\n".join(lines)
+
+def parse_importtime(output):
+    # Rows of (module, self_us, cumulative_us, depth) from `python -X importtime` stderr
+    rows = []
+    for line in output.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            rows.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2))
+    return rows
+
+def import_breakdown(rows, limit=15):
+    # Cumulative import time per top-level package, counting only imports made directly by our code
+    totals = {}
+    for name, _, cumulative_us, depth in rows:
+        if depth == 0:
+            package = name.split('.')[0]
+            totals[package] = totals.get(package, 0) + cumulative_us
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:limit]
+
+def measure_startup(budget_ms=STARTUP_BUDGET_MS):
+    # Launch the app headless under -X importtime, let it quit after first paint and print both reports
+    env = dict(os.environ)
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    env["IRIS_STARTUP_BUDGET_MS"] = str(budget_ms)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "main.py", "--startup-check"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    print("Import time by package:")
+    for package, cumulative_us in import_breakdown(parse_importtime(proc.stderr)):
+        print(f"  {package:<20} {cumulative_us / 1000:8.1f} ms")
+    print(proc.stdout.strip())
+    errors = [line for line in proc.stderr.splitlines() if not line.startswith("import time:")]
+    if errors:
+        print("\n".join(errors), file=sys.stderr)
+    return proc.returncode
+
+if __name__ == "__main__":
+    sys.exit(measure_startup(int(sys.argv[1]) if len(sys.argv) > 1 else STARTUP_BUDGET_MS))
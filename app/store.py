@@ -0,0 +1,261 @@
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+def default_store_path():
+    return os.environ.get("IRIS_STORE", os.path.join(os.path.expanduser("~"), ".iris", "conversations.db"))
+
+def like_escape(text):
+    # So % and _ typed by the user match themselves in a LIKE pattern
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY, title TEXT NOT NULL, started REAL NOT NULL, updated REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS conversations_updated ON conversations (updated DESC, id DESC);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY, conversation_id TEXT NOT NULL, sender TEXT NOT NULL, text TEXT NOT NULL,
+    time REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_conversation ON messages (conversation_id, id);
+CREATE TABLE IF NOT EXISTS exchanges (
+    id INTEGER PRIMARY KEY, question_id INTEGER NOT NULL, answer_id INTEGER NOT NULL, terms TEXT NOT NULL,
+    vector BLOB
+);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5 (text, content='messages', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+"""
+
+class ConversationStore:
+    # Every conversation and message in a SQLite database in WAL mode. Writes are queued and
+    # committed in batches by a background thread, so the GUI never waits on the disk; reads use a
+    # connection per thread and only ever fetch a page at a time, so startup cost does not grow
+    # with the size of the history. Messages are full-text indexed with FTS5 when SQLite has it.
+    def __init__(self, path=None, batch_ms=200, max_batch=500):
+        self.path = path or default_store_path()
+        self.batch_ms = batch_ms
+        self.max_batch = max_batch
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.local = threading.local()
+        self.writes = queue.Queue()
+        self.batches = self.written = 0
+        db = self._connect()
+        db.executescript(SCHEMA)
+        try:
+            db.executescript(FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False  # SQLite built without FTS5: search falls back to LIKE
+        self.writer = threading.Thread(target=self._write_loop, name="iris-store", daemon=True)
+        self.writer.start()
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    @property
+    def db(self):
+        # Readers get their own connection per thread; WAL lets them run alongside the writer
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = self.local.db = self._connect()
+        return db
+
+    def add_message(self, conversation_id, sender, text, timestamp=None):
+        self.writes.put(("message", conversation_id, sender, text, timestamp or time.time()))
+
+    def add_exchange(self, conversation_id, terms, vector=None):
+        # Indexes the conversation's latest question and reply, once both are written, for
+        # retrieval.ConversationArchive: its keywords and (as float32 bytes) its embedding
+        self.writes.put(("exchange", conversation_id, json.dumps(terms, ensure_ascii=False), vector))
+
+    def flush(self):
+        # Blocks until everything queued so far is committed
+        self.writes.join()
+
+    def close(self):
+        self.writes.put(None)
+        self.writer.join(timeout=5)
+
+    def _write_loop(self):
+        db = self._connect()
+        while True:
+            item = self.writes.get()
+            if item is None:
+                self.writes.task_done()
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.batch_ms / 1000
+            while len(batch) < self.max_batch:
+                try:
+                    item = self.writes.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.writes.put(None)
+                    self.writes.task_done()
+                    break
+                batch.append(item)
+            try:
+                with db:
+                    for kind, *fields in batch:
+                        if kind == "exchange":
+                            self._write_exchange(db, *fields)
+                            continue
+                        conversation_id, sender, text, timestamp = fields
+                        db.execute(
+                            "INSERT INTO conversations (id, title, started, updated, message_count) "
+                            "VALUES (?, ?, ?, ?, 1) ON CONFLICT (id) DO UPDATE SET "
+                            "updated = excluded.updated, message_count = message_count + 1",
+                            (conversation_id, " ".join(text.split())[:80], timestamp, timestamp),
+                        )
+                        db.execute(
+                            "INSERT INTO messages (conversation_id, sender, text, time) VALUES (?, ?, ?, ?)",
+                            (conversation_id, sender, text, timestamp),
+                        )
+                self.batches += 1
+                self.written += len(batch)
+            except sqlite3.Error as e:
+                print(f"Error saving conversation: {str(e)}")
+            finally:
+                for _ in batch:
+                    self.writes.task_done()
+        db.close()
+
+    def _write_exchange(self, db, conversation_id, terms, vector):
+        rows = db.execute("SELECT id, sender FROM messages WHERE conversation_id = ? ORDER BY id DESC LIMIT 2",
+                          (conversation_id,)).fetchall()
+        if len(rows) == 2 and rows[0][1] != "You" and rows[1][1] == "You":
+            db.execute("INSERT INTO exchanges (question_id, answer_id, terms, vector) VALUES (?, ?, ?, ?)",
+                       (rows[1][0], rows[0][0], terms, vector))
+
+    def exchanges(self):
+        # Every indexed exchange, oldest first: (id, question, answer, conversation id, time, terms, vector)
+        rows = self.db.execute(
+            "SELECT e.id, q.text, a.text, a.conversation_id, a.time, e.terms, e.vector FROM exchanges e "
+            "JOIN messages q ON q.id = e.question_id JOIN messages a ON a.id = e.answer_id ORDER BY e.id")
+        return [(r[0], r[1], r[2], r[3], r[4], json.loads(r[5]), r[6]) for r in rows]
+
+    def set_exchange_vector(self, exchange_id, vector):
+        with self.db:
+            self.db.execute("UPDATE exchanges SET vector = ? WHERE id = ?", (vector, exchange_id))
+
+    def conversations(self, limit=50, before=None):
+        # Most recently updated first. `before` is the (updated, id) of the last row of the previous
+        # page; keyset paging keeps every page an index range scan however deep the user scrolls.
+        if before is None:
+            rows = self.db.execute(
+                "SELECT id, title, started, updated, message_count FROM conversations "
+                "ORDER BY updated DESC, id DESC LIMIT ?", (limit,)).fetchall()
+        else:
+            rows = self.db.execute(
+                "SELECT id, title, started, updated, message_count FROM conversations "
+                "WHERE (updated, id) < (?, ?) ORDER BY updated DESC, id DESC LIMIT ?",
+                (before[0], before[1], limit)).fetchall()
+        return [{"id": r[0], "title": r[1], "started": r[2], "updated": r[3], "messages": r[4]} for r in rows]
+
+    def messages(self, conversation_id, limit=None):
+        # The last `limit` messages (all by default), oldest first
+        rows = self.db.execute(
+            "SELECT id, sender, text, time FROM messages WHERE conversation_id = ? ORDER BY id DESC LIMIT ?",
+            (conversation_id, -1 if limit is None else limit)).fetchall()
+        return [{"id": r[0], "sender": r[1], "text": r[2], "time": r[3]} for r in reversed(rows)]
+
+    def search(self, query, limit=50):
+        # Newest matching messages first, each with its conversation's title
+        words = re.findall(r"\w+", query)
+        if not words:
+            return []
+        if self.fts:
+            # Every word must match, the last one as a prefix so results update while typing
+            match = " ".join(f'"{w}"' for w in words[:-1]) + f' "{words[-1]}"*'
+            rows = self.db.execute(
+                "SELECT m.id, m.conversation_id, m.sender, "
+                "snippet(messages_fts, 0, '', '', '...', 12), m.time, c.title "
+                "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+                "JOIN conversations c ON c.id = m.conversation_id "
+                "WHERE messages_fts MATCH ? ORDER BY m.id DESC LIMIT ?", (match.strip(), limit)).fetchall()
+        else:
+            rows = self.db.execute(
+                "SELECT m.id, m.conversation_id, m.sender, m.text, m.time, c.title FROM messages m "
+                "JOIN conversations c ON c.id = m.conversation_id WHERE m.text LIKE ? ESCAPE '\\' "
+                "ORDER BY m.id DESC LIMIT ?", (f"%{like_escape(query.strip())}%", limit)).fetchall()
+        return [{"message_id": r[0], "id": r[1], "sender": r[2], "snippet": r[3], "time": r[4], "title": r[5]}
+                for r in rows]
+
+    def delete_conversation(self, conversation_id):
+        self.flush()
+        with self.db:
+            self.db.execute("DELETE FROM exchanges WHERE answer_id IN "
+                            "(SELECT id FROM messages WHERE conversation_id = ?)", (conversation_id,))
+            self.db.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            self.db.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+
+    def stats(self):
+        return {
+            "conversations": self.db.execute("SELECT COUNT(*) FROM conversations").fetchone()[0],
+            "messages": self.db.execute("SELECT MAX(id) FROM messages").fetchone()[0] or 0,
+            "batches": self.batches,
+            "written": self.written,
+            "fts": self.fts,
+        }
+
+def benchmark(path=None, conversations=20000, per_conversation=20):
+    # Fills a store with conversations * per_conversation messages, then times what the app does:
+    # opening the store, the first history page, a deep page, loading one conversation and a search
+    import tempfile
+    directory = None
+    if path is None:
+        directory = tempfile.TemporaryDirectory()
+        path = os.path.join(directory.name, "bench.db")
+    words = ("weather music python travel recipe garden movie history science football coffee sleep "
+             "budget health language planet ocean camera guitar poetry").split()
+    store = ConversationStore(path)
+    start = time.perf_counter()
+    for c in range(conversations):
+        for m in range(per_conversation):
+            text = f"Message {m} about {words[(c + m) % len(words)]} and {words[(c * 7 + m) % len(words)]}"
+            store.add_message(f"conversation-{c}", "You" if m % 2 == 0 else "Iris", text, 1e9 + c * 100 + m)
+    enqueued = time.perf_counter() - start
+    store.flush()
+    total = conversations * per_conversation
+    print(f"wrote {total} messages: enqueue {enqueued * 1e6 / total:.1f} us/message, "
+          f"{total / (time.perf_counter() - start):.0f} messages/s committed in {store.batches} batches")
+    store.close()
+
+    def timed(label, fn):
+        start = time.perf_counter()
+        result = fn()
+        print(f"{label:<24} {(time.perf_counter() - start) * 1000:8.2f} ms")
+        return result
+
+    store = timed("open store", lambda: ConversationStore(path))
+    page = timed("first history page", lambda: store.conversations(50))
+    for _ in range(100):
+        page = store.conversations(50, before=(page[-1]["updated"], page[-1]["id"]))
+    timed("page 101", lambda: store.conversations(50, before=(page[-1]["updated"], page[-1]["id"])))
+    timed("load conversation", lambda: store.messages(page[-1]["id"]))
+    timed("search 'guitar poe'", lambda: store.search("guitar poe"))
+    store.close()
+    if directory is not None:
+        directory.cleanup()
+
+if __name__ == "__main__":
+    benchmark()
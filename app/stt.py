@@ -0,0 +1,320 @@
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+import wave
+from capture import SAMPLE_WIDTH
+
+# Speech-to-text backends for SpeechHandler. IRIS_STT picks one:
+#   google              speech_recognition's recognize_google (network, the default)
+#   vosk:/path/to/model Vosk/Kaldi, offline and natively streaming
+#   whisper:tiny.en     faster-whisper on CPU (int8), offline
+#   fake:some words     hears "some words" in any audio, for headless runs and tests
+# Offline engines run in a worker process so decoding never competes with the GUI for the GIL.
+
+class STTBackend:
+    name = "base"
+    streaming = False  # True when stream() gives partial results while audio is still arriving
+
+    def transcribe(self, audio, sample_rate):
+        # 16-bit mono PCM in, text out ("" when nothing was recognized)
+        raise NotImplementedError
+
+    def stream(self, sample_rate):
+        return BufferedStream(self, sample_rate)
+
+    def close(self):
+        pass
+
+class BufferedStream:
+    # For engines without incremental decoding: collect the audio, decode it all at the end
+    incremental = False
+
+    def __init__(self, backend, sample_rate):
+        self.backend = backend
+        self.sample_rate = sample_rate
+        self.chunks = []
+
+    def accept(self, chunk):
+        self.chunks.append(chunk)
+        return None
+
+    def finish(self):
+        return self.backend.transcribe(b"".join(self.chunks), self.sample_rate)
+
+class GoogleBackend(STTBackend):
+    name = "google"
+
+    def __init__(self):
+        import speech_recognition as sr
+        self.recognizer = sr.Recognizer()
+
+    def transcribe(self, audio, sample_rate):
+        import speech_recognition as sr
+        try:
+            return self.recognizer.recognize_google(sr.AudioData(audio, sample_rate, SAMPLE_WIDTH))
+        except sr.UnknownValueError:
+            return ""
+        except sr.RequestError as e:
+            raise Exception(f"Could not request results; {str(e)}")
+
+class VoskBackend(STTBackend):
+    name = "vosk"
+    streaming = True
+
+    def __init__(self, model_path):
+        from vosk import Model, SetLogLevel
+        SetLogLevel(-1)
+        self.model = Model(model_path)
+
+    def transcribe(self, audio, sample_rate):
+        stream = self.stream(sample_rate)
+        stream.accept(audio)
+        return stream.finish()
+
+    def stream(self, sample_rate):
+        return VoskStream(self.model, sample_rate)
+
+class VoskStream:
+    incremental = True
+
+    def __init__(self, model, sample_rate):
+        from vosk import KaldiRecognizer
+        self.recognizer = KaldiRecognizer(model, sample_rate)
+        self.final = []
+
+    def accept(self, chunk):
+        if self.recognizer.AcceptWaveform(chunk):
+            text = json.loads(self.recognizer.Result()).get("text", "")
+            if text:
+                self.final.append(text)
+            return " ".join(self.final) or None
+        partial = json.loads(self.recognizer.PartialResult()).get("partial", "")
+        return " ".join(self.final + [partial]) if partial else None
+
+    def finish(self):
+        text = json.loads(self.recognizer.FinalResult()).get("text", "")
+        return " ".join(self.final + ([text] if text else []))
+
+class WhisperBackend(STTBackend):
+    name = "whisper"
+
+    def __init__(self, model="tiny.en", threads=0):
+        from faster_whisper import WhisperModel
+        self.model = WhisperModel(model, device="cpu", compute_type="int8", cpu_threads=threads)
+
+    def transcribe(self, audio, sample_rate):
+        import numpy as np
+        samples = np.frombuffer(audio, dtype=np.int16).astype(np.float32) / 32768.0
+        if sample_rate != 16000:
+            # Whisper expects 16 kHz; linear resampling is plenty for speech
+            positions = np.arange(0, len(samples), sample_rate / 16000)
+            samples = np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+        segments, _ = self.model.transcribe(samples, beam_size=1, vad_filter=False)
+        return " ".join(segment.text.strip() for segment in segments).strip()
+
+class FakeBackend(STTBackend):
+    # No model: any audio is recognized as `text`, streamed one more word per chunk, the way
+    # IRIS_FAKE_MIC stands in for the microphone and IRIS_FAKE_LLM for Groq
+    name = "fake"
+    streaming = True
+
+    def __init__(self, text="hello iris"):
+        self.text = text
+
+    def transcribe(self, audio, sample_rate):
+        return self.text if audio else ""
+
+    def stream(self, sample_rate):
+        return FakeStream(self)
+
+class FakeStream:
+    incremental = True
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.chunks = 0
+
+    def accept(self, chunk):
+        self.chunks += 1
+        return " ".join(self.backend.text.split()[:self.chunks])
+
+    def finish(self):
+        return self.backend.text if self.chunks else ""
+
+BACKENDS = {"google": GoogleBackend, "vosk": VoskBackend, "whisper": WhisperBackend, "fake": FakeBackend}
+
+def create_backend(spec):
+    # "name" or "name:argument", see the table at the top of this module
+    name, _, argument = spec.partition(":")
+    if name not in BACKENDS:
+        raise Exception(f"Unknown speech-to-text backend: {name}")
+    return BACKENDS[name](argument) if argument else BACKENDS[name]()
+
+def get_backend(spec=None, process=None):
+    spec = spec or os.environ.get("IRIS_STT", "google")
+    if process is None:
+        process = not spec.startswith("google")
+    return ProcessBackend(spec) if process else create_backend(spec)
+
+def _serve(conn, spec):
+    # Worker process: load the model once, then answer requests until told to close
+    try:
+        backend = create_backend(spec)
+    except Exception as e:
+        conn.send(("error", f"Error loading {spec}: {str(e)}"))
+        return
+    conn.send(("ready", (backend.name, backend.streaming)))
+    stream = stream_error = None
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        op = message[0]
+        if op == "close":
+            break
+        try:
+            if op == "transcribe":
+                conn.send(("result", backend.transcribe(message[1], message[2])))
+            elif op == "start":
+                stream, stream_error = backend.stream(message[1]), None
+            elif op == "chunk":
+                # Chunk errors are held back and reported once, in reply to "finish"
+                if stream is not None and stream_error is None:
+                    partial = stream.accept(message[1])
+                    if partial:
+                        conn.send(("partial", partial))
+            elif op == "finish":
+                if stream_error is not None:
+                    raise Exception(stream_error)
+                conn.send(("result", stream.finish() if stream is not None else ""))
+                stream = None
+        except Exception as e:
+            if op == "chunk":
+                stream_error = str(e)
+            else:
+                stream = None
+                conn.send(("error", str(e)))
+
+class ProcessBackend(STTBackend):
+    # Runs another backend in a child process; one request or stream at a time
+    def __init__(self, spec):
+        context = multiprocessing.get_context("spawn")
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=_serve, args=(child, spec), name=f"iris-stt-{spec}", daemon=True)
+        self.process.start()
+        child.close()
+        self.lock = threading.Lock()
+        name, self.streaming = self._reply("ready")
+        self.name = f"{name} (worker process)"
+
+    def _reply(self, expected="result"):
+        while True:
+            try:
+                kind, value = self.conn.recv()
+            except EOFError:
+                raise Exception("Speech-to-text worker process exited")
+            if kind == "error":
+                raise Exception(value)
+            if kind == expected:
+                return value
+
+    def transcribe(self, audio, sample_rate):
+        with self.lock:
+            self.conn.send(("transcribe", audio, sample_rate))
+            return self._reply()
+
+    def stream(self, sample_rate):
+        self.lock.acquire()
+        try:
+            self.conn.send(("start", sample_rate))
+        except Exception:
+            self.lock.release()
+            raise
+        return ProcessStream(self)
+
+    def close(self):
+        try:
+            self.conn.send(("close",))
+        except Exception:
+            pass
+        self.process.join(timeout=2)
+
+class ProcessStream:
+    incremental = True
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def accept(self, chunk):
+        # Never waits on the worker: returns the newest partial that has already arrived, if any
+        conn = self.backend.conn
+        conn.send(("chunk", chunk))
+        latest = None
+        while conn.poll():
+            kind, value = conn.recv()
+            if kind == "partial":
+                latest = value
+        return latest
+
+    def finish(self):
+        try:
+            self.backend.conn.send(("finish",))
+            return self.backend._reply()
+        finally:
+            self.backend.lock.release()
+
+def word_error_rate(reference, hypothesis):
+    ref = re.findall(r"[a-z0-9']+", reference.lower())
+    hyp = re.findall(r"[a-z0-9']+", hypothesis.lower())
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (r != h))
+        previous = current
+    return previous[-1] / len(ref)
+
+def benchmark(specs, fixtures):
+    # Real-time factor (decode time / audio length) and word error rate over <name>.wav files with a
+    # matching <name>.txt reference transcript
+    pairs = []
+    for filename in sorted(os.listdir(fixtures)):
+        if filename.endswith(".wav") and os.path.exists(os.path.join(fixtures, filename[:-4] + ".txt")):
+            with wave.open(os.path.join(fixtures, filename), "rb") as wav:
+                audio = wav.readframes(wav.getnframes())
+                rate = wav.getframerate()
+            with open(os.path.join(fixtures, filename[:-4] + ".txt"), encoding="utf-8") as f:
+                pairs.append((filename, audio, rate, f.read().strip()))
+    if not pairs:
+        raise Exception(f"No .wav/.txt fixture pairs in {fixtures}")
+
+    for spec in specs:
+        start = time.perf_counter()
+        backend = get_backend(spec)
+        load = time.perf_counter() - start
+        decode = duration = errors = words = 0.0
+        for _, audio, rate, reference in pairs:
+            start = time.perf_counter()
+            hypothesis = backend.transcribe(audio, rate)
+            decode += time.perf_counter() - start
+            duration += len(audio) / SAMPLE_WIDTH / rate
+            n = len(reference.split())
+            errors += word_error_rate(reference, hypothesis) * n
+            words += n
+        backend.close()
+        print(f"{backend.name:<32} load {load:6.2f} s  RTF {decode / duration:6.3f}  "
+              f"WER {errors / max(words, 1):6.1%}  ({len(pairs)} files, {duration:.1f} s audio)")
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Compare speech-to-text backends")
+    parser.add_argument("fixtures", help="directory of <name>.wav files with <name>.txt transcripts")
+    parser.add_argument("backends", nargs="+", help="backend specs, e.g. google vosk:/models/vosk-small-en")
+    args = parser.parse_args()
+    benchmark(args.backends, args.fixtures)
@@ -0,0 +1,81 @@
+import re
+import pytest
+import nlp
+from analysis import AnalysisPipeline
+
+TEXTS = [
+    "I love how Alice and Bob fixed the build in London yesterday!",
+    "This is terrible. The deployment failed again and nobody noticed for hours.",
+    "Comprehensive infrastructure modernization necessitates considerable organizational commitment "
+    "throughout multiple consecutive quarters, particularly regarding observability, reliability and "
+    "security engineering practices.",
+    "ok",
+]
+
+def legacy(text):
+    # The per-analyzer helpers the pipeline replaced, each tokenizing and tagging on its own
+    return {
+        "sentiment": nlp.analyze_sentiment(text),
+        "keywords": nlp.extract_keywords(text),
+        "named_entities": nlp.extract_named_entities(text),
+        "complexity": nlp.analyze_text_complexity(text),
+    }
+
+def shared(result):
+    return {key: result.as_dict()[key] for key in ("sentiment", "keywords", "named_entities", "complexity")}
+
+class StubTagger:
+    def tag(self, words):
+        return [(w, "NNP" if w[:1].isupper() else "NN") for w in words]
+
+    def tag_sents(self, sentences):
+        return [self.tag(words) for words in sentences]
+
+class StubChunker:
+    # Runs of capitalized words are entities
+    def parse(self, tags):
+        from nltk import Tree
+        chunks, run = [], []
+        for word, tag in tags + [("", "")]:
+            if tag == "NNP":
+                run.append((word, tag))
+                continue
+            if run:
+                chunks.append(Tree("PERSON", run))
+                run = []
+            if word:
+                chunks.append((word, tag))
+        return chunks
+
+class StubVader:
+    WORDS = {"love": 0.6, "fixed": 0.2, "terrible": -0.7, "failed": -0.4}
+
+    def polarity_scores(self, text):
+        return {"compound": sum(self.WORDS.get(w, 0) for w in re.findall(r"\w+", text.lower()))}
+
+@pytest.fixture
+def stub_resources(monkeypatch):
+    # NLTK-shaped stand-ins, so the comparison runs without the NLTK data downloaded
+    resources = nlp.ResourceRegistry()
+    resources.register("tokenizers", lambda: (lambda text: re.findall(r"\w+|[^\w\s]", text),
+                                              lambda text: re.split(r"(?<=[.!?])\s+", text.strip())))
+    resources.register("pos_tagger", StubTagger)
+    resources.register("ne_chunker", StubChunker)
+    resources.register("vader", StubVader)
+    resources.register("stopwords", lambda: frozenset("i how and the in this is for it".split()))
+    monkeypatch.setattr(nlp, "resources", resources)
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_shared_pass_matches_the_separate_analyzers(stub_resources, text):
+    assert shared(AnalysisPipeline(use_spacy=False).analyze(text)) == legacy(text)
+
+def test_batch_matches_one_at_a_time(stub_resources):
+    pipeline = AnalysisPipeline(use_spacy=False)
+    assert [shared(r) for r in pipeline.analyze_batch(TEXTS)] == [shared(pipeline.analyze(t)) for t in TEXTS]
+
+@pytest.mark.skipif(bool(nlp.missing_nltk_data(["punkt", "averaged_perceptron_tagger", "maxent_ne_chunker", "words",
+                                                  "stopwords", "vader_lexicon"])),
+                    reason="NLTK data not downloaded (python nlp.py --download)")
+@pytest.mark.parametrize("text", TEXTS)
+def test_shared_pass_matches_with_nltk(text):
+    assert shared(AnalysisPipeline(use_spacy=False).analyze(text)) == legacy(text)
@@ -0,0 +1,50 @@
+import os
+from audio_cache import AudioCache, audio_key
+from tts import Clip
+
+def clip(samples=1000, value=1):
+    return Clip(bytes([value, 0]) * samples, 16000)
+
+def test_keys_differ_by_engine_and_voice_settings():
+    base = audio_key("espeak", "Hello there.", "en+f3", 150, 0.8)
+    assert audio_key("espeak", " Hello   there. ", "en+f3", 150, 0.8) == base  # whitespace is collapsed
+    assert audio_key("espeak", "Hello there.", "en+f3", 150, 0.8000001) == base
+    variants = [
+        audio_key("pyttsx3", "Hello there.", "en+f3", 150, 0.8),
+        audio_key("espeak", "Hello there!", "en+f3", 150, 0.8),
+        audio_key("espeak", "Hello there.", "en+m3", 150, 0.8),
+        audio_key("espeak", "Hello there.", "en+f3", 180, 0.8),
+        audio_key("espeak", "Hello there.", "en+f3", 150, 0.5),
+    ]
+    assert len(set(variants + [base])) == len(variants) + 1
+
+def test_hit_returns_the_same_audio(tmp_path):
+    cache = AudioCache(str(tmp_path))
+    original = clip(value=7)
+    cache.put("a" * 64, original)
+    cached = cache.get("a" * 64)
+    assert bytes(cached.pcm) == original.pcm
+    assert (cached.sample_rate, cached.sample_width, cached.channels) == (16000, 2, 1)
+    assert cache.get("b" * 64) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_least_recently_used_is_evicted_past_the_budget(tmp_path):
+    size = 2000 + 44  # PCM plus the WAV header
+    cache = AudioCache(str(tmp_path), max_bytes=3 * size)
+    for key in "abc":
+        cache.put(key * 64, clip())
+    cache.get("a" * 64)  # "b" is now the least recently used
+    cache.put("d" * 64, clip())
+    assert set(cache.entries) == {"a" * 64, "c" * 64, "d" * 64}
+    assert cache.total_bytes <= cache.max_bytes
+    assert sorted(os.listdir(tmp_path)) == sorted(key * 64 + ".wav" for key in "acd")
+    assert cache.stats()["evictions"] == 1
+
+def test_recency_survives_a_reload(tmp_path):
+    cache = AudioCache(str(tmp_path))
+    for i, key in enumerate("abc"):
+        cache.put(key * 64, clip())
+        os.utime(cache.path(key * 64), (1000 + i, 1000 + i))
+    os.utime(cache.path("a" * 64), (2000, 2000))  # as a hit does
+    reloaded = AudioCache(str(tmp_path), max_bytes=2 * (2000 + 44))
+    assert list(reloaded.entries) == ["c" * 64, "a" * 64]  # "b" was the oldest and is evicted on load
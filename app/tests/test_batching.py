@@ -0,0 +1,57 @@
+import threading
+from concurrent.futures import Future
+import pytest
+from batching import BatcherClosed, MicroBatcher
+
+def test_items_submitted_together_share_a_batch():
+    batches = []
+    release = threading.Event()
+
+    def process(items):
+        release.wait(5)
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(process, window_ms=20)
+    first = batcher.submit(1)
+    rest = [batcher.submit(i) for i in range(2, 6)]
+    release.set()
+    assert [f.result(5) for f in [first] + rest] == [2, 4, 6, 8, 10]
+    batcher.close()
+    assert sum(len(b) for b in batches) == 5 and len(batches) <= 2
+
+def test_errors_fail_the_whole_batch():
+    def process(items):
+        raise ValueError("bad batch")
+
+    batcher = MicroBatcher(process, window_ms=1)
+    with pytest.raises(ValueError):
+        batcher.submit("x").result(5)
+    batcher.close()
+
+def test_items_behind_close_are_failed():
+    started = threading.Event()
+    release = threading.Event()
+
+    def process(items):
+        started.set()
+        release.wait(5)
+        return items
+
+    batcher = MicroBatcher(process, window_ms=0)
+    running = batcher.submit("running")
+    started.wait(5)
+    closer = threading.Thread(target=batcher.close)
+    closer.start()
+    while not batcher.closed:
+        pass
+    # Queued behind the stop marker while the last batch is still being processed
+    late = Future()
+    batcher.queue.put(("late", late))
+    release.set()
+    closer.join(5)
+    assert running.result(5) == "running"
+    with pytest.raises(BatcherClosed):
+        late.result(5)
+    with pytest.raises(BatcherClosed):
+        batcher.submit("after").result(5)
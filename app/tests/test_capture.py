@@ -0,0 +1,71 @@
+import math
+import time
+import wave
+from array import array
+import pytest
+from capture import SAMPLE_RATE, VoiceCapture, WavFileSource
+
+def write_wav(path, *segments):
+    # segments: (seconds, amplitude) pairs of a 440 Hz tone, amplitude 0 for silence
+    samples = array('h')
+    for seconds, amplitude in segments:
+        for i in range(int(seconds * SAMPLE_RATE)):
+            samples.append(int(amplitude * math.sin(2 * math.pi * 440 * i / SAMPLE_RATE)))
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(samples.tobytes())
+    return str(path)
+
+def test_utterance_is_endpointed_after_silence(tmp_path):
+    path = write_wav(tmp_path / "a.wav", (0.5, 0), (1.0, 8000), (1.0, 0))
+    capture = VoiceCapture(WavFileSource(path, gap_ms=0), end_silence_ms=300)
+    try:
+        audio, _, stream = capture.listen(timeout=5)
+    finally:
+        capture.stop()
+    assert stream is None
+    seconds = len(audio) / 2 / SAMPLE_RATE
+    # The speech plus at most the preroll, with the trailing silence dropped
+    assert 1.0 <= seconds <= 1.35
+
+def test_timeout_only_covers_the_wait_for_speech(tmp_path):
+    # Speech starts before the timeout but ends well after it
+    path = write_wav(tmp_path / "a.wav", (0.2, 0), (1.0, 8000), (0.6, 0))
+    capture = VoiceCapture(WavFileSource(path, realtime=True, gap_ms=0), end_silence_ms=300)
+    try:
+        start = time.monotonic()
+        audio, _, _ = capture.listen(timeout=0.5)
+    finally:
+        capture.stop()
+    assert time.monotonic() - start > 0.5
+    assert len(audio) / 2 / SAMPLE_RATE >= 1.0
+
+def test_silence_times_out(tmp_path):
+    path = write_wav(tmp_path / "a.wav", (2.0, 0))
+    capture = VoiceCapture(WavFileSource(path, realtime=True, gap_ms=0))
+    try:
+        with pytest.raises(TimeoutError):
+            capture.listen(timeout=0.3)
+    finally:
+        capture.stop()
+
+def test_end_of_source(tmp_path):
+    path = write_wav(tmp_path / "a.wav", (0.3, 0))
+    capture = VoiceCapture(WavFileSource(path, gap_ms=0))
+    try:
+        with pytest.raises(EOFError):
+            capture.listen(timeout=5)
+    finally:
+        capture.stop()
+
+def test_on_speech_fires_for_barge_in(tmp_path):
+    path = write_wav(tmp_path / "a.wav", (0.3, 0), (0.5, 8000), (0.5, 0))
+    started = []
+    capture = VoiceCapture(WavFileSource(path, gap_ms=0), end_silence_ms=300, on_speech=lambda: started.append(1))
+    try:
+        capture.listen(timeout=5)
+    finally:
+        capture.stop()
+    assert started == [1]
@@ -0,0 +1,60 @@
+import os
+import time
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+QtWidgets = pytest.importorskip("PyQt6.QtWidgets")
+from chat_view import ChatModel, ChatView  # noqa: E402
+
+@pytest.fixture(scope="module")
+def app():
+    return QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+def wait_for(app, condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.002)
+    return condition()
+
+def test_deltas_are_coalesced_into_one_update_per_frame(app):
+    model = ChatModel(frame_ms=16)
+    changes = []
+    model.dataChanged.connect(lambda top_left, bottom_right: changes.append(top_left.row()))
+    row = model.append_message("Iris", "")
+    deltas = [f"word{i} " for i in range(200)]
+    for delta in deltas:
+        model.append_text(row, delta)
+    assert changes == []  # nothing applied until the frame timer fires
+    assert wait_for(app, lambda: changes)
+    app.processEvents()
+    assert changes == [row]
+    assert model.data(model.index(row)) == "".join(deltas)
+
+def test_final_text_is_exact_across_frames_and_new_messages(app):
+    model = ChatModel(frame_ms=1)
+    row = model.append_message("Iris", "Hi")
+    text = "Hi"
+    for i in range(50):
+        model.append_text(row, f" {i}")
+        text += f" {i}"
+        if i % 10 == 0:
+            wait_for(app, lambda: not model.pending)
+    # A new message flushes whatever is still pending for the streamed one first
+    other = model.append_message("You", "next")
+    assert model.data(model.index(row)) == text
+    assert model.data(model.index(other)) == "next"
+    assert model.data(model.index(other), ChatModel.SenderRole) == "You"
+
+def test_view_paints_streamed_rows(app):
+    model = ChatModel(frame_ms=1)
+    view = ChatView()
+    view.setModel(model)
+    view.resize(400, 300)
+    for i in range(30):
+        model.append_message("You" if i % 2 else "Iris", f"message {i} " * (i % 5 + 1))
+    row = model.append_message("Iris", "")
+    for i in range(20):
+        model.append_text(row, f"token{i} ")
+    assert wait_for(app, lambda: not model.pending)
+    assert not view.grab().isNull()
@@ -0,0 +1,92 @@
+import asyncio
+import pytest
+from fake_llm import FakeAPIServer
+from gateway import CircuitBreaker, CircuitOpen, GatewayError, LLMGateway
+
+@pytest.fixture
+def api_server():
+    server = FakeAPIServer(reply="Hello world. How are you?", latency=0, chunk_size=6, chunk_delay=0).start()
+    yield server
+    server.stop()
+
+def gateway_for(server, **kwargs):
+    kwargs.setdefault("backoff_base", 0.01)
+    return LLMGateway(api_key="test", base_url=server.base_url, **kwargs)
+
+async def collect(gateway, messages=None):
+    return [delta async for delta in gateway.stream_chat(messages or [{"role": "user", "content": "hi"}])]
+
+def test_stream_retries_before_first_delta(api_server):
+    api_server.failures = [503, 429]
+
+    async def run():
+        async with gateway_for(api_server) as gateway:
+            return await collect(gateway), gateway.retries
+
+    deltas, retries = asyncio.run(run())
+    assert "".join(deltas) == "Hello world. How are you?"
+    assert retries == 2
+    assert api_server.requests == 3
+
+def test_stream_broken_after_first_delta_is_not_retried(api_server):
+    api_server.drops = [2]
+
+    async def run():
+        received = []
+        async with gateway_for(api_server) as gateway:
+            with pytest.raises(GatewayError):
+                async for delta in gateway.stream_chat([{"role": "user", "content": "hi"}]):
+                    received.append(delta)
+            return received, gateway.retries
+
+    received, retries = asyncio.run(run())
+    assert received == ["Hello ", "world."]
+    assert retries == 0
+    assert api_server.requests == 1
+
+def test_client_errors_are_not_retried(api_server):
+    api_server.failures = [400]
+
+    async def run():
+        async with gateway_for(api_server) as gateway:
+            with pytest.raises(GatewayError) as error:
+                await gateway.chat([{"role": "user", "content": "hi"}])
+            return error.value.status, gateway.breaker.state
+
+    assert asyncio.run(run()) == (400, "closed")
+    assert api_server.requests == 1
+
+def test_breaker_opens_and_recovers(api_server):
+    api_server.failures = [503] * 2
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+
+    async def run():
+        async with gateway_for(api_server, max_retries=0, breaker=breaker) as gateway:
+            for _ in range(2):
+                with pytest.raises(GatewayError):
+                    await gateway.chat([{"role": "user", "content": "hi"}])
+            assert breaker.state == "open"
+            with pytest.raises(CircuitOpen):
+                await gateway.chat([{"role": "user", "content": "hi"}])
+            await asyncio.sleep(0.06)
+            assert breaker.state == "half_open"
+            return await gateway.chat([{"role": "user", "content": "hi"}])
+
+    assert asyncio.run(run()) == "Hello world. How are you?"
+    assert breaker.state == "closed"
+
+def test_closed_trial_stream_releases_the_breaker(api_server):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+
+    async def run():
+        async with gateway_for(api_server, breaker=breaker) as gateway:
+            stream = gateway.stream_chat([{"role": "user", "content": "hi"}])
+            assert await stream.__anext__() == "Hello "
+            assert breaker.trial_in_flight
+            await stream.aclose()
+            assert not breaker.trial_in_flight
+            return await collect(gateway)
+
+    assert "".join(asyncio.run(run())) == "Hello world. How are you?"
+    assert breaker.state == "closed"
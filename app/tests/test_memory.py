@@ -0,0 +1,58 @@
+import nlp
+from memory import ConversationMemory, count_tokens, fit_to_budget
+
+def message(i, role="user", words=20):
+    return {"role": role, "content": f"turn {i} " + " ".join(f"word{i}x{j}" for j in range(words))}
+
+def shorten(text):
+    return text[:40]
+
+def test_recent_turns_stay_within_the_budget():
+    memory = ConversationMemory(context_budget=400, summary_budget=100, summarize=shorten)
+    for i in range(50):
+        memory.append(message(i, "user" if i % 2 == 0 else "assistant"))
+        assert memory.turn_tokens <= memory.turn_budget
+        assert memory.turn_tokens == sum(count_tokens(content) for _, content, _ in memory.turns)
+    # The newest turns are the ones kept verbatim
+    kept = [content for _, content, _ in memory.turns]
+    assert kept == [message(i)["content"] for i in range(50 - len(kept), 50)]
+    assert memory.total_turns == 50
+
+def test_turn_cap_applies_before_the_budget():
+    memory = ConversationMemory(context_budget=100000, max_turns=5, summarize=shorten)
+    for i in range(12):
+        memory.append(message(i, words=2))
+    assert len(memory) == 5
+    assert memory.summary  # the seven older turns were folded, not lost
+
+def test_evicted_turns_are_summarized_within_their_own_budget():
+    memory = ConversationMemory(context_budget=300, summary_budget=80, summarize=shorten)
+    for i in range(40):
+        memory.append(message(i))
+        assert memory.summary_tokens <= memory.summary_budget
+        assert memory.context_tokens() <= memory.context_budget
+    summary = memory.context_messages()[0]
+    assert summary["role"] == "system" and summary["content"].startswith("Summary of earlier conversation:")
+    # The summary keeps the most recently evicted turns
+    oldest_kept = int(memory.turns[0][1].split()[1])
+    assert f"turn {oldest_kept - 1} " in summary["content"]
+    assert "turn 0 " not in summary["content"]
+
+def test_an_oversized_turn_is_still_kept():
+    memory = ConversationMemory(context_budget=50, summary_budget=10, summarize=shorten)
+    memory.append(message(0, words=200))
+    assert len(memory) == 1
+
+def test_build_messages_keeps_the_newest_history(monkeypatch):
+    monkeypatch.setattr(nlp, "CONTEXT_BUDGET", 200)
+    history = [message(i, "user" if i % 2 == 0 else "assistant") for i in range(20)]
+    messages = nlp.build_messages("hello", [], history)
+    sent = messages[1:-1]
+    assert sent == history[-len(sent):]
+    assert sum(count_tokens(m["content"]) for m in sent) <= 200
+    assert messages[-1]["content"].startswith("User input: hello")
+
+def test_fit_to_budget_always_keeps_the_last_message():
+    huge = {"role": "user", "content": "word " * 1000}
+    assert fit_to_budget([message(0), huge], 10) == [huge]
+    assert fit_to_budget([], 10) == []
@@ -0,0 +1,96 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+import pytest
+import nlp
+
+def test_concurrent_gets_load_once_and_share_the_value():
+    calls = []
+
+    def load():
+        calls.append(threading.current_thread().name)
+        time.sleep(0.05)  # long enough for every thread to be waiting on it
+        return object()
+
+    resources = nlp.ResourceRegistry()
+    resources.register("model", load)
+    start = threading.Barrier(8)
+    values = []
+
+    def get():
+        start.wait()
+        values.append(resources.get("model"))
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert len(values) == 8 and all(value is values[0] for value in values)
+    assert resources.is_loaded("model")
+
+def test_failed_load_is_reported_and_retried():
+    attempts = []
+
+    def load():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise OSError("disk full")
+        return "model"
+
+    resources = nlp.ResourceRegistry()
+    resources.register("model", load)
+    with pytest.raises(Exception, match="Error loading model: disk full"):
+        resources.get("model")
+    assert not resources.is_loaded("model")
+    assert resources.get("model") == "model"
+
+@pytest.fixture
+def empty_nltk_data(monkeypatch, tmp_path):
+    # No NLTK data anywhere, and any download is recorded instead of going to the network
+    nltk = pytest.importorskip("nltk")
+    monkeypatch.setattr(nltk.data, "path", [str(tmp_path)])
+    monkeypatch.setattr(nlp, "_nltk_present", set())
+    monkeypatch.delenv("IRIS_NLTK_DOWNLOAD", raising=False)
+    downloads = []
+
+    def download(package, quiet=False):
+        downloads.append(package)
+        (tmp_path / "corpora" / package).mkdir(parents=True)
+        return True
+
+    monkeypatch.setattr(nltk, "download", download)
+    return downloads
+
+def test_missing_data_is_an_error_not_a_download(empty_nltk_data):
+    with pytest.raises(Exception, match=r"Missing NLTK data: stopwords\. Run 'python nlp.py --download'"):
+        nlp.ensure_nltk_data("stopwords")
+    assert empty_nltk_data == []
+
+def test_download_only_when_asked(monkeypatch, empty_nltk_data):
+    monkeypatch.setenv("IRIS_NLTK_DOWNLOAD", "1")
+    nlp.ensure_nltk_data("stopwords")
+    assert empty_nltk_data == ["stopwords"]
+    nlp.ensure_nltk_data("stopwords")  # present now
+    assert empty_nltk_data == ["stopwords"]
+
+def test_loading_a_resource_does_not_download(empty_nltk_data):
+    resources = nlp.ResourceRegistry()
+    resources.register("stopwords", nlp._load_stopwords)
+    with pytest.raises(Exception, match="python nlp.py --download"):
+        resources.get("stopwords")
+    assert empty_nltk_data == []
+
+def test_importing_nlp_never_downloads():
+    script = ("import nltk\n"
+              "def download(*args, **kwargs): raise SystemExit('nltk.download called')\n"
+              "nltk.download = download\n"
+              "import nlp, analysis\n")
+    app = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env.pop("IRIS_NLTK_DOWNLOAD", None)
+    result = subprocess.run([sys.executable, "-c", script], cwd=app, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
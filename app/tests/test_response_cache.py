@@ -0,0 +1,31 @@
+import pytest
+import nlp
+from cache import ResponseCache
+from fake_llm import FakeGroq
+
+@pytest.fixture
+def llm(monkeypatch):
+    monkeypatch.setattr(nlp, "semantic_cache", None)
+    return FakeGroq(reply="Paris is the capital of France.", delay=0, first_token_delay=0)
+
+def ask(llm, temperature=None):
+    return "".join(nlp.stream_response("Capital of France?", [], [], llm_client=llm, temperature=temperature))
+
+def test_sampled_replies_are_not_cached_by_default(monkeypatch, llm):
+    monkeypatch.setattr(nlp, "response_cache", ResponseCache())
+    ask(llm)
+    ask(llm)
+    assert len(llm.chat.completions.calls) == 2
+
+def test_sampled_replies_cached_when_opted_in(monkeypatch, llm):
+    monkeypatch.setattr(nlp, "response_cache", ResponseCache(cache_sampled=True))
+    assert ask(llm) == ask(llm) == "Paris is the capital of France."
+    assert len(llm.chat.completions.calls) == 1
+
+def test_temperature_zero_replies_are_cached(monkeypatch, llm):
+    monkeypatch.setattr(nlp, "response_cache", ResponseCache())
+    monkeypatch.setattr(nlp, "TEMPERATURE", 0.0)
+    ask(llm)
+    ask(llm)
+    assert len(llm.chat.completions.calls) == 1
+    assert llm.chat.completions.calls[0]["temperature"] == 0.0
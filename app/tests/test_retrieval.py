@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+from retrieval import ConversationArchive
+from semantic_cache import HashingEmbedder
+from store import ConversationStore
+
+def simple_terms(text):
+    return sorted({word.strip("?.,!").lower() for word in text.split() if len(word) > 3})
+
+@pytest.fixture
+def store(tmp_path):
+    store = ConversationStore(str(tmp_path / "conversations.db"), batch_ms=0)
+    yield store
+    store.close()
+
+def converse(store, archive, session, question, answer):
+    store.add_message(session, "You", question)
+    store.add_message(session, "Iris", answer)
+    archive.add(question, answer, session=session)
+
+class CountingEmbedder(HashingEmbedder):
+    def __init__(self):
+        super().__init__(dim=64)
+        self.calls = 0
+
+    def __call__(self, text):
+        self.calls += 1
+        return super().__call__(text)
+
+def test_exchanges_are_retrieved_after_reopening(store):
+    archive = ConversationArchive(store, terms=simple_terms)
+    converse(store, archive, "a", "What is the capital of France?", "Paris.")
+    converse(store, archive, "b", "Recommend a guitar for beginners", "A nylon-string classical guitar.")
+    assert archive.retrieve("beginner guitar recommendations")[0]["answer"] == "A nylon-string classical guitar."
+    store.flush()
+
+    reopened = ConversationArchive(store, terms=simple_terms)
+    assert len(reopened) == 2
+    result = reopened.retrieve("capital of France", k=1)[0]
+    assert (result["answer"], result["session"]) == ("Paris.", "a")
+
+def test_vectors_are_saved_with_the_exchanges(store):
+    embed = CountingEmbedder()
+    archive = ConversationArchive(store, embed=embed, terms=simple_terms)
+    for i in range(5):
+        converse(store, archive, "s", f"Question number {i} about planets", f"Answer {i}")
+    store.flush()
+    assert embed.calls == 5
+
+    embed.calls = 0
+    reopened = ConversationArchive(store, embed=embed, terms=simple_terms)
+    assert embed.calls == 0
+    assert np.allclose(reopened.vectors[:5], archive.vectors[:5])
+
+def test_embeddings_turned_on_later_are_computed_once(store):
+    archive = ConversationArchive(store, terms=simple_terms)
+    converse(store, archive, "s", "Tell me about volcanoes", "They erupt.")
+    store.flush()
+    embed = CountingEmbedder()
+    ConversationArchive(store, embed=embed, terms=simple_terms)
+    ConversationArchive(store, embed=embed, terms=simple_terms)
+    assert embed.calls == 1
+
+def test_unanswered_questions_are_not_indexed(store):
+    archive = ConversationArchive(store, terms=simple_terms)
+    store.add_message("s", "You", "A question that was cancelled")
+    converse(store, archive, "s", "Then this one", "And its answer")
+    store.flush()
+    (exchange,) = ConversationArchive(store, terms=simple_terms).exchanges
+    assert exchange["question"] == "Then this one"
+
+def test_deleting_a_conversation_drops_its_exchanges(store):
+    archive = ConversationArchive(store, terms=simple_terms)
+    converse(store, archive, "gone", "Forget this question", "Forgotten.")
+    converse(store, archive, "kept", "Keep this question", "Kept.")
+    store.delete_conversation("gone")
+    assert [e["session"] for e in ConversationArchive(store, terms=simple_terms).exchanges] == ["kept"]
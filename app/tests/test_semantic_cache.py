@@ -0,0 +1,60 @@
+import numpy as np
+import nlp
+from semantic_cache import HashingEmbedder, SemanticCache
+
+def make_cache(**kwargs):
+    return SemanticCache(embed=HashingEmbedder(), threshold=0.8, **kwargs)
+
+def test_near_duplicate_hits_and_unrelated_misses():
+    cache = make_cache()
+    cache.add("what is the capital of france", "Paris.")
+    answer, similarity = cache.lookup("What is the capital of France?")
+    assert answer == "Paris." and similarity > 0.99
+    assert cache.lookup("how do I bake sourdough bread") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_threshold_decides_between_hit_and_miss():
+    cache = make_cache()
+    cache.add("what is the capital of france", "Paris.")
+    cache.threshold = 0.0
+    similarity = cache.lookup("tell me the capital city of france")[1]
+    cache.threshold = similarity + 0.01
+    assert cache.lookup("tell me the capital city of france") is None
+    cache.threshold = similarity - 0.01
+    assert cache.lookup("tell me the capital city of france")[0] == "Paris."
+
+def test_least_recently_used_is_evicted_at_capacity(monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr("semantic_cache.time.time", lambda: next(clock))
+    cache = make_cache(capacity=2)
+    cache.add("first question about cats", "cats")
+    cache.add("second question about dogs", "dogs")
+    assert cache.lookup("first question about cats")[0] == "cats"  # now the most recently used
+    cache.add("third question about birds", "birds")
+    assert cache.size == 2
+    assert cache.lookup("second question about dogs") is None
+    assert cache.lookup("first question about cats")[0] == "cats"
+    assert cache.lookup("third question about birds")[0] == "birds"
+
+def test_reload_from_memmap_and_sidecar_gives_the_same_lookups(tmp_path):
+    path = str(tmp_path / "semantic")
+    cache = make_cache(path=path)
+    questions = ["what is the capital of france", "how tall is mount everest", "and tomorrow"]
+    for i, question in enumerate(questions):
+        cache.add(question, f"answer {i}", "weather\nSunny today." if i == 2 else "")
+    cache.save()
+    reloaded = make_cache(path=path)
+    assert isinstance(reloaded.vectors, np.memmap)
+    for question in questions + ["capital of france?"]:
+        for context in ("", "weather\nSunny today."):
+            assert reloaded.lookup(question, context) == cache.lookup(question, context)
+
+def test_follow_ups_only_match_within_the_same_previous_turn():
+    cache = make_cache()
+    weather = [{"role": "user", "content": "weather in Oslo?"}, {"role": "assistant", "content": "Rainy."}]
+    stocks = [{"role": "user", "content": "how is ACME stock?"}, {"role": "assistant", "content": "Up 2%."}]
+    question = {"role": "user", "content": "and tomorrow?"}
+    cache.add("and tomorrow?", "Sunny in Oslo.", nlp.previous_turn(weather + [question]))
+    assert cache.lookup("and tomorrow?", nlp.previous_turn(stocks + [question])) is None
+    assert cache.lookup("and tomorrow?", nlp.previous_turn([question])) is None
+    assert cache.lookup("and tomorrow?", nlp.previous_turn(weather + [question]))[0] == "Sunny in Oslo."
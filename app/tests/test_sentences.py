@@ -0,0 +1,49 @@
+import nlp
+from cache import ResponseCache
+from fake_llm import FakeGroq
+from tts import split_sentences
+
+def stream(text, size):
+    buffer = nlp.SentenceBuffer()
+    sentences = []
+    for i in range(0, len(text), size):
+        sentences.extend(buffer.feed(text[i:i + size]))
+    rest = buffer.flush()
+    return sentences + ([rest] if rest else [])
+
+def test_sentences_come_out_as_soon_as_they_end():
+    buffer = nlp.SentenceBuffer()
+    assert buffer.feed("Hello there") == []
+    assert buffer.feed(". How are") == ["Hello there."]
+    assert buffer.feed(" you? I'm") == ["How are you?"]
+    assert buffer.flush() == "I'm"
+    assert buffer.flush() == ""
+
+def test_chunking_does_not_change_the_sentences():
+    text = 'She said "Stop!" Then she left. Really? Yes (mostly). The end.'
+    expected = ['She said "Stop!"', "Then she left.", "Really?", "Yes (mostly).", "The end."]
+    for size in (1, 3, 7, len(text)):
+        assert stream(text, size) == expected
+
+def test_abbreviations_and_initials_do_not_split():
+    text = "Dr. Smith met J. R. Tolkien at St. Mary's, e.g. on a Tuesday. It went well."
+    assert stream(text, 4) == ["Dr. Smith met J. R. Tolkien at St. Mary's, e.g. on a Tuesday.", "It went well."]
+
+def test_lowercase_continuation_does_not_split():
+    assert stream("It costs approx. three dollars. Cheap.", 5) == ["It costs approx. three dollars.", "Cheap."]
+
+def test_list_numbers_stay_with_their_item():
+    assert split_sentences("Steps:\n1. Open it. 2. Close it.") == ["Steps:\n1. Open it.", "2. Close it."]
+
+def test_streamed_reply_is_spoken_sentence_by_sentence(monkeypatch):
+    # What the UI does with a reply: feed stream_response's deltas through a buffer as they arrive
+    monkeypatch.setattr(nlp, "semantic_cache", None)
+    monkeypatch.setattr(nlp, "response_cache", ResponseCache())
+    reply = "Mr. Jones is here. He brought 2.5 kg of apples! Shall I let him in?"
+    llm = FakeGroq(reply=reply, chunk_size=3, delay=0, first_token_delay=0)
+    buffer = nlp.SentenceBuffer()
+    spoken = []
+    for delta in nlp.stream_response("Who is at the door?", [], [], llm_client=llm):
+        spoken.extend(buffer.feed(delta))
+    assert spoken == ["Mr. Jones is here.", "He brought 2.5 kg of apples!"]
+    assert buffer.flush() == "Shall I let him in?"
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import time
+import pytest
+import nlp
+from server import ChatServer, FairScheduler
+
+class StubGateway:
+    # stream_chat yields `reply` word by word, `delay` seconds apart, or raises `error`
+    def __init__(self, reply="Hello there. Bye now.", delay=0.0, error=None):
+        self.reply = reply
+        self.delay = delay
+        self.error = error
+        self.started = self.cancelled = 0
+
+    async def stream_chat(self, messages, **params):
+        self.started += 1
+        if self.error is not None:
+            raise self.error
+        try:
+            for word in self.reply.split(" "):
+                await asyncio.sleep(self.delay)
+                yield word + " "
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+
+    def stats(self):
+        return {}
+
+@pytest.fixture(autouse=True)
+def no_response_cache(monkeypatch):
+    monkeypatch.setattr(nlp.response_cache, "enabled", False)
+    monkeypatch.setattr(nlp, "semantic_cache", None)
+
+def make_server(gateway, **kwargs):
+    return ChatServer(gateway, analyze=False, **kwargs)
+
+def test_connected_session_does_not_block_expiry():
+    server = make_server(StubGateway(), max_sessions=3, session_ttl=0.01)
+    try:
+        server.session("connected").connections = 1
+        server.session("idle-1")
+        server.session("idle-2")
+        time.sleep(0.02)
+        server.session("new-1")
+        server.session("new-2")
+        assert set(server.sessions) == {"connected", "new-1", "new-2"}
+    finally:
+        server.analyzer.close()
+
+def test_unexpected_errors_reach_the_client():
+    server = make_server(StubGateway(error=ValueError("boom")))
+    events = []
+
+    async def send(event):
+        events.append(event)
+
+    async def run():
+        await server.run_turn(server.session(), "hi", send)
+
+    try:
+        asyncio.run(run())
+    finally:
+        server.analyzer.close()
+    assert events[-1]["type"] == "error"
+    assert "boom" in events[-1]["message"]
+
+def test_reset_cancels_the_running_turn():
+    gateway = StubGateway(reply="one two three four five", delay=0.05)
+    server = make_server(gateway)
+    events = []
+
+    async def send(event):
+        events.append(event)
+
+    async def run():
+        server.scheduler.start()
+        session = server.session()
+        future = server.scheduler.submit(session.id, lambda: server.run_turn(session, "hi", send))
+        queued = server.scheduler.submit(session.id, lambda: server.run_turn(session, "again", send))
+        await asyncio.sleep(0.08)
+        server.scheduler.cancel_session(session.id)
+        session.memory.clear()
+        await asyncio.sleep(0.3)
+        await server.scheduler.stop()
+        return session, future, queued
+
+    try:
+        session, future, queued = asyncio.run(run())
+    finally:
+        server.analyzer.close()
+    assert future.cancelled() and queued.cancelled()
+    assert gateway.started == 1 and gateway.cancelled == 1
+    assert list(session.memory.context_messages()) == []
+    assert not any(event["type"] == "done" for event in events)
+
+def test_disconnect_cancels_the_sessions_turns():
+    from websockets.asyncio.client import connect
+    gateway = StubGateway(reply="one two three four five six", delay=0.05)
+    server = make_server(gateway)
+
+    async def run():
+        ready = asyncio.get_running_loop().create_future()
+        serving = asyncio.ensure_future(server.serve(port=0, ready=ready))
+        port = list((await ready).sockets)[0].getsockname()[1]
+        async with connect(f"ws://127.0.0.1:{port}/") as ws:
+            json.loads(await ws.recv())
+            for text in ("first", "second"):
+                await ws.send(json.dumps({"type": "message", "text": text}))
+            assert json.loads(await ws.recv())["type"] == "delta"
+        await asyncio.sleep(0.4)
+        queued = sum(len(q) for q in server.scheduler.queues.values())
+        serving.cancel()
+        await asyncio.gather(serving, return_exceptions=True)
+        return queued
+
+    assert asyncio.run(run()) == 0
+    assert gateway.started == 1 and gateway.cancelled == 1
+
+def test_a_sessions_jobs_run_one_at_a_time_in_order():
+    async def run():
+        scheduler = FairScheduler(max_concurrent=4)
+        scheduler.start()
+        running, peak, finished = [0], [0], []
+
+        def job(n):
+            async def run_job():
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+                await asyncio.sleep(0.02)
+                running[0] -= 1
+                finished.append(n)
+                return n
+            return run_job
+
+        futures = [scheduler.submit("one", job(n)) for n in range(4)]
+        results = await asyncio.gather(*futures)
+        await scheduler.stop()
+        return results, peak[0], finished
+
+    results, peak, finished = asyncio.run(run())
+    assert results == finished == [0, 1, 2, 3]
+    assert peak == 1
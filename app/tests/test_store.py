@@ -0,0 +1,43 @@
+import pytest
+from store import ConversationStore
+
+@pytest.fixture
+def store(tmp_path):
+    store = ConversationStore(str(tmp_path / "conversations.db"), batch_ms=0)
+    yield store
+    store.close()
+
+def test_conversations_page_newest_first(store):
+    for c in range(5):
+        store.add_message(f"c{c}", "You", f"Message in conversation {c}", timestamp=1000 + c)
+    store.flush()
+    first = store.conversations(limit=2)
+    assert [c["id"] for c in first] == ["c4", "c3"]
+    rest = store.conversations(limit=10, before=(first[-1]["updated"], first[-1]["id"]))
+    assert [c["id"] for c in rest] == ["c2", "c1", "c0"]
+
+def test_messages_oldest_first(store):
+    for i in range(4):
+        store.add_message("c", "You" if i % 2 == 0 else "Iris", f"m{i}")
+    store.flush()
+    assert [m["text"] for m in store.messages("c", limit=3)] == ["m1", "m2", "m3"]
+
+@pytest.mark.parametrize("fts", [True, False])
+def test_search(store, fts):
+    if fts and not store.fts:
+        pytest.skip("SQLite without FTS5")
+    store.fts = fts
+    store.add_message("c", "You", "Tell me about guitar poetry")
+    store.add_message("c", "Iris", "Poems about guitars are rare")
+    store.flush()
+    assert [r["sender"] for r in store.search("guitar poe")] == ["You"]
+
+def test_like_search_treats_wildcards_literally(store):
+    store.fts = False
+    for text in ("growth was 100% this year", "growth was 1000 units", "rename snake_case names",
+                 "snakeXcase is not it", "a back\\slash path"):
+        store.add_message("c", "You", text)
+    store.flush()
+    assert [r["snippet"] for r in store.search("100%")] == ["growth was 100% this year"]
+    assert [r["snippet"] for r in store.search("snake_case")] == ["rename snake_case names"]
+    assert [r["snippet"] for r in store.search("back\\slash")] == ["a back\\slash path"]
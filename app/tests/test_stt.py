@@ -0,0 +1,50 @@
+import time
+import pytest
+import stt
+
+def test_word_error_rate():
+    assert stt.word_error_rate("turn on the lights", "Turn on the lights.") == 0.0
+    assert stt.word_error_rate("turn on the lights", "turn off the lights") == 0.25  # one substitution
+    assert stt.word_error_rate("turn on the lights", "turn the lights") == 0.25  # one deletion
+    assert stt.word_error_rate("turn on the lights", "please turn on the lights now") == 0.5  # two insertions
+    assert stt.word_error_rate("what's up", "") == 1.0
+    assert stt.word_error_rate("", "") == 0.0
+    assert stt.word_error_rate("", "noise") == 1.0
+
+@pytest.fixture
+def worker():
+    backend = stt.get_backend("fake:open the pod bay doors", process=True)
+    yield backend
+    backend.close()
+
+def test_worker_process_transcribes(worker):
+    assert worker.name == "fake (worker process)"
+    assert worker.streaming
+    assert worker.transcribe(b"\0\0" * 1600, 16000) == "open the pod bay doors"
+    assert worker.transcribe(b"", 16000) == ""
+
+def test_worker_process_streams_partials(worker):
+    stream = worker.stream(16000)
+    partials = []
+    for _ in range(5):
+        partials.append(stream.accept(b"\0\0" * 160))
+        time.sleep(0.05)  # let the partial for this chunk arrive
+    partials.append(stream.accept(b"\0\0" * 160))
+    assert stream.finish() == "open the pod bay doors"
+    received = [p for p in partials if p]
+    # Partials grow a word per chunk and arrive without accept() ever waiting for them
+    assert received[-1] == "open the pod bay doors"
+    assert all("open the pod bay doors".startswith(p) for p in received)
+    assert len(received) >= 3
+    # The stream released the worker for the next request
+    assert worker.transcribe(b"\0\0", 16000) == "open the pod bay doors"
+
+def test_worker_process_shuts_down(worker):
+    worker.close()
+    assert not worker.process.is_alive()
+    with pytest.raises(Exception):
+        worker.transcribe(b"\0\0", 16000)
+
+def test_load_errors_come_back_from_the_worker():
+    with pytest.raises(Exception, match="Error loading nonsense: Unknown speech-to-text backend: nonsense"):
+        stt.ProcessBackend("nonsense")
@@ -0,0 +1,61 @@
+import json
+import pytest
+import os
+from tracing import Tracer, default_trace_path, format_stats
+
+def test_spans_are_aggregated_by_name():
+    tracer = Tracer()
+    turn = tracer.start_turn()
+    with tracer.activate(turn):
+        for _ in range(3):
+            with tracer.span("groq"):
+                pass
+    tracer.end_turn(turn)
+    stats = tracer.stats()
+    assert stats["groq"]["count"] == 3
+    assert stats["turn"]["count"] == 1
+    assert "groq" in format_stats(stats)
+
+def test_errors_are_recorded_and_raised():
+    tracer = Tracer()
+    with pytest.raises(ValueError):
+        with tracer.span("tts") as span:
+            raise ValueError("no voice")
+    assert span.error == "no voice"
+    assert span.as_otlp()["status"] == {"code": 2, "message": "no voice"}
+
+def test_exported_spans_share_the_turns_trace(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(str(path), batch_ms=10)
+    turn = tracer.start_turn("voice")
+    with tracer.activate(turn):
+        with tracer.span("analysis", words=4):
+            pass
+    tracer.end_turn(turn)
+    tracer.flush()
+    spans = [span for line in path.read_text().splitlines()
+             for span in json.loads(line)["resourceSpans"][0]["scopeSpans"][0]["spans"]]
+    assert {span["name"] for span in spans} == {"analysis", "turn"}
+    assert {span["traceId"] for span in spans} == {turn.trace_id}
+    analysis = next(span for span in spans if span["name"] == "analysis")
+    assert analysis["parentSpanId"] == turn.span_id
+    assert {"key": "words", "value": {"intValue": "4"}} in analysis["attributes"]
+
+def test_latency_panel_table_has_a_row_per_stage():
+    tracer = Tracer()
+    tracer.record("first_token", 0, 5_000_000)
+    tracer.record("tts.synthesize", 0, 20_000_000)
+    lines = format_stats(tracer.stats()).splitlines()
+    assert lines[0].split() == ["span", "count", "last", "p50", "p95", "p99"]
+    assert lines[1].split() == ["first_token", "1", "5.0", "5.0", "5.0", "5.0"]
+    assert lines[2].split()[0] == "tts.synthesize"
+
+def test_trace_path_from_environment(monkeypatch, tmp_path):
+    monkeypatch.delenv("IRIS_TRACE", raising=False)
+    assert default_trace_path() is None
+    monkeypatch.setenv("IRIS_TRACE", "1")
+    assert default_trace_path() == os.path.join(os.path.expanduser("~"), ".iris", "traces.jsonl")
+    monkeypatch.setenv("IRIS_TRACE", str(tmp_path / "spans.jsonl"))
+    assert default_trace_path() == str(tmp_path / "spans.jsonl")
+    monkeypatch.setenv("IRIS_TRACE", "off")
+    assert default_trace_path() is None
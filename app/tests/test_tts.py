@@ -0,0 +1,56 @@
+import threading
+import time
+import tts
+
+class RecordingPlayer(tts.NullPlayer):
+    # NullPlayer that notes what it played and how far each clip got
+    def __init__(self, chunk_ms=20):
+        super().__init__(chunk_ms)
+        self.started = threading.Event()
+        self.clips = []
+
+    def play(self, clip, stopped):
+        self.started.set()
+        start = time.perf_counter()
+        finished = super().play(clip, stopped)
+        self.clips.append((clip.duration, time.perf_counter() - start, finished))
+        return finished
+
+def make_pipeline(**kwargs):
+    player = RecordingPlayer()
+    return tts.TTSPipeline(tts.SilentSynthesizer(cost=0.0), player, **kwargs), player
+
+def test_sentences_play_in_order_and_the_pipeline_goes_idle():
+    pipeline, player = make_pipeline()
+    pipeline.speak("One. Two. Three.")
+    assert pipeline.speaking
+    assert pipeline.wait(10)
+    assert [finished for _, _, finished in player.clips] == [True, True, True]
+    assert pipeline.active == 0
+
+def test_interrupt_drops_queued_sentences_and_stops_within_a_chunk():
+    pipeline, player = make_pipeline()
+    pipeline.speak("This first sentence takes a while to say out loud. Second one. Third one. Fourth one.")
+    assert player.started.wait(5)
+    time.sleep(0.05)
+    stopped_at = time.perf_counter()
+    pipeline.interrupt()
+    assert pipeline.wait(1)
+    assert time.perf_counter() - stopped_at < 0.2
+    duration, played, finished = player.clips[0]
+    assert not finished and played < duration
+    assert len(player.clips) == 1  # nothing queued behind it was played
+    assert pipeline.active == 0
+
+def test_count_stays_exact_across_interrupts():
+    pipeline, player = make_pipeline(lookahead=2)
+    for _ in range(20):
+        pipeline.speak("A. B. C. D.")
+        time.sleep(0.01)
+        pipeline.interrupt()
+    assert pipeline.wait(5)
+    assert pipeline.active == 0
+    pipeline.speak("Still speaking.")
+    assert pipeline.speaking
+    assert pipeline.wait(5)
+    assert player.clips[-1][2]
@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+import pytest
+from video_cache import VideoCache, video_key
+from video_worker import VideoWorker
+
+def make_request(prompt="a cat", seed=0, **overrides):
+    request = {"prompt": prompt, "negative_prompt": "", "first_frame": None, "last_frame": None,
+               "height": 64, "width": 64, "num_frames": 17, "num_steps": 4, "guidance_scale": 5.0, "seed": seed}
+    request.update(overrides)
+    return request
+
+class FakeRender:
+    # Stands in for wan.render_video: steps through num_steps, pausing while `gate` is clear
+    def __init__(self):
+        self.gate = threading.Event()
+        self.gate.set()
+        self.prompts = []
+
+    def __call__(self, pipe, request, path, on_step, timings, on_preview):
+        self.prompts.append(request["prompt"])
+        for step in range(1, request["num_steps"] + 1):
+            self.gate.wait(5)
+            on_step(step, request["num_steps"])
+        with open(path, "wb") as f:
+            f.write(request["prompt"].encode("utf-8"))
+
+@pytest.fixture
+def render():
+    return FakeRender()
+
+def start_worker(tmp_path, render, cache=True, **kwargs):
+    cache = VideoCache(str(tmp_path / "cache")) if cache else False
+    worker = VideoWorker(output_dir=str(tmp_path / "out"), cache=cache, previews=0, load=lambda: object(),
+                         render=render, **kwargs).start()
+    worker.ready.wait(5)
+    return worker
+
+def test_identical_requests_share_one_render(tmp_path, render):
+    render.gate.clear()
+    worker = start_worker(tmp_path, render)
+    first = worker.submit(make_request())
+    second = worker.submit(make_request(prompt="  a   cat "))
+    other = worker.submit(make_request(seed=1))
+    assert first is second and other is not first
+    render.gate.set()
+    assert first.wait(5) == "done" and other.wait(5) == "done"
+    assert render.prompts == ["a cat", "a cat"]
+    assert worker.stats()["deduplicated"] == 1
+
+def test_finished_videos_are_answered_from_the_cache(tmp_path, render):
+    worker = start_worker(tmp_path, render)
+    first = worker.submit(make_request())
+    first.wait(5)
+    again = worker.submit(make_request())
+    assert again.status == "done" and again.cached
+    assert again.video_path == first.video_path
+    assert len(render.prompts) == 1
+
+def test_priorities_and_positions(tmp_path, render):
+    render.gate.clear()
+    worker = start_worker(tmp_path, render)
+    running = worker.submit(make_request("running"))
+    while running.status != "running":
+        time.sleep(0.01)
+    low = worker.submit(make_request("low"), "low")
+    normal = worker.submit(make_request("normal"))
+    high = worker.submit(make_request("high"), "high")
+    assert [worker.status(job.id)["position"] for job in (high, normal, low)] == [0, 1, 2]
+    render.gate.set()
+    low.wait(5)
+    assert render.prompts == ["running", "high", "normal", "low"]
+
+def test_cancel_queued_and_running(tmp_path, render):
+    render.gate.clear()
+    worker = start_worker(tmp_path, render)
+    running = worker.submit(make_request("running"))
+    queued = worker.submit(make_request("queued"))
+    while running.status != "running":
+        time.sleep(0.01)
+    assert worker.cancel(queued.id)
+    assert queued.status == "cancelled"
+    assert worker.cancel(running.id)
+    render.gate.set()
+    assert running.wait(5) == "cancelled"
+    assert render.prompts == ["running"]
+    assert not worker.cancel(running.id)
+
+def test_shared_job_runs_until_its_last_client_cancels(tmp_path, render):
+    render.gate.clear()
+    worker = start_worker(tmp_path, render)
+    job = worker.submit(make_request())
+    assert worker.submit(make_request()) is job
+    worker.cancel(job.id)
+    assert job.status == "queued"
+    worker.cancel(job.id)
+    assert job.status == "cancelled"
+
+def test_finished_jobs_are_forgotten(tmp_path, render):
+    worker = start_worker(tmp_path, render, cache=False, max_finished=2)
+    jobs = [worker.submit(make_request(f"video {i}")) for i in range(4)]
+    for job in jobs:
+        job.wait(5)
+    assert [worker.job(job.id) is not None for job in jobs] == [False, False, True, True]
+    assert worker.stats()["finished"] == 2
+    # Without a cache the worker owns the files, so forgotten jobs take theirs along
+    assert sorted(p.name for p in (tmp_path / "out").iterdir()) == sorted(f"{job.id}.mp4" for job in jobs[2:])
+
+def test_finished_jobs_expire(tmp_path, render):
+    worker = start_worker(tmp_path, render, keep_finished_s=0.05)
+    first = worker.submit(make_request("first"))
+    first.wait(5)
+    time.sleep(0.1)
+    worker.submit(make_request("second")).wait(5)
+    assert worker.job(first.id) is None
+
+def test_load_keeps_partial_renders_in_progress(tmp_path):
+    directory = tmp_path / "cache"
+    directory.mkdir()
+    (directory / "partial-live.mp4").write_bytes(b"rendering")
+    stale = directory / "partial-crashed.mp4"
+    stale.write_bytes(b"abandoned")
+    old = time.time() - 7200
+    os.utime(stale, (old, old))
+    VideoCache(str(directory))
+    assert sorted(os.listdir(directory)) == ["partial-live.mp4"]
+
+def test_key_covers_fps_and_pipeline_settings():
+    request = make_request()
+    key = video_key("tiny", request, {"dtype": "float32"})
+    assert video_key("tiny", dict(request, fps=16), {"dtype": "float32"}) == key
+    assert video_key("tiny", dict(request, fps=24), {"dtype": "float32"}) != key
+    assert video_key("tiny", request, {"dtype": "bfloat16"}) != key
+    assert video_key("tiny", request, {"dtype": "float32", "compile": True}) != key
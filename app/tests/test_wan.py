@@ -0,0 +1,197 @@
+import numpy as np
+import PIL.Image
+import pytest
+import wan
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("diffusers")
+
+@pytest.fixture(scope="module")
+def vae():
+    return wan.tiny_pipeline().vae
+
+def latents(frames=3):
+    torch.manual_seed(0)
+    return torch.randn(1, 16, frames, 8, 8)
+
+def test_streamed_decoding_matches_whole_decode(vae, monkeypatch):
+    assert wan.streams_decoding(vae)
+    streamed = np.concatenate(list(wan.decode_frames(vae, latents())))
+    monkeypatch.setattr(wan, "streams_decoding", lambda vae: False)
+    whole = np.concatenate(list(wan.decode_frames(vae, latents())))
+    assert streamed.shape == whole.shape == (9, 64, 64, 3)
+    assert np.abs(streamed.astype(int) - whole.astype(int)).max() <= 1
+
+class PlainVAE:
+    # Only the public face of AutoencoderKLWan, as if a diffusers release renamed its internals
+    def __init__(self, vae):
+        self.vae = vae
+        self.config = vae.config
+        self.dtype = vae.dtype
+        self.use_tiling = False
+
+    def decode(self, latents, return_dict=False):
+        return self.vae.decode(latents, return_dict=return_dict)
+
+def test_vae_without_the_private_cache_decodes_whole(vae):
+    plain = PlainVAE(vae)
+    assert not wan.streams_decoding(plain)
+    frames = np.concatenate(list(wan.decode_frames(plain, latents(2))))
+    streamed = np.concatenate(list(wan.decode_frames(vae, latents(2))))
+    assert frames.shape == (5, 64, 64, 3)
+    assert np.abs(frames.astype(int) - streamed.astype(int)).max() <= 1
+
+def keyframes():
+    return PIL.Image.effect_noise((80, 48), 64).convert("RGB"), PIL.Image.effect_noise((80, 48), 32).convert("RGB")
+
+def test_prepared_tensors_match_stock_preprocessing():
+    from diffusers.video_processor import VideoProcessor
+    stock = VideoProcessor(vae_scale_factor=8)
+    fast = wan.PreparedVideoProcessor(VideoProcessor(vae_scale_factor=8))
+    first, last = keyframes()
+    frames, masks = wan.prepare_video_and_mask(first, last, 32, 64, 9)
+    video, mask = wan.prepare_video_tensors(first, last, 32, 64, 9)
+    expected_video = stock.preprocess_video(frames, 32, 64).float()
+    expected_mask = torch.clamp((stock.preprocess_video(masks, 32, 64) + 1) / 2, min=0, max=1)
+    actual_video = fast.preprocess_video(video, 32, 64)
+    actual_mask = torch.clamp((fast.preprocess_video(mask, 32, 64) + 1) / 2, min=0, max=1)
+    assert actual_video.shape == expected_video.shape
+    assert (actual_video - expected_video).abs().max() <= 3e-7
+    assert actual_mask.shape[2:] == expected_mask.shape[2:]
+    assert torch.equal(actual_mask.expand(expected_mask.shape), expected_mask)
+
+def test_bare_tensors_get_the_stock_preprocessing():
+    from diffusers.video_processor import VideoProcessor
+    stock = VideoProcessor(vae_scale_factor=8)
+    fast = wan.PreparedVideoProcessor(VideoProcessor(vae_scale_factor=8))
+    video, _ = wan.prepare_video_tensors(*keyframes(), 32, 64, 5)
+    copy = (video.tensor + 1) / 2  # a plain [0, 1] tensor, as the stock processor expects
+    assert torch.equal(fast.preprocess_video(copy, 32, 64), stock.preprocess_video(copy, 32, 64))
+    assert fast.get_default_height_width(video[0]) == (32, 64)
+
+@pytest.fixture
+def hardware(monkeypatch):
+    # What the device probes report: set the attributes to simulate a machine
+    monkeypatch.delenv("IRIS_VIDEO_DEVICE", raising=False)
+    monkeypatch.delenv("IRIS_VIDEO_DTYPE", raising=False)
+    monkeypatch.delenv("IRIS_VIDEO_OFFLOAD", raising=False)
+    machine = type("Machine", (), {"cuda": False, "mps": False, "bf16": False, "gpu_gb": 80})()
+    monkeypatch.setattr(torch.cuda, "is_available", lambda: machine.cuda)
+    monkeypatch.setattr(torch.backends.mps, "is_available", lambda: machine.mps)
+    monkeypatch.setattr(torch.cuda, "get_device_properties",
+                        lambda index: type("Properties", (), {"total_memory": machine.gpu_gb * 2 ** 30})())
+
+    class Mkldnn:
+        @staticmethod
+        def _is_mkldnn_bf16_supported():
+            return machine.bf16
+
+    monkeypatch.setattr(torch, "ops", type("Ops", (), {"mkldnn": Mkldnn})())
+    return machine
+
+def test_device_fallback_order(hardware):
+    assert wan.select_device() == "cpu"
+    hardware.mps = True
+    assert wan.select_device() == "mps"
+    hardware.cuda = True
+    assert wan.select_device() == "cuda"
+
+def test_device_override(hardware, monkeypatch):
+    hardware.cuda = True
+    monkeypatch.setenv("IRIS_VIDEO_DEVICE", "cpu")
+    assert wan.select_device() == "cpu"
+    assert wan.select_device("mps") == "mps"  # an explicit argument wins over the environment
+    hardware.cuda = False
+    with pytest.raises(Exception, match="no CUDA device"):
+        wan.select_device("cuda")
+
+def test_cpu_transformer_is_fp32_without_native_bf16(hardware, monkeypatch):
+    assert wan.select_dtype("cpu") == torch.float32
+    hardware.bf16 = True
+    assert wan.select_dtype("cpu") == torch.bfloat16
+    assert wan.select_dtype("cuda") == torch.bfloat16
+    monkeypatch.setenv("IRIS_VIDEO_DTYPE", "fp32")
+    assert wan.select_dtype("cuda") == torch.float32
+    assert wan.pipeline_settings(tiny=True, device="cpu")["dtype"] == "float32"
+
+class RecordingPipe:
+    def __init__(self):
+        self.calls = []
+
+    def to(self, device):
+        self.calls.append(("to", device))
+
+    def enable_model_cpu_offload(self):
+        self.calls.append(("offload",))
+
+@pytest.mark.parametrize("gpu_gb, offload, env, expected", [
+    (80, None, None, [("to", "cuda")]),
+    (16, None, None, [("offload",)]),
+    (80, None, "1", [("offload",)]),
+    (16, False, None, [("to", "cuda")]),
+    (80, True, None, [("offload",)]),
+])
+def test_offload_and_moving_to_the_gpu_are_never_both_done(hardware, monkeypatch, gpu_gb, offload, env, expected):
+    hardware.cuda = True
+    hardware.gpu_gb = gpu_gb
+    if env:
+        monkeypatch.setenv("IRIS_VIDEO_OFFLOAD", env)
+    pipe = RecordingPipe()
+    assert wan.place_pipeline(pipe, "cuda", offload) == (expected == [("offload",)])
+    assert pipe.calls == expected
+
+def test_other_devices_just_move_the_pipeline(hardware):
+    pipe = RecordingPipe()
+    assert wan.place_pipeline(pipe, "cpu", offload=True) is False
+    assert pipe.calls == [("to", "cpu")]
+
+class StubTextPipe:
+    # Just enough of a pipeline for PromptCache: an "encoder" that records what it was asked to encode
+    _execution_device = "cpu"
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode_prompt(self, prompt, do_classifier_free_guidance=False, device=None, max_sequence_length=512):
+        self.encoded.append(prompt)
+        return torch.full((1, 4, 8), float(len(prompt))), None
+
+def test_prompt_cache_counts_hits_and_misses():
+    pipe = StubTextPipe()
+    cache = wan.PromptCache(pipe)
+    first, saved = cache.embed("a small  blue bird")
+    again, again_saved = cache.embed("a small blue bird")  # same prompt once whitespace is collapsed
+    assert saved == 0.0 and again_saved >= 0.0
+    assert torch.equal(first, again)
+    cache.embed("a red fox")
+    assert pipe.encoded == ["a small blue bird", "a red fox"]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 2)
+    assert stats["hit_rate"] == pytest.approx(1 / 3)
+
+def test_prompt_cache_evicts_the_least_recently_used():
+    pipe = StubTextPipe()
+    cache = wan.PromptCache(pipe)
+    for i in range(32):
+        cache.embed(f"prompt {i}")
+    cache.embed("prompt 0")  # now the most recently used
+    cache.embed("prompt 32")
+    assert cache.stats()["entries"] == 32
+    cache.embed("prompt 0")
+    assert "prompt 0" not in pipe.encoded[1:]
+    cache.embed("prompt 1")
+    assert pipe.encoded.count("prompt 1") == 2  # evicted, so encoded again
+
+def test_negative_prompt_is_only_encoded_with_guidance():
+    pipe = StubTextPipe()
+    pipe.prompt_cache = wan.PromptCache(pipe)
+    prompts, _ = wan.prompt_inputs(pipe, "a bird", "blurry", guidance_scale=1.0)
+    assert set(prompts) == {"prompt_embeds"}
+    assert pipe.encoded == ["a bird"]
+    prompts, _ = wan.prompt_inputs(pipe, "a bird", "blurry", guidance_scale=5.0)
+    assert set(prompts) == {"prompt_embeds", "negative_prompt_embeds"}
+    assert pipe.encoded == ["a bird", "blurry"]
+
+def test_without_a_cache_the_pipeline_gets_the_text():
+    assert wan.prompt_inputs(object(), "a bird", "blurry", 5.0) == (
+        {"prompt": "a bird", "negative_prompt": "blurry"}, 0.0)
@@ -0,0 +1,45 @@
+import threading
+import pytest
+from workers import JobCancelled, PoolBusy, WorkerPool
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(max_workers=1, max_pending=2)
+    yield pool
+    pool.shutdown()
+
+def test_resubmitting_a_key_cancels_the_stale_job(pool):
+    started, release = threading.Event(), threading.Event()
+    results = []
+
+    def slow(job):
+        started.set()
+        release.wait(5)
+        job.check()
+        return "stale"
+
+    stale = pool.submit("turn", slow, on_result=results.append)
+    started.wait(5)
+    fresh = pool.submit("turn", lambda job: "fresh", on_result=results.append)
+    assert stale.cancelled and not fresh.cancelled
+    release.set()
+    fresh.future.result(5)
+    assert results == ["fresh"]
+
+def test_cancelled_job_raises_when_it_checks(pool):
+    job = pool.submit("turn", lambda job: None)
+    job.future.result(5)
+    job.cancel()
+    with pytest.raises(JobCancelled):
+        job.check()
+
+def test_full_pool_raises_pool_busy(pool):
+    release = threading.Event()
+    jobs = [pool.submit(f"job {i}", lambda job: release.wait(5)) for i in range(2)]
+    with pytest.raises(PoolBusy):
+        pool.submit("one more", lambda job: None)
+    release.set()
+    for job in jobs:
+        job.future.result(5)
+    # Finished jobs free their slots
+    pool.submit("after", lambda job: None, block=True, timeout=5).future.result(5)
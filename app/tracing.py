@@ -0,0 +1,236 @@
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Spans for each stage of a conversation turn (analysis, spaCy, the LLM call, speech synthesis and
+# recognition), all sharing the turn's trace ID. Durations are aggregated in memory for the latency
+# panel; with IRIS_TRACE set, spans are also appended to a JSONL file in the OTLP/JSON format, one
+# export request per line, which the OpenTelemetry collector's otlpjsonfile receiver can read.
+
+# perf_counter_ns + this offset gives Unix time in nanoseconds
+EPOCH_OFFSET_NS = time.time_ns() - time.perf_counter_ns()
+
+def default_trace_path():
+    # IRIS_TRACE=1 writes ~/.iris/traces.jsonl, any other value is the file to write; unset or off
+    # keeps spans in memory only
+    value = os.environ.get("IRIS_TRACE", "")
+    if value in ("", "0", "off"):
+        return None
+    if value in ("1", "on"):
+        return os.path.join(os.path.expanduser("~"), ".iris", "traces.jsonl")
+    return value
+
+def new_id(size):
+    return os.urandom(size).hex()
+
+class Turn:
+    # One user message, from the moment it was typed or spoken until Iris finishes answering
+    def __init__(self, source="text"):
+        self.trace_id = new_id(16)
+        self.span_id = new_id(8)
+        self.source = source
+        self.start_ns = time.perf_counter_ns()
+
+current_turn = contextvars.ContextVar("iris_turn", default=None)
+
+def otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+class Span:
+    def __init__(self, name, turn, start_ns=None, **attributes):
+        self.name = name
+        self.turn = turn
+        self.span_id = new_id(8)
+        self.start_ns = time.perf_counter_ns() if start_ns is None else start_ns
+        self.end_ns = None
+        self.attributes = attributes
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    @property
+    def duration_ms(self):
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def as_otlp(self):
+        span = {
+            "traceId": self.turn.trace_id if self.turn else new_id(16),
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns + EPOCH_OFFSET_NS),
+            "endTimeUnixNano": str(self.end_ns + EPOCH_OFFSET_NS),
+            "attributes": [{"key": k, "value": otlp_value(v)} for k, v in self.attributes.items() if v is not None],
+            "status": {"code": 2, "message": self.error} if self.error else {},
+        }
+        if self.turn is not None and self.span_id != self.turn.span_id:
+            span["parentSpanId"] = self.turn.span_id
+        return span
+
+class SpanStats:
+    # Recent durations of one span name, for percentiles (as gateway.LatencyHistogram keeps them)
+    def __init__(self, window=500):
+        self.count = 0
+        self.samples = deque(maxlen=window)
+
+    def record(self, ms):
+        self.count += 1
+        self.samples.append(ms)
+
+    def percentile(self, p):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "last": self.samples[-1] if self.samples else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+class Tracer:
+    # Finished spans are aggregated right away and, when there is a file, written by a background
+    # thread in batches so no traced code ever waits on the disk
+    def __init__(self, path=None, window=500, batch_ms=500):
+        self.path = path
+        self.window = window
+        self.batch_ms = batch_ms
+        self.stats_by_name = {}
+        self.lock = threading.Lock()
+        self.exported = 0
+        self.spans = queue.Queue()
+        self.writer = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.writer = threading.Thread(target=self._write_loop, name="iris-trace", daemon=True)
+            self.writer.start()
+
+    def start_turn(self, source="text"):
+        return Turn(source)
+
+    @contextmanager
+    def activate(self, turn):
+        # Spans opened in this thread (and this context) while active belong to `turn`
+        token = current_turn.set(turn)
+        try:
+            yield turn
+        finally:
+            current_turn.reset(token)
+
+    def end_turn(self, turn, error=None, **attributes):
+        root = Span("turn", turn, turn.start_ns, source=turn.source, **attributes)
+        root.span_id = turn.span_id
+        root.error = error
+        self.finish(root)
+
+    @contextmanager
+    def span(self, name, turn=None, **attributes):
+        span = Span(name, turn or current_turn.get(), **attributes)
+        try:
+            yield span
+        except BaseException as e:
+            if not isinstance(e, GeneratorExit):
+                span.error = str(e) or type(e).__name__
+            raise
+        finally:
+            self.finish(span)
+
+    def record(self, name, start_ns, end_ns=None, turn=None, **attributes):
+        # A span for an interval measured elsewhere, e.g. time spent in a queue
+        span = Span(name, turn or current_turn.get(), start_ns, **attributes)
+        span.end_ns = end_ns
+        self.finish(span)
+
+    def finish(self, span):
+        if span.end_ns is None:
+            span.end_ns = time.perf_counter_ns()
+        with self.lock:
+            stats = self.stats_by_name.get(span.name)
+            if stats is None:
+                stats = self.stats_by_name[span.name] = SpanStats(self.window)
+            stats.record(span.duration_ms)
+        if self.writer is not None:
+            self.spans.put(span)
+
+    def stats(self):
+        with self.lock:
+            return {name: stats.snapshot() for name, stats in sorted(self.stats_by_name.items())}
+
+    def flush(self):
+        # Blocks until every finished span is written
+        if self.writer is not None:
+            self.spans.join()
+
+    def _write_loop(self):
+        while True:
+            batch = [self.spans.get()]
+            deadline = time.monotonic() + self.batch_ms / 1000
+            while len(batch) < 1000:
+                try:
+                    batch.append(self.spans.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            request = {"resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "iris"}}]},
+                "scopeSpans": [{"scope": {"name": "iris"}, "spans": [span.as_otlp() for span in batch]}],
+            }]}
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(request) + "\n")
+                self.exported += len(batch)
+            except OSError as e:
+                print(f"Error writing traces: {str(e)}")
+            finally:
+                for _ in batch:
+                    self.spans.task_done()
+
+tracer = Tracer(default_trace_path())
+
+def span(name, **attributes):
+    return tracer.span(name, **attributes)
+
+def format_stats(stats):
+    # Fixed-width table for the latency panel and the console
+    def ms(value):
+        return f"{value:8.1f}" if value is not None else f"{'-':>8}"
+    lines = [f"{'span':<20} {'count':>6} {'last':>8} {'p50':>8} {'p95':>8} {'p99':>8}"]
+    for name, s in stats.items():
+        lines.append(f"{name:<20} {s['count']:>6} {ms(s['last'])} {ms(s['p50'])} {ms(s['p95'])} {ms(s['p99'])}")
+    return "\n".join(lines)
+
+def benchmark(spans=100000):
+    # Overhead of one traced span, in memory only and exporting to a file
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        for label, path in (("in memory", None), ("exported", os.path.join(directory, "traces.jsonl"))):
+            bench = Tracer(path)
+            turn = bench.start_turn()
+            start = time.perf_counter()
+            with bench.activate(turn):
+                for i in range(spans):
+                    with bench.span("bench", i=i):
+                        pass
+            elapsed = time.perf_counter() - start
+            bench.flush()
+            print(f"{label:<10} {elapsed * 1e6 / spans:6.2f} us/span")
+        print(format_stats(bench.stats()))
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,364 @@
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+from collections import deque
+from io import BytesIO
+import nlp
+import tracing
+
+# Text-to-speech for SpeechHandler. Replies are split into sentences; sentence N+1 is synthesized
+# into memory while sentence N plays, and playback stops within one chunk when interrupted.
+# IRIS_TTS picks the synthesizer:
+#   pyttsx3          the platform engine through pyttsx3's save_to_file (the default)
+#   espeak[:voice]   espeak-ng/espeak writing WAV to stdout
+#   silent           silence of the right length, for headless runs and benchmarks
+# IRIS_TTS_OUTPUT=null discards audio (in real time) instead of playing it through PyAudio.
+
+class Clip:
+    # Synthesized audio: raw PCM (any bytes-like buffer) and its format
+    def __init__(self, pcm, sample_rate, sample_width=2, channels=1):
+        self.pcm = pcm
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.channels = channels
+
+    @property
+    def duration(self):
+        return len(self.pcm) / (self.sample_rate * self.sample_width * self.channels)
+
+    @classmethod
+    def from_wav(cls, data):
+        with wave.open(BytesIO(data), "rb") as wav:
+            # espeak's stdout header has no real length, so read whatever frames are there
+            pcm = wav.readframes(max(wav.getnframes(), len(data)))
+            return cls(pcm, wav.getframerate(), wav.getsampwidth(), wav.getnchannels())
+
+class Synthesizer:
+    name = "base"
+
+    def __init__(self, voice=None, rate=150, volume=0.8):
+        self.voice = voice
+        self.rate = rate
+        self.volume = volume
+        self.lock = threading.Lock()
+
+    def settings(self):
+        return (self.voice, self.rate, self.volume)
+
+    def voices(self):
+        # Voice ids, male first, then female
+        return []
+
+    def synthesize(self, text):
+        raise NotImplementedError
+
+class Pyttsx3Synthesizer(Synthesizer):
+    name = "pyttsx3"
+
+    def __init__(self, voice=None, rate=150, volume=0.8):
+        super().__init__(voice, rate, volume)
+        self._engine = None
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            import pyttsx3
+            self._engine = pyttsx3.init()
+        return self._engine
+
+    def voices(self):
+        with self.lock:
+            return [voice.id for voice in self.engine.getProperty('voices')]
+
+    def synthesize(self, text):
+        fd, path = tempfile.mkstemp(suffix=".wav", prefix="iris-tts-")
+        os.close(fd)
+        try:
+            with self.lock:
+                engine = self.engine
+                if self.voice is not None:
+                    engine.setProperty('voice', self.voice)
+                engine.setProperty('rate', self.rate)
+                engine.setProperty('volume', self.volume)
+                engine.save_to_file(text, path)
+                engine.runAndWait()
+            with open(path, "rb") as f:
+                return Clip.from_wav(f.read())
+        finally:
+            os.remove(path)
+
+class EspeakSynthesizer(Synthesizer):
+    name = "espeak"
+
+    def __init__(self, voice=None, rate=150, volume=0.8):
+        super().__init__(voice or "en", rate, volume)
+        self.executable = shutil.which("espeak-ng") or shutil.which("espeak")
+        if self.executable is None:
+            raise Exception("espeak-ng or espeak is not installed")
+
+    def voices(self):
+        base = self.voice.split("+")[0]
+        return [f"{base}+m3", f"{base}+f3"]
+
+    def synthesize(self, text):
+        with self.lock:
+            command = [self.executable, "--stdout", "-v", self.voice, "-s", str(int(self.rate)),
+                       "-a", str(int(self.volume * 100)), text]
+        result = subprocess.run(command, capture_output=True, timeout=60)
+        if result.returncode != 0:
+            raise Exception(result.stderr.decode(errors="replace").strip() or "espeak failed")
+        return Clip.from_wav(result.stdout)
+
+class SilentSynthesizer(Synthesizer):
+    # Silence as long as the text would take to say; `cost` simulates synthesis time as a fraction
+    # of that duration
+    name = "silent"
+
+    def __init__(self, voice=None, rate=150, volume=0.8, sample_rate=16000, cost=0.1):
+        super().__init__(voice or "silent", rate, volume)
+        self.sample_rate = sample_rate
+        self.cost = cost
+
+    def voices(self):
+        return ["silent-male", "silent-female"]
+
+    def synthesize(self, text):
+        seconds = max(0.2, len(text.split()) / self.rate * 60)
+        time.sleep(seconds * self.cost)
+        return Clip(bytes(int(seconds * self.sample_rate) * 2), self.sample_rate)
+
+SYNTHESIZERS = {"pyttsx3": Pyttsx3Synthesizer, "espeak": EspeakSynthesizer, "silent": SilentSynthesizer}
+
+def create_synthesizer(spec=None):
+    spec = spec or os.environ.get("IRIS_TTS", "pyttsx3")
+    name, _, voice = spec.partition(":")
+    if name not in SYNTHESIZERS:
+        raise Exception(f"Unknown text-to-speech engine: {name}")
+    return SYNTHESIZERS[name](voice or None)
+
+class PyAudioPlayer:
+    # Writes PCM in short chunks so a stop request takes effect within `chunk_ms`
+    def __init__(self, chunk_ms=50):
+        self.chunk_ms = chunk_ms
+        self.audio = None
+        self.stream = None
+        self.format = None
+
+    def _open(self, clip):
+        fmt = (clip.sample_rate, clip.sample_width, clip.channels)
+        if self.stream is not None and fmt == self.format:
+            return self.stream
+        import pyaudio
+        if self.audio is None:
+            self.audio = pyaudio.PyAudio()
+        if self.stream is not None:
+            self.stream.close()
+        self.stream = self.audio.open(format=self.audio.get_format_from_width(clip.sample_width),
+                                      channels=clip.channels, rate=clip.sample_rate, output=True)
+        self.format = fmt
+        return self.stream
+
+    def play(self, clip, stopped):
+        stream = self._open(clip)
+        step = clip.sample_rate * clip.sample_width * clip.channels * self.chunk_ms // 1000
+        pcm = memoryview(clip.pcm)
+        for i in range(0, len(pcm), step):
+            if stopped():
+                return False
+            stream.write(bytes(pcm[i:i + step]))
+        return True
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+        if self.audio is not None:
+            self.audio.terminate()
+        self.stream = self.audio = None
+
+class NullPlayer:
+    # Takes as long as real playback would, without a sound device
+    def __init__(self, chunk_ms=50):
+        self.chunk_ms = chunk_ms
+        self.played = 0.0
+
+    def play(self, clip, stopped):
+        remaining = clip.duration
+        while remaining > 0:
+            if stopped():
+                return False
+            step = min(remaining, self.chunk_ms / 1000)
+            time.sleep(step)
+            remaining -= step
+            self.played += step
+        return True
+
+    def close(self):
+        pass
+
+def create_player(synthesizer=None):
+    if os.environ.get("IRIS_TTS_OUTPUT") == "null" or isinstance(synthesizer, SilentSynthesizer):
+        return NullPlayer()
+    return PyAudioPlayer()
+
+def split_sentences(text):
+    sentences = nlp.SentenceBuffer()
+    chunks = sentences.feed(text)
+    rest = sentences.flush()
+    return chunks + [rest] if rest else chunks
+
+class TTSPipeline:
+    # Two threads: one synthesizes queued sentences up to `lookahead` clips ahead, the other plays
+    # them. interrupt() drops everything queued and cuts off the clip that is playing.
+    def __init__(self, synthesizer, player, lookahead=1, on_first_audio=None, cache=None):
+        self.synthesizer = synthesizer
+        self.player = player
+        self.cache = cache  # an audio_cache.AudioCache; hits skip synthesis
+        self.on_first_audio = on_first_audio
+        self.pending = queue.Queue()  # (generation, text, started, queued_ns, turn)
+        self.ready = queue.Queue(maxsize=lookahead)  # (generation, clip, started, turn)
+        self.generation = 0
+        self.active = 0  # sentences queued, being synthesized or playing
+        self.active_lock = threading.Lock()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.first_audio_ms = deque(maxlen=100)
+        self.threads = [
+            threading.Thread(target=self._synthesize_loop, name="iris-tts-synth", daemon=True),
+            threading.Thread(target=self._play_loop, name="iris-tts-play", daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    @property
+    def speaking(self):
+        return not self.idle.is_set()
+
+    def speak(self, text, started=None, split=True):
+        # Time to first audio is measured when this starts speech from silence, from `started` (a
+        # perf_counter time, default now), e.g. when the user sent the message
+        chunks = split_sentences(text) if split else [text.strip()] if text.strip() else []
+        if not chunks:
+            return
+        started = time.perf_counter() if started is None else started
+        with self.active_lock:
+            if self.active:
+                started = None
+            self.active += len(chunks)
+            self.idle.clear()
+            generation = self.generation
+        # Spans for the queue wait and synthesis belong to the turn that asked for the speech
+        turn = tracing.current_turn.get()
+        queued_ns = time.perf_counter_ns()
+        for i, chunk in enumerate(chunks):
+            self.pending.put((generation, chunk, started if i == 0 else None, queued_ns, turn))
+
+    def interrupt(self):
+        with self.active_lock:
+            self.generation += 1
+            for q in (self.pending, self.ready):
+                with q.mutex:
+                    self.active -= len(q.queue)
+                    q.queue.clear()
+                    q.not_full.notify_all()
+            self._settle()
+
+    def wait(self, timeout=None):
+        return self.idle.wait(timeout)
+
+    def _done(self):
+        with self.active_lock:
+            self.active -= 1
+            self._settle()
+
+    def _settle(self):
+        # Every sentence is counted once: interrupt() takes the queued ones, and each one a thread
+        # has taken off a queue calls _done, so this never goes below zero
+        if self.active == 0:
+            self.idle.set()
+
+    def _stale(self, generation):
+        return generation != self.generation
+
+    def _synthesize_loop(self):
+        while True:
+            generation, text, started, queued_ns, turn = self.pending.get()
+            if self._stale(generation):
+                self._done()
+                continue
+            tracing.tracer.record("tts.queue_wait", queued_ns, turn=turn)
+            try:
+                with tracing.tracer.span("tts.synthesize", turn=turn, chars=len(text)) as span:
+                    clip, cached = self._render(text)
+                    span.set(cached=cached)
+            except Exception as e:
+                print(f"Error in text-to-speech: {str(e)}")
+                self._done()
+                continue
+            if self._stale(generation):
+                self._done()
+                continue
+            self.ready.put((generation, clip, started, turn))
+
+    def _render(self, text):
+        # Returns (clip, whether it came from the cache)
+        if self.cache is None:
+            return self.synthesizer.synthesize(text), False
+        with self.synthesizer.lock:
+            key = self.cache.key(self.synthesizer.name, text, *self.synthesizer.settings())
+        clip = self.cache.get(key)
+        if clip is not None:
+            return clip, True
+        clip = self.synthesizer.synthesize(text)
+        try:
+            self.cache.put(key, clip)
+        except Exception as e:
+            print(f"Error caching speech: {str(e)}")
+        return clip, False
+
+    def _play_loop(self):
+        while True:
+            generation, clip, started, turn = self.ready.get()
+            if not self._stale(generation):
+                if started is not None:
+                    elapsed = (time.perf_counter() - started) * 1000
+                    tracing.tracer.record("tts.first_audio", int(started * 1e9), turn=turn)
+                    self.first_audio_ms.append(elapsed)
+                    if self.on_first_audio is not None:
+                        self.on_first_audio(elapsed)
+                try:
+                    self.player.play(clip, lambda: self._stale(generation))
+                except Exception as e:
+                    print(f"Error playing speech: {str(e)}")
+            self._done()
+
+    def close(self):
+        self.interrupt()
+        self.player.close()
+
+def benchmark(spec="silent", text=None, runs=3):
+    # Time to first audio speaking a multi-sentence reply whole versus sentence by sentence
+    text = text or ("Sure, here is a quick overview. Photosynthesis turns light into chemical energy. "
+                    "Plants capture sunlight with chlorophyll in their leaves. The energy splits water "
+                    "and releases oxygen. Carbon dioxide is then fixed into sugars the plant can use.")
+    synthesizer = create_synthesizer(spec)
+    for label, chunked in (("whole reply", False), ("sentence chunks", True)):
+        pipeline = TTSPipeline(synthesizer, NullPlayer())
+        for i in range(runs):
+            pipeline.speak(text, split=chunked)
+            # Only time to first audio matters here; cut playback short
+            while len(pipeline.first_audio_ms) <= i:
+                time.sleep(0.005)
+            pipeline.interrupt()
+            pipeline.wait()
+        samples = sorted(pipeline.first_audio_ms)
+        print(f"{synthesizer.name} {label:<16} time to first audio {samples[len(samples) // 2]:7.0f} ms "
+              f"(median of {runs})")
+
+if __name__ == "__main__":
+    import sys
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else "silent")
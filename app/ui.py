@@ -2,7 +2,8 @@ from PyQt6.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QTe
                              QLabel, QScrollArea, QFrame, QSizePolicy, QMessageBox, QTabWidget, QStackedWidget, 
                              QListWidget, QListWidgetItem, QComboBox, QCheckBox)
 from PyQt6.QtGui import QFont, QColor, QPalette, QIcon, QPixmap
-from PyQt6.QtCore import Qt, QTimer, QSize, QPropertyAnimation, QEasingCurve, QParallelAnimationGroup, QDateTime, QPoint
+from PyQt6.QtCore import Qt, QTimer, QSize, QPropertyAnimation, QEasingCurve, QParallelAnimationGroup, QDateTime, QPoint, pyqtSignal
+from chat_view import ChatModel, ChatView
 
 class AnimatedLabel(QLabel):
     def __init__(self, text, parent=None):
@@ -17,6 +18,8 @@ class AnimatedLabel(QLabel):
         self.animation.start()
 
 class ChatUI(QMainWindow):
+    history_end_reached = pyqtSignal()
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Iris Chat")
@@ -72,9 +75,10 @@ class ChatUI(QMainWindow):
         menu_layout.addStretch()
         chat_layout.addLayout(menu_layout)
 
-        # Conversation window
-        self.conversation = QTextEdit()
-        self.conversation.setReadOnly(True)
+        # Conversation window: only the visible messages are ever laid out and painted
+        self.chat_model = ChatModel(self)
+        self.conversation = ChatView()
+        self.conversation.setModel(self.chat_model)
         chat_layout.addWidget(self.conversation)
 
         # User input field
@@ -153,9 +157,13 @@ class ChatUI(QMainWindow):
 
         menu_layout.addWidget(self.analysis_tabs)
 
-        # History
+        # History: past conversations, a page at a time, or messages matching the search box
+        self.history_search = QLineEdit()
+        self.history_search.setPlaceholderText("Search past messages...")
         self.history_list = QListWidget()
+        self.history_list.verticalScrollBar().valueChanged.connect(self.check_history_end)
         menu_layout.addWidget(QLabel("Chat History"))
+        menu_layout.addWidget(self.history_search)
         menu_layout.addWidget(self.history_list)
 
         # Settings
@@ -275,30 +283,71 @@ class ChatUI(QMainWindow):
         return self.user_input.text()
 
     def display_message(self, sender, message):
-        color = "#6495ED" if sender == "Iris" else "#34C759"
-        self.conversation.append(f'<p style="margin-bottom: 10px;"><span style="color: {color}; font-weight: bold;">{sender}:</span> {message}</p>')
-        self.conversation.verticalScrollBar().setValue(self.conversation.verticalScrollBar().maximum())
+        # The view follows new messages unless the user has scrolled up to read
+        self.chat_model.append_message(sender, message)
         self.user_input.clear()
-        self.add_to_history(f"{sender}: {message[:30]}...")
         self.animate_message(sender)
 
+    def display_note(self, text):
+        self.chat_model.append_message(None, text)
+
+    def begin_streamed_message(self, sender):
+        self.streamed_sender = sender
+        self.streamed_row = self.chat_model.append_message(sender, "")
+
+    def append_streamed_text(self, text):
+        # Buffered by the model and repainted at most once per frame
+        self.chat_model.append_text(self.streamed_row, text)
+
+    def end_streamed_message(self):
+        self.chat_model.flush()
+        self.animate_message(self.streamed_sender)
+
     def animate_message(self, sender):
-        if sender == "You":
-            start_geometry = self.user_input.geometry()
-            end_geometry = start_geometry.translated(0, -20)
-        else:
-            start_geometry = self.conversation.geometry().translated(0, 20)
-            end_geometry = self.conversation.geometry()
+        # Only the user's own messages nudge the input box, and never while it is already moving
+        if sender != "You" or self.user_input_animation.state() == QPropertyAnimation.State.Running:
+            return
+        start_geometry = self.user_input.geometry()
+        end_geometry = start_geometry.translated(0, -20)
 
         self.user_input_animation.setStartValue(start_geometry)
         self.user_input_animation.setEndValue(end_geometry)
         self.user_input_animation.start()
 
-    def add_to_history(self, message):
+    def add_to_history(self, message, conversation_id=None):
+        # Puts a conversation at the top of the list, replacing its older entry if there is one
+        for row in range(self.history_list.count()):
+            if conversation_id is not None and self.history_list.item(row).data(Qt.ItemDataRole.UserRole) == conversation_id:
+                self.history_list.takeItem(row)
+                break
         item = QListWidgetItem(message)
+        item.setData(Qt.ItemDataRole.UserRole, conversation_id)
         self.history_list.insertItem(0, item)
-        if self.history_list.count() > 50:
-            self.history_list.takeItem(self.history_list.count() - 1)
+
+    def show_history(self, entries, append):
+        # Conversations ({"id", "title", "updated"}) or search hits (also "sender" and "snippet")
+        if not append:
+            self.history_list.clear()
+        for entry in entries:
+            when = QDateTime.fromSecsSinceEpoch(int(entry.get("updated") or entry["time"])).toString("yyyy-MM-dd hh:mm")
+            if "snippet" in entry:
+                item = QListWidgetItem(f"{entry['sender']}: {entry['snippet']}")
+                item.setToolTip(f"{entry['title']} ({when})")
+            else:
+                item = QListWidgetItem(entry["title"][:40])
+                item.setToolTip(f"{entry['title']}\n{when}, {entry['messages']} messages")
+            item.setData(Qt.ItemDataRole.UserRole, entry["id"])
+            self.history_list.addItem(item)
+
+    def check_history_end(self, value):
+        scrollbar = self.history_list.verticalScrollBar()
+        if scrollbar.maximum() and value >= scrollbar.maximum():
+            self.history_end_reached.emit()
+
+    def show_conversation(self, messages):
+        self.chat_model.clear()
+        for message in messages:
+            self.chat_model.append_message(message["sender"], message["text"])
 
     def show_typing_indicator(self):
         self.typing_indicator.show()
@@ -318,6 +367,10 @@ class ChatUI(QMainWindow):
         self.user_input.setText(text)
         self.hide_voice_input_modal()
 
+    def update_voice_partial_text(self, text):
+        # Live transcript while the user is still speaking
+        self.voice_input_text.setText(text)
+
     def show_error_message(self, message):
         QMessageBox.critical(self, "Error", message)
 
@@ -326,6 +379,20 @@ class ChatUI(QMainWindow):
         self.keywords_tab.setText(f"Keywords: {', '.join(analysis['keywords'])}")
         self.entities_tab.setText(f"Named Entities: {', '.join([f'{entity} ({type})' for entity, type in analysis['named_entities']])}")
         self.complexity_tab.setText(f"Text Complexity: {analysis['complexity']}")
+        if analysis.get('timings'):
+            stages = ', '.join(f"{stage} {ms:.1f} ms" for stage, ms in analysis['timings'].items())
+            self.complexity_tab.append(f"Analysis time: {sum(analysis['timings'].values()):.1f} ms ({stages})")
+
+    def add_latency_tab(self):
+        # Optional: per-stage latency of recent turns, see tracing.py
+        self.latency_tab = QTextEdit()
+        self.latency_tab.setReadOnly(True)
+        self.latency_tab.setFont(QFont("Monospace", 9))
+        self.latency_tab.setLineWrapMode(QTextEdit.LineWrapMode.NoWrap)
+        self.analysis_tabs.addTab(self.latency_tab, "Latency")
+
+    def update_latency_display(self, text):
+        self.latency_tab.setPlainText(text)
 
     def change_theme(self, theme):
         if theme == "Dark":
@@ -369,5 +436,5 @@ class ChatUI(QMainWindow):
             """)
 
     def clear_history(self):
-        self.conversation.clear()
-        self.history_list.clear()
\ No newline at end of file
+        # Past conversations stay in the history list; only the open one is cleared
+        self.conversation.clear()
\ No newline at end of file
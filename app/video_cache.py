@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from video_encoder import FPS
+
+def default_cache_dir():
+    return os.environ.get("IRIS_VIDEO_CACHE", os.path.join(os.path.expanduser("~"), ".iris", "video-cache"))
+
+def image_digest(image):
+    # Hash of the decoded pixels, so a picture matches whether it came in as an upload or a PNG over HTTP
+    if image is None:
+        return None
+    return hashlib.sha256(f"{image.mode}:{image.size}".encode("ascii") + image.tobytes()).hexdigest()
+
+def video_key(model, request, settings=None):
+    # Everything that decides the output of a generation; missing keyframes mean the model's defaults.
+    # Whitespace in prompts is collapsed, as the pipeline's prompt cleaning does anyway. `settings` are
+    # the pipeline's (wan.pipeline_settings): a bf16 or compiled render is not the fp32 one.
+    payload = json.dumps([
+        model,
+        sorted((settings or {}).items()),
+        " ".join(request["prompt"].split()),
+        " ".join((request.get("negative_prompt") or "").split()),
+        image_digest(request.get("first_frame")),
+        image_digest(request.get("last_frame")),
+        int(request["height"]), int(request["width"]), int(request["num_frames"]), int(request["num_steps"]),
+        round(float(request["guidance_scale"]), 4), int(request["seed"]), int(request.get("fps") or FPS),
+    ], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class VideoCache:
+    # Finished videos as MP4 files named by video_key, evicted least recently used past `max_bytes`.
+    # Finished renders are moved in, not copied. File modification times record recency, so the
+    # LRU order survives restarts. Renders in progress are written here as partial-* files; ones
+    # untouched for `stale_partial_s` were left by a crashed worker and are removed on load.
+    def __init__(self, directory=None, max_bytes=2 * 2 ** 30, stale_partial_s=3600):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.stale_partial_s = stale_partial_s
+        self.entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self.load()
+
+    key = staticmethod(video_key)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".mp4")
+
+    def load(self):
+        found = []
+        now = time.time()
+        for filename in os.listdir(self.directory):
+            if filename.startswith("partial-"):
+                # Frames are encoded as they are decoded, so another worker's render in progress keeps
+                # its file's mtime fresh; an old one is from a render that never finished
+                try:
+                    if now - os.path.getmtime(os.path.join(self.directory, filename)) > self.stale_partial_s:
+                        os.remove(os.path.join(self.directory, filename))
+                except OSError:
+                    pass  # Finished and moved in meanwhile
+            elif filename.endswith(".mp4") and len(filename) == 68:
+                stat = os.stat(os.path.join(self.directory, filename))
+                found.append((stat.st_mtime, filename[:-4], stat.st_size))
+        with self.lock:
+            for _, key, size in sorted(found):
+                self.entries[key] = size
+                self.total_bytes += size
+            self._evict()
+
+    def get(self, key):
+        # Path of the cached video, or None
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+        try:
+            os.utime(self.path(key))
+        except OSError:
+            # Deleted behind our back: forget it and render again
+            with self.lock:
+                self.total_bytes -= self.entries.pop(key, 0)
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return self.path(key)
+
+    def put(self, key, source):
+        # Moves the rendered file at `source` into the cache and returns its new path
+        os.replace(source, self.path(key))
+        size = os.path.getsize(self.path(key))
+        with self.lock:
+            self.total_bytes += size - self.entries.pop(key, 0)
+            self.entries[key] = size
+            self._evict()
+        return self.path(key)
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        with self.lock:
+            for key in self.entries:
+                try:
+                    os.remove(self.path(key))
+                except OSError:
+                    pass
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "evictions": self.evictions,
+            }
+
+def benchmark(clients=8, distinct=2):
+    # `clients` concurrent submissions of `distinct` different requests to a tiny-pipeline worker,
+    # then the same again once they are cached: how many renders ran and how long clients waited
+    import tempfile
+    from video_worker import VideoWorker
+    with tempfile.TemporaryDirectory() as directory:
+        worker = VideoWorker(tiny=True, output_dir=directory, cache=VideoCache(os.path.join(directory, "cache"))).start()
+        worker.ready.wait()
+        requests = [{"prompt": f"request {i}", "negative_prompt": "", "first_frame": None, "last_frame": None,
+                     "height": 64, "width": 64, "num_frames": 17, "num_steps": 4, "guidance_scale": 5.0, "seed": i}
+                    for i in range(distinct)]
+        for label in ("cold", "cached"):
+            start = time.perf_counter()
+            rendered = worker.completed
+            jobs = [worker.submit(requests[n % distinct]) for n in range(clients)]
+            for job in jobs:
+                job.wait()
+            elapsed = time.perf_counter() - start
+            print(f"{label:<7} {clients} requests ({distinct} distinct): {worker.completed - rendered} renders, "
+                  f"{elapsed:6.2f} s until all were done")
+        print(worker.stats())
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,135 @@
+import os
+import shutil
+import subprocess
+import time
+
+# H.264 writers that take frames a few at a time, so a video is encoded while it is still being
+# decoded instead of being held in memory whole. PyAV when it is installed, otherwise an ffmpeg
+# process fed raw frames on stdin (the ffmpeg on PATH, or the one bundled with imageio-ffmpeg).
+
+FPS = 16  # Wan's native frame rate
+
+class PyAVWriter:
+    def __init__(self, path, width, height, fps=FPS, crf=18):
+        import av
+        self.path = path
+        self.container = av.open(path, "w")
+        if "libx264" in av.codecs_available:
+            self.stream = self.container.add_stream("libx264", rate=fps, options={"crf": str(crf)})
+        else:
+            self.stream = self.container.add_stream("mpeg4", rate=fps)
+        self.stream.width = width
+        self.stream.height = height
+        self.stream.pix_fmt = "yuv420p"
+        self.frames = 0
+
+    def write(self, frames):
+        # frames: uint8 array of shape (n, height, width, 3)
+        import av
+        for frame in frames:
+            for packet in self.stream.encode(av.VideoFrame.from_ndarray(frame, format="rgb24")):
+                self.container.mux(packet)
+            self.frames += 1
+
+    def close(self):
+        for packet in self.stream.encode():
+            self.container.mux(packet)
+        self.container.close()
+
+class FFmpegWriter:
+    def __init__(self, path, width, height, fps=FPS, crf=18):
+        self.path = path
+        self.process = subprocess.Popen(
+            [ffmpeg_executable(), "-y", "-loglevel", "error", "-f", "rawvideo", "-pix_fmt", "rgb24",
+             "-s", f"{width}x{height}", "-r", str(fps), "-i", "-", "-c:v", "libx264", "-pix_fmt", "yuv420p",
+             "-crf", str(crf), "-movflags", "+faststart", path],
+            stdin=subprocess.PIPE, stderr=subprocess.PIPE,
+        )
+        self.frames = 0
+
+    def write(self, frames):
+        import numpy as np
+        self.process.stdin.write(np.ascontiguousarray(frames).data)
+        self.frames += len(frames)
+
+    def close(self):
+        self.process.stdin.close()
+        error = self.process.stderr.read().decode("utf-8", "replace").strip()
+        if self.process.wait() != 0:
+            raise Exception(f"Error encoding video: {error}")
+
+def ffmpeg_executable():
+    path = shutil.which("ffmpeg")
+    if path is None:
+        try:
+            import imageio_ffmpeg
+            path = imageio_ffmpeg.get_ffmpeg_exe()
+        except ImportError:
+            raise Exception("Video encoding needs PyAV (pip install av) or ffmpeg")
+    return path
+
+def open_video_writer(path, width, height, fps=FPS, crf=18):
+    # IRIS_VIDEO_ENCODER=pyav or ffmpeg picks one; by default PyAV if it imports
+    backend = os.environ.get("IRIS_VIDEO_ENCODER", "auto").lower()
+    if backend == "auto":
+        try:
+            import av  # noqa: F401
+            backend = "pyav"
+        except ImportError:
+            backend = "ffmpeg"
+    writer = {"pyav": PyAVWriter, "ffmpeg": FFmpegWriter}.get(backend)
+    if writer is None:
+        raise Exception(f"Unknown video encoder: {backend}")
+    return writer(path, width, height, fps, crf)
+
+def _encode_job(mode, num_frames, height, width, result):
+    # Runs in a fresh process so its peak RSS is its own
+    import resource
+    import tempfile
+    import numpy as np
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "out.mp4")
+        gradient = np.linspace(0, 1, width, dtype=np.float32)[None, :, None]
+        if mode == "export_to_video":
+            # The old path: the pipeline's float frames for the whole video, then one-shot export
+            from diffusers.utils import export_to_video
+            frames = np.empty((num_frames, height, width, 3), dtype=np.float32)
+            for i in range(num_frames):
+                frames[i] = (gradient + i / num_frames) % 1
+            export_to_video(list(frames), path, fps=FPS)
+        else:
+            os.environ["IRIS_VIDEO_ENCODER"] = mode
+            writer = open_video_writer(path, width, height, 16)
+            written = 0
+            while written < num_frames:
+                # The VAE yields 1 frame for the first latent frame and 4 for each after it
+                count = 1 if written == 0 else min(4, num_frames - written)
+                chunk = np.empty((count, height, width, 3), dtype=np.uint8)
+                for j in range(count):
+                    chunk[j] = ((gradient + (written + j) / num_frames) % 1 * 255).astype(np.uint8)
+                writer.write(chunk)
+                written += count
+            writer.close()
+        size = os.path.getsize(path)
+    result.put((time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, size))
+
+def benchmark(num_frames=129, height=720, width=1280):
+    # Time and peak memory of writing a synthetic num_frames video the old way and streamed
+    import multiprocessing
+    context = multiprocessing.get_context("spawn")
+    print(f"{num_frames} frames at {width}x{height}")
+    for mode in ("export_to_video", "pyav", "ffmpeg"):
+        result = context.Queue()
+        process = context.Process(target=_encode_job, args=(mode, num_frames, height, width, result))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            print(f"{mode:<16} failed (exit code {process.exitcode})")
+            continue
+        seconds, peak, size = result.get()
+        note = " (not counting the ffmpeg process)" if mode == "ffmpeg" else ""
+        print(f"{mode:<16} {seconds:6.1f} s  peak RSS {peak:7.0f} MB{note}  {size / 1024:7.0f} KB file")
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,507 @@
+import argparse
+import base64
+import heapq
+import io
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from video_cache import VideoCache, video_key
+from workers import JobCancelled
+
+# Video generation as a long-lived service: the Wan pipeline is loaded once and stays warm, jobs wait
+# in a priority queue and run one at a time on the GPU, and clients poll for progress. wan.py's
+# Gradio front end is a thin client of this, in process (LocalClient) or over HTTP (HTTPClient).
+# Finished videos are kept in a VideoCache keyed by everything that determines them, so a repeated
+# request is answered from disk, and identical requests that arrive while one is queued or running
+# share that job instead of rendering twice.
+#
+#   POST /jobs               {"request": {...}, "priority": "high"|"normal"|"low"} -> {"id": ...}
+#                            first_frame/last_frame in the request are base64 PNGs or null
+#   GET /jobs/<id>           status, queue position, step / total_steps, error, timings
+#   GET /jobs/<id>/preview   PNG of the middle frame as of the latest preview step, while running
+#   GET /jobs/<id>/video     the MP4 once done
+#   DELETE /jobs/<id>        cancel (queued jobs are dropped, running ones stop after the current step)
+#   GET /health, GET /stats
+
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+class QueueFull(Exception):
+    pass
+
+class VideoJob:
+    def __init__(self, request, priority="normal"):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.priority = priority
+        self.sequence = None
+        self.status = "queued"  # queued, running, done, failed, cancelled
+        self.step = 0
+        self.total_steps = int(request.get("num_steps", 0))
+        self.video_path = None
+        self.error = None
+        self.created = time.time()
+        self.started = self.finished = None
+        self.cancel_requested = False
+        self.key = None
+        self.clients = 1  # submissions sharing this job
+        self.cached = False
+        self.timings = {}  # seconds spent (and saved) on stages of the render
+        self.preview = None  # PIL image of the middle frame while running
+        self.preview_step = 0
+        self.changed = threading.Condition()
+
+    def update(self, **fields):
+        with self.changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.changed.notify_all()
+
+    def wait(self, timeout=None):
+        # Blocks until the job has finished one way or another
+        with self.changed:
+            self.changed.wait_for(lambda: self.status in ("done", "failed", "cancelled"), timeout)
+        return self.status
+
+    def snapshot(self, position=0):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "position": position,
+            "step": self.step,
+            "total_steps": self.total_steps,
+            "error": self.error,
+            "cached": self.cached,
+            "timings": self.timings,
+            "preview_step": self.preview_step,
+            "queued_s": (self.started or time.time()) - self.created,
+            "run_s": (self.finished or time.time()) - self.started if self.started else None,
+        }
+
+class VideoWorker:
+    # One thread owns the pipeline. Jobs run highest priority first, oldest first within a priority.
+    # Finished jobs stay queryable for `keep_finished_s` seconds, and at most `max_finished` of them
+    def __init__(self, tiny=False, output_dir=None, max_queued=32, device=None, cache=None, previews=None,
+                 load=None, render=None, keep_finished_s=3600, max_finished=1000):
+        import wan
+        self.tiny = tiny
+        self.model = "tiny" if tiny else wan.model_id
+        self.settings = wan.pipeline_settings(tiny=tiny, device=device)
+        self.cache = default_video_cache() if cache is None else cache or None
+        # Previews decode a frame each on the GPU that is denoising; IRIS_VIDEO_PREVIEWS=0 turns them off
+        self.previews = int(os.environ.get("IRIS_VIDEO_PREVIEWS", "4")) if previews is None else previews
+        self.load = load or (lambda: wan.load_pipeline(tiny=tiny, device=self.settings["device"],
+                                                       dtype=self.settings["dtype"],
+                                                       channels_last=self.settings["channels_last"],
+                                                       compile=self.settings["compile"]))
+        self.render = render or (lambda pipe, request, path, on_step, timings, on_preview:
+                                 wan.render_video(pipe, request, path, on_step, tiny=tiny, timings=timings,
+                                                  on_preview=on_preview, previews=self.previews))
+        self.output_dir = output_dir or os.path.join(tempfile.gettempdir(), "iris-video")
+        self.max_queued = max_queued
+        self.keep_finished_s = keep_finished_s
+        self.max_finished = max_finished
+        self.jobs = {}
+        self.finished = OrderedDict()  # id -> finished job, oldest first
+        self.running = None
+        self.inflight = {}  # video key -> queued or running job
+        self.queue = []  # heap of (priority, sequence, job)
+        self.sequence = itertools.count()
+        self.lock = threading.Condition()
+        self.pipe = None
+        self.ready = threading.Event()
+        self.load_error = None
+        self.load_seconds = None
+        self.completed = self.deduplicated = self.cache_hits = 0
+        self.thread = None
+
+    def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, name="iris-video-worker", daemon=True)
+        self.thread.start()
+        return self
+
+    def submit(self, request, priority="normal"):
+        job = VideoJob(request, priority)
+        job.key = video_key(self.model, request, self.settings)
+        with self.lock:
+            if self.load_error is not None:
+                raise Exception(f"Video pipeline failed to load: {self.load_error}")
+            shared = self.inflight.get(job.key)
+            if shared is not None and not shared.cancel_requested:
+                shared.clients += 1
+                self.deduplicated += 1
+                if shared.status == "queued" and PRIORITIES[priority] < PRIORITIES[shared.priority]:
+                    # The shared job runs as soon as its most urgent client needs it
+                    self.queue = [entry for entry in self.queue if entry[2] is not shared]
+                    shared.priority = priority
+                    self.queue.append((PRIORITIES[priority], shared.sequence, shared))
+                    heapq.heapify(self.queue)
+                return shared
+            path = self.cache.get(job.key) if self.cache is not None else None
+            if path is not None:
+                now = time.time()
+                job.update(status="done", video_path=path, cached=True, started=now, finished=now,
+                           step=job.total_steps, request=None)
+                self.jobs[job.id] = job
+                self._retire(job)
+                self.cache_hits += 1
+                return job
+            if len(self.queue) >= self.max_queued:
+                raise QueueFull("Too many video jobs queued, try again later.")
+            self.jobs[job.id] = job
+            self.inflight[job.key] = job
+            job.sequence = next(self.sequence)
+            heapq.heappush(self.queue, (PRIORITIES[priority], job.sequence, job))
+            self.lock.notify()
+        return job
+
+    def job(self, job_id):
+        return self.jobs.get(job_id)
+
+    def preview(self, job_id):
+        job = self.jobs.get(job_id)
+        return None if job is None else job.preview
+
+    def position(self, job):
+        # How many queued jobs will run before this one
+        with self.lock:
+            if job.status != "queued":
+                return 0
+            return sum(1 for entry in self.queue if entry[:2] < (PRIORITIES[job.priority], job.sequence))
+
+    def status(self, job_id):
+        job = self.jobs.get(job_id)
+        return None if job is None else job.snapshot(self.position(job))
+
+    def cancel(self, job_id):
+        # Withdraws one submission; the job itself stops only when no other client is waiting on it
+        job = self.jobs.get(job_id)
+        if job is None:
+            return False
+        with self.lock:
+            if job.status not in ("queued", "running"):
+                return False
+            job.clients -= 1
+            if job.clients > 0:
+                return True
+            self._finish(job)
+            if job.status == "queued":
+                self.queue = [entry for entry in self.queue if entry[2] is not job]
+                heapq.heapify(self.queue)
+                job.update(status="cancelled", finished=time.time(), request=None, preview=None)
+                self._retire(job)
+                return True
+        job.cancel_requested = True
+        return True
+
+    def _finish(self, job):
+        # Called with the lock held: later identical requests no longer join this job
+        if self.inflight.get(job.key) is job:
+            del self.inflight[job.key]
+
+    def _retire(self, job):
+        # Called with the lock held once a job has finished; forgets the oldest finished jobs past
+        # the retention limits (and their videos, unless the cache owns them)
+        self.finished[job.id] = job
+        cutoff = time.time() - self.keep_finished_s
+        while self.finished:
+            oldest = next(iter(self.finished.values()))
+            if len(self.finished) <= self.max_finished and oldest.finished >= cutoff:
+                break
+            del self.finished[oldest.id]
+            self.jobs.pop(oldest.id, None)
+            if self.cache is None and oldest.video_path:
+                try:
+                    os.remove(oldest.video_path)
+                except OSError:
+                    pass
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            self.pipe = self.load()
+        except Exception as e:
+            with self.lock:
+                self.load_error = str(e)
+                for _, _, job in self.queue:
+                    job.update(status="failed", error=f"Video pipeline failed to load: {str(e)}", finished=time.time())
+                    self._retire(job)
+                self.queue = []
+                self.inflight.clear()
+            print(f"Error loading video pipeline: {str(e)}")
+            return
+        self.load_seconds = time.perf_counter() - start
+        self.ready.set()
+        print(f"Video pipeline ready in {self.load_seconds:.1f} s")
+
+        while True:
+            with self.lock:
+                while not self.queue:
+                    self.lock.wait()
+                _, _, job = heapq.heappop(self.queue)
+                job.update(status="running", started=time.time())
+                self.running = job
+            self._execute(job)
+
+    def _execute(self, job):
+        def on_step(step, total):
+            job.update(step=step, total_steps=total)
+            if job.cancel_requested:
+                raise JobCancelled()
+
+        def on_preview(image, step):
+            job.update(preview=image, preview_step=step)
+
+        # Every job renders to its own file, so concurrent jobs never overwrite each other's output.
+        # With a cache it is written next to the cache so that adding it there is a rename.
+        if self.cache is not None:
+            path = os.path.join(self.cache.directory, f"partial-{job.id}.mp4")
+        else:
+            path = os.path.join(self.output_dir, f"{job.id}.mp4")
+        try:
+            self.render(self.pipe, job.request, path, on_step, job.timings, on_preview)
+            if self.cache is not None:
+                path = self.cache.put(job.key, path)
+            self._end(job, status="done", video_path=path)
+            self.completed += 1
+        except JobCancelled:
+            self._end(job, status="cancelled")
+        except Exception as e:
+            self._end(job, status="failed", error=str(e))
+
+    def _end(self, job, **fields):
+        with self.lock:
+            self._finish(job)
+            job.update(finished=time.time(), request=None, preview=None, **fields)
+            self.running = None
+            self._retire(job)
+
+    def stats(self):
+        with self.lock:
+            queued = len(self.queue)
+            finished = len(self.finished)
+        return {
+            "ready": self.ready.is_set(),
+            "load_error": self.load_error,
+            "load_s": self.load_seconds,
+            "queued": queued,
+            "running": 1 if self.running is not None else 0,
+            "finished": finished,
+            "completed": self.completed,
+            "deduplicated": self.deduplicated,
+            "cache_hits": self.cache_hits,
+            "cache": self.cache.stats() if self.cache is not None else None,
+            "prompt_cache": self.pipe.prompt_cache.stats() if getattr(self.pipe, "prompt_cache", None) else None,
+        }
+
+def default_video_cache():
+    # IRIS_VIDEO_CACHE=off renders every request; IRIS_VIDEO_CACHE_MB caps the disk used
+    if os.environ.get("IRIS_VIDEO_CACHE", "").lower() == "off":
+        return False
+    return VideoCache(max_bytes=int(os.environ.get("IRIS_VIDEO_CACHE_MB", "2048")) * 2 ** 20)
+
+class LocalClient:
+    # generate_video's interface to a worker in the same process
+    def __init__(self, worker):
+        self.worker = worker
+
+    def submit(self, request, priority="normal"):
+        return self.worker.submit(request, priority).id
+
+    def status(self, job_id):
+        status = self.worker.status(job_id)
+        if status is None:
+            raise Exception(f"Unknown video job {job_id}")
+        return status
+
+    def cancel(self, job_id):
+        return self.worker.cancel(job_id)
+
+    def preview(self, job_id):
+        return self.worker.preview(job_id)
+
+    def video_path(self, job_id):
+        return self.worker.job(job_id).video_path
+
+def encode_image(image):
+    if image is None:
+        return None
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+def decode_image(data):
+    if data is None:
+        return None
+    import PIL.Image
+    return PIL.Image.open(io.BytesIO(base64.b64decode(data))).convert("RGB")
+
+class HTTPClient:
+    # The same interface against a video worker service over HTTP
+    def __init__(self, base_url, download_dir=None, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.download_dir = download_dir or os.path.join(tempfile.gettempdir(), "iris-video-client")
+        self.timeout = timeout
+
+    def _call(self, method, path, body=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(self.base_url + path, data=data, method=method,
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read()).get("error")
+            except ValueError:
+                message = None
+            raise Exception(message or f"Video worker returned {e.code}")
+
+    def submit(self, request, priority="normal"):
+        request = dict(request, first_frame=encode_image(request.get("first_frame")),
+                       last_frame=encode_image(request.get("last_frame")))
+        return self._call("POST", "/jobs", {"request": request, "priority": priority})["id"]
+
+    def status(self, job_id):
+        return self._call("GET", f"/jobs/{job_id}")
+
+    def cancel(self, job_id):
+        return self._call("DELETE", f"/jobs/{job_id}")["cancelled"]
+
+    def preview(self, job_id):
+        import PIL.Image
+        try:
+            with urllib.request.urlopen(f"{self.base_url}/jobs/{job_id}/preview", timeout=self.timeout) as response:
+                return PIL.Image.open(io.BytesIO(response.read())).convert("RGB")
+        except urllib.error.HTTPError:
+            return None
+
+    def video_path(self, job_id):
+        os.makedirs(self.download_dir, exist_ok=True)
+        path = os.path.join(self.download_dir, f"{job_id}.mp4")
+        with urllib.request.urlopen(f"{self.base_url}/jobs/{job_id}/video", timeout=self.timeout) as response:
+            with open(path, "wb") as f:
+                shutil.copyfileobj(response, f)
+        return path
+
+class VideoRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _job(self):
+        parts = self.path.strip("/").split("/")
+        job = self.server.worker.job(parts[1]) if len(parts) >= 2 and parts[0] == "jobs" else None
+        if job is None:
+            self._json(404, {"error": "No such job"})
+        return job, parts
+
+    def do_GET(self):
+        worker = self.server.worker
+        if self.path == "/health":
+            return self._json(200, {"status": "ok" if worker.ready.is_set() else "loading"})
+        if self.path == "/stats":
+            return self._json(200, worker.stats())
+        job, parts = self._job()
+        if job is None:
+            return
+        if len(parts) == 2:
+            return self._json(200, worker.status(job.id))
+        if parts[2:] == ["preview"]:
+            image = job.preview
+            if image is None:
+                return self._json(404, {"error": "No preview yet"})
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG")
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(buffer.tell()))
+            self.end_headers()
+            self.wfile.write(buffer.getvalue())
+            return
+        if parts[2:] == ["video"]:
+            if job.status != "done":
+                return self._json(409, {"error": f"Job is {job.status}"})
+            if not os.path.exists(job.video_path):
+                return self._json(410, {"error": "Video was evicted from the cache"})
+            self.send_response(200)
+            self.send_header("Content-Type", "video/mp4")
+            self.send_header("Content-Length", str(os.path.getsize(job.video_path)))
+            self.end_headers()
+            with open(job.video_path, "rb") as f:
+                shutil.copyfileobj(f, self.wfile)
+            return
+        self._json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        if self.path != "/jobs":
+            return self._json(404, {"error": "Not found"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            request = dict(body["request"])
+            request["first_frame"] = decode_image(request.get("first_frame"))
+            request["last_frame"] = decode_image(request.get("last_frame"))
+            job = self.server.worker.submit(request, body.get("priority", "normal"))
+        except QueueFull as e:
+            return self._json(429, {"error": str(e)})
+        except (ValueError, KeyError, TypeError) as e:
+            return self._json(400, {"error": f"Bad request: {str(e)}"})
+        except Exception as e:
+            return self._json(503, {"error": str(e)})
+        self._json(202, {"id": job.id})
+
+    def do_DELETE(self):
+        job, _ = self._job()
+        if job is not None:
+            self._json(200, {"cancelled": self.server.worker.cancel(job.id)})
+
+class VideoServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, worker, host="127.0.0.1", port=8765):
+        self.worker = worker
+        super().__init__((host, port), VideoRequestHandler)
+
+def main():
+    parser = argparse.ArgumentParser(description="Warm Wan2.1 VACE video generation worker")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--tiny", action="store_true", help="tiny random pipeline (testing)")
+    parser.add_argument("--device", help="auto (default), cuda, mps or cpu")
+    parser.add_argument("--output-dir", help="where finished videos are written")
+    parser.add_argument("--max-queued", type=int, default=32)
+    parser.add_argument("--previews", type=int, help="preview frames per job (default 4, 0 for none)")
+    args = parser.parse_args()
+
+    worker = VideoWorker(tiny=args.tiny, output_dir=args.output_dir, max_queued=args.max_queued,
+                         device=args.device, previews=args.previews).start()
+    server = VideoServer(worker, args.host, args.port)
+    print(f"Video worker on http://{args.host}:{server.server_address[1]}/ (pipeline loading in the background)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,88 +1,665 @@
-# Install required packages
-!pip install -q diffusers==0.30.3 torch pillow gradio accelerate --upgrade
+# Wan2.1 VACE first/last frame to video.
+# Requires: pip install "diffusers==0.41.*" transformers ftfy torch pillow gradio accelerate av
+# (other diffusers versions work, but without 0.41's VAE internals each video is decoded whole)
+#
+#   python video_worker.py [--tiny]           the worker: loads the pipeline once and keeps it warm
+#   python wan.py --server http://host:8765   Gradio front end talking to that worker
+#   python wan.py [--tiny]                    both in one process
+#   python wan.py [--tiny] --benchmark        time generation on this machine
+#   python wan.py --benchmark-prepare         time building the conditioning video at 720p
+# --tiny swaps in a randomly initialized miniature of the pipeline that runs in seconds on a CPU, for
+# testing the job queue and the UI without a GPU or the model download.
+# The device is picked at runtime (CUDA, then MPS, then CPU); IRIS_VIDEO_DEVICE, IRIS_VIDEO_DTYPE,
+# IRIS_VIDEO_THREADS, IRIS_VIDEO_OFFLOAD=1, IRIS_VIDEO_OFFLOAD_TEXT=1, IRIS_VIDEO_CHANNELS_LAST=1 and
+# IRIS_VIDEO_COMPILE=1 override it.
 
-import torch
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict
 import PIL.Image
-from diffusers import AutoencoderKLWan, WanVACEPipeline
-from diffusers.schedulers.scheduling_unipc_multistep import UniPCMultistepScheduler
-from diffusers.utils import export_to_video, load_image
-import gradio as gr
 
 model_id = "Wan-AI/Wan2.1-VACE-1.3B-diffusers"
+flow_shift = 3.0  # Use 3.0 for 480p-576p, 5.0 only for 720p+
 
-vae = AutoencoderKLWan.from_pretrained(model_id, subfolder="vae", torch_dtype=torch.float32)
+FIRST_FRAME_URL = "https://huggingface.co/datasets/huggingface/documentation-images/resolve/main/diffusers/flf2v_input_first_frame.png"
+LAST_FRAME_URL = "https://huggingface.co/datasets/huggingface/documentation-images/resolve/main/diffusers/flf2v_input_last_frame.png"
 
+default_prompt = "CG animation style, a small blue bird takes off from the ground, flapping its wings. The bird's feathers are delicate, with a unique pattern on its chest. The background shows a blue sky with white clouds under bright sunshine. The camera follows the bird upward, capturing its flight and the vastness of the sky from a close-up, low-angle perspective."
+default_negative = "Bright tones, overexposed, static, blurred details, subtitles, style, works, paintings, images, static, overall gray, worst quality, low quality, JPEG compression residue, ugly, incomplete, extra fingers, poorly drawn hands, poorly drawn faces, deformed, disfigured, misshapen limbs, fused fingers, still picture, messy background, three legs, many people in the background, walking backwards"
 
-pipe = WanVACEPipeline.from_pretrained(model_id, vae=vae, torch_dtype=torch.bfloat16)
+# Generation sizes. Frame counts are 4k+1 and sizes multiples of 16, as the VAE needs; the smaller ones
+# keep a CPU run in minutes rather than hours.
+PRESETS = {
+    "720p": {"height": 720, "width": 1280, "num_frames": 81, "num_steps": 30},
+    "480p": {"height": 480, "width": 832, "num_frames": 81, "num_steps": 30},
+    "512": {"height": 512, "width": 512, "num_frames": 81, "num_steps": 30},
+    "cpu": {"height": 256, "width": 256, "num_frames": 17, "num_steps": 10},
+    "tiny": {"height": 64, "width": 64, "num_frames": 17, "num_steps": 4},
+}
 
-flow_shift = 3.0  # Use 3.0 for 480p-576p, 5.0 only for 720p+
-pipe.scheduler = UniPCMultistepScheduler.from_config(pipe.scheduler.config, flow_shift=flow_shift)
+def select_device(requested=None):
+    # "auto" (default) prefers CUDA, then Apple's MPS, then the CPU; IRIS_VIDEO_DEVICE overrides
+    import torch
+    requested = (requested or os.environ.get("IRIS_VIDEO_DEVICE") or "auto").lower()
+    if requested == "auto":
+        if torch.cuda.is_available():
+            return "cuda"
+        if getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available():
+            return "mps"
+        return "cpu"
+    if requested == "cuda" and not torch.cuda.is_available():
+        raise Exception("CUDA was requested for video generation but no CUDA device is available")
+    return requested
+
+def select_dtype(device, requested=None):
+    # The transformer's dtype. bf16 halves memory everywhere, but on a CPU it is only fast with native
+    # bf16 instructions (AVX512-BF16 / AMX); otherwise fp32 is both faster and safer there. fp16 is
+    # never picked automatically: Wan overflows in it.
+    import torch
+    requested = (requested or os.environ.get("IRIS_VIDEO_DTYPE") or "auto").lower()
+    if requested != "auto":
+        return {"bf16": torch.bfloat16, "bfloat16": torch.bfloat16, "fp16": torch.float16, "float16": torch.float16,
+                "fp32": torch.float32, "float32": torch.float32}[requested]
+    if device == "cpu":
+        try:
+            return torch.bfloat16 if torch.ops.mkldnn._is_mkldnn_bf16_supported() else torch.float32
+        except (AttributeError, RuntimeError):
+            return torch.float32
+    return torch.bfloat16
+
+def configure_threads(threads=None):
+    # Intra-op threads for CPU inference: all physical cores unless IRIS_VIDEO_THREADS says otherwise
+    import torch
+    threads = int(threads or os.environ.get("IRIS_VIDEO_THREADS") or 0) or os.cpu_count() or 1
+    torch.set_num_threads(threads)
+    return threads
+
+def optimize_pipeline(pipe, channels_last=False, compile=False):
+    # channels_last_3d helps the VAE's 3D convolutions with oneDNN and cuDNN; torch.compile fuses the
+    # transformer's kernels but costs a minute or more on the first call, so it pays off only in a
+    # long-lived worker. Both are opt-in and measured by --benchmark.
+    import torch
+    if channels_last:
+        for module in pipe.vae.modules():
+            if isinstance(module, torch.nn.Conv3d):
+                module.to(memory_format=torch.channels_last_3d)
+    if compile:
+        pipe.transformer = torch.compile(pipe.transformer)
+    return pipe
+
+class PromptCache:
+    # Text-encoder outputs for recently used prompts, least recently used evicted past `max_entries`.
+    # The negative prompt almost never changes and the UMT5 encoder is the slowest thing outside the
+    # denoising loop, so most requests skip it entirely. Embeddings are kept on the CPU (a few MB
+    # each) and moved to the pipeline's device per request.
+    # With offload_encoder the encoder is parked on the CPU between misses, which frees its ~11 GB of
+    # VRAM for longer videos once the cache is warm; only for pipelines not already model-offloaded.
+    def __init__(self, pipe, max_entries=32, offload_encoder=False, max_sequence_length=512):
+        self.pipe = pipe
+        self.max_entries = max_entries
+        self.offload_encoder = offload_encoder
+        self.max_sequence_length = max_sequence_length
+        self.entries = OrderedDict()  # prompt -> (embeddings on the CPU, seconds it took to encode)
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+        self.seconds_saved = 0.0
+        if offload_encoder:
+            pipe.text_encoder.to("cpu")
+
+    def embed(self, prompt):
+        # (embeddings on the pipeline's device, seconds saved by the cache)
+        prompt = " ".join(prompt.split())
+        device = self.pipe._execution_device
+        with self.lock:
+            entry = self.entries.get(prompt)
+            if entry is not None:
+                self.entries.move_to_end(prompt)
+                self.hits += 1
+                self.seconds_saved += entry[1]
+                return entry[0].to(device), entry[1]
+            self.misses += 1
+        start = time.perf_counter()
+        if self.offload_encoder:
+            self.pipe.text_encoder.to(device)
+        try:
+            embeddings, _ = self.pipe.encode_prompt(prompt, do_classifier_free_guidance=False, device=device,
+                                                    max_sequence_length=self.max_sequence_length)
+        finally:
+            if self.offload_encoder:
+                self.pipe.text_encoder.to("cpu")
+        seconds = time.perf_counter() - start
+        with self.lock:
+            self.entries[prompt] = (embeddings.to("cpu"), seconds)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return embeddings, 0.0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "seconds_saved": self.seconds_saved,
+            }
+
+def pipeline_settings(tiny=False, device=None, dtype=None, channels_last=None, compile=None):
+    # The resolved device, transformer dtype and optimizations load_pipeline will use. They change the
+    # pixels a seed produces, so they are part of every video cache key; offloading only moves weights.
+    device = select_device(device)
+    if channels_last is None:
+        channels_last = os.environ.get("IRIS_VIDEO_CHANNELS_LAST", "") == "1"
+    if compile is None:
+        compile = os.environ.get("IRIS_VIDEO_COMPILE", "") == "1"
+    dtype = select_dtype(device, dtype or ("fp32" if tiny else None))
+    return {"device": device, "dtype": str(dtype).replace("torch.", ""), "channels_last": channels_last,
+            "compile": compile}
+
+def load_pipeline(tiny=False, device=None, dtype=None, threads=None, channels_last=None, compile=None, offload=None):
+    import torch
+    from diffusers import AutoencoderKLWan, WanVACEPipeline
+    from diffusers.schedulers.scheduling_unipc_multistep import UniPCMultistepScheduler
+
+    settings = pipeline_settings(tiny, device, dtype, channels_last, compile)
+    device, channels_last, compile = settings["device"], settings["channels_last"], settings["compile"]
+    dtype = getattr(torch, settings["dtype"])
+    if device == "cpu":
+        configure_threads(threads)
+
+    if tiny:
+        pipe = tiny_pipeline()
+        pipe.video_processor = PreparedVideoProcessor(pipe.video_processor)
+        pipe.to(device)
+        # Cast the way from_pretrained does, leaving the modules Wan needs in fp32 alone
+        keep = pipe.transformer._keep_in_fp32_modules or []
+        for name, parameter in pipe.transformer.named_parameters():
+            if not any(part in keep for part in name.split(".")):
+                parameter.data = parameter.data.to(dtype)
+        pipe.prompt_cache = PromptCache(pipe)
+        return optimize_pipeline(pipe, channels_last, compile)
+
+    # The VAE stays in fp32 on every device: it is small and decodes visibly worse in bf16
+    vae = AutoencoderKLWan.from_pretrained(model_id, subfolder="vae", torch_dtype=torch.float32)
+    pipe = WanVACEPipeline.from_pretrained(model_id, vae=vae, torch_dtype=dtype)
+    pipe.scheduler = UniPCMultistepScheduler.from_config(pipe.scheduler.config, flow_shift=flow_shift)
+    pipe.video_processor = PreparedVideoProcessor(pipe.video_processor)
+
+    offload = place_pipeline(pipe, device, offload)
+    pipe.prompt_cache = PromptCache(pipe, offload_encoder=device == "cuda" and not offload and
+                                    os.environ.get("IRIS_VIDEO_OFFLOAD_TEXT") == "1")
+
+    pipe.enable_vae_slicing()
+    return optimize_pipeline(pipe, channels_last, compile)
+
+def place_pipeline(pipe, device, offload=None):
+    # Either the whole pipeline lives on the GPU, or model offload moves each component there only
+    # while it runs; calling .to("cuda") first defeats offloading, so exactly one of the two is done.
+    # Offload by default when the GPU has under 24 GB. Returns whether the pipeline is offloaded.
+    import torch
+    if device != "cuda":
+        pipe.to(device)
+        return False
+    if offload is None:
+        offload = os.environ.get("IRIS_VIDEO_OFFLOAD") == "1" or \
+            torch.cuda.get_device_properties(0).total_memory < 24 * 2 ** 30
+    if offload:
+        pipe.enable_model_cpu_offload()
+    else:
+        pipe.to("cuda")
+    return offload
+
+def tiny_pipeline(seed=0):
+    # Same classes as the real model with a few thousand random weights and a byte-level tokenizer
+    # built in memory, so nothing is downloaded. The output is noise, but every stage really runs.
+    import torch
+    from diffusers import AutoencoderKLWan, WanVACEPipeline, WanVACETransformer3DModel, FlowMatchEulerDiscreteScheduler
+    from transformers import UMT5Config, UMT5EncoderModel, PreTrainedTokenizerFast
+    from tokenizers import Tokenizer, models, pre_tokenizers, decoders
+
+    vocab = {"<pad>": 0, "</s>": 1, "<unk>": 2}
+    for symbol in sorted(pre_tokenizers.ByteLevel.alphabet()):
+        vocab[symbol] = len(vocab)
+    tokenizer = Tokenizer(models.BPE(vocab=vocab, merges=[], unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=tokenizer, pad_token="<pad>", eos_token="</s>", unk_token="<unk>")
+
+    torch.manual_seed(seed)
+    text_encoder = UMT5EncoderModel(UMT5Config(vocab_size=len(vocab), d_model=32, d_kv=8, d_ff=64, num_layers=2,
+                                               num_heads=4, relative_attention_num_buckets=8))
+    vae = AutoencoderKLWan(base_dim=3, z_dim=16, dim_mult=[1, 1, 1, 1], num_res_blocks=1,
+                           temperal_downsample=[False, True, True])
+    transformer = WanVACETransformer3DModel(
+        patch_size=(1, 2, 2), num_attention_heads=2, attention_head_dim=12, in_channels=16, out_channels=16,
+        text_dim=32, freq_dim=256, ffn_dim=32, num_layers=3, cross_attn_norm=True, qk_norm="rms_norm_across_heads",
+        rope_max_seq_len=32, vace_layers=[0, 2], vace_in_channels=96,
+    )
+    for model in (text_encoder, vae, transformer):
+        model.eval()  # from_pretrained does this; without it dropout makes every run differ
+    return WanVACEPipeline(tokenizer=tokenizer, text_encoder=text_encoder, vae=vae, transformer=transformer,
+                           scheduler=FlowMatchEulerDiscreteScheduler(shift=7.0))
+
+def default_frames(tiny=False):
+    if tiny:
+        return PIL.Image.new("RGB", (64, 64), (90, 140, 220)), PIL.Image.new("RGB", (64, 64), (230, 230, 240))
+    from diffusers.utils import load_image
+    return load_image(FIRST_FRAME_URL), load_image(LAST_FRAME_URL)
+
+GRAY = 128
+
+def resize_keyframe(image, height, width):
+    # Lanczos rather than Pillow's default bicubic: the keyframes are what the whole video is anchored on
+    image = image.convert("RGB")
+    if image.size != (width, height):
+        image = image.resize((width, height), PIL.Image.Resampling.LANCZOS)
+    return image
+
+def prepare_video_tensors(first_img: PIL.Image.Image, last_img: PIL.Image.Image, height: int, width: int, num_frames: int):
+    # The conditioning video and mask already in the layout and range the pipeline converts its inputs
+    # to, so a pipeline from load_pipeline uses them as they are instead of turning num_frames images
+    # into arrays and normalizing them one by one. The video is a single preallocated
+    # (1, 3, frames, h, w) float buffer in [-1, 1] with the gray fill broadcast into it; the mask is a
+    # per-frame vector expanded to (1, 1, frames, h, w) without copying (0 keeps a frame, 1 generates it).
+    # Both come wrapped in PreparedVideo.
+    import numpy as np
+    import torch
+
+    video = torch.empty((1, 3, num_frames, height, width), dtype=torch.float32)
+    video[:, :, 1:-1].fill_(GRAY / 127.5 - 1)
+    for index, image in ((0, first_img), (-1, last_img)):
+        pixels = torch.from_numpy(np.array(resize_keyframe(image, height, width)))
+        torch.sub(pixels.permute(2, 0, 1) / 127.5, 1, out=video[0, :, index])
+
+    keep = torch.ones(num_frames, dtype=torch.float32)
+    keep[0] = keep[-1] = 0
+    mask = keep.view(1, 1, num_frames, 1, 1).expand(1, 1, num_frames, height, width)
+    return PreparedVideo(video), PreparedVideo(mask, is_mask=True)
+
+class PreparedVideo:
+    # prepare_video_tensors' output as the pipeline receives it. The pipeline only takes its length
+    # and its first item (for the size) before handing it to the video processor, where
+    # PreparedVideoProcessor recognizes it by type; a bare tensor always gets the stock preprocessing.
+    def __init__(self, tensor, is_mask=False):
+        self.tensor = tensor
+        self.is_mask = is_mask
+
+    def __len__(self):
+        return len(self.tensor)
 
-pipe.to("cuda")
+    def __getitem__(self, index):
+        return self.tensor[index]
 
-pipe.enable_vae_slicing()
-pipe.enable_model_cpu_offload()
+class PreparedVideoProcessor:
+    # A pipeline's video processor that passes PreparedVideo through and leaves everything else to
+    # the stock one. The pipeline maps the mask from [-1, 1] back to [0, 1] itself, so that is done on
+    # the per-frame vector and expanded again rather than over every pixel.
+    def __init__(self, processor):
+        self.processor = processor
+
+    def __getattr__(self, name):
+        if name == "processor":  # not set yet, e.g. while being copied
+            raise AttributeError(name)
+        return getattr(self.processor, name)
+
+    def preprocess_video(self, video, height=None, width=None, **kwargs):
+        if not isinstance(video, PreparedVideo):
+            return self.processor.preprocess_video(video, height, width, **kwargs)
+        tensor = video.tensor
+        if tensor.shape[-2:] != (height, width):
+            raise Exception(f"Prepared video is {tensor.shape[-1]}x{tensor.shape[-2]}, not {width}x{height}")
+        if video.is_mask:
+            return (tensor[..., :1, :1] * 2 - 1).expand(tensor.shape)
+        return tensor
 
 def prepare_video_and_mask(first_img: PIL.Image.Image, last_img: PIL.Image.Image, height: int, width: int, num_frames: int):
-    first_img = first_img.resize((width, height))
-    last_img = last_img.resize((width, height))
-    frames = [first_img]
-    frames.extend([PIL.Image.new("RGB", (width, height), (128, 128, 128))] * (num_frames - 2))
-    frames.append(last_img)
-    
+    # PIL-list form of prepare_video_tensors, kept for callers that want images. The gray frame and
+    # the two masks are shared objects, not copies.
+    first_img = resize_keyframe(first_img, height, width)
+    last_img = resize_keyframe(last_img, height, width)
+    gray = PIL.Image.new("RGB", (width, height), (GRAY, GRAY, GRAY))
+    frames = [first_img] + [gray] * (num_frames - 2) + [last_img]
+
     mask_black = PIL.Image.new("L", (width, height), 0)
     mask_white = PIL.Image.new("L", (width, height), 255)
     mask = [mask_black] + [mask_white] * (num_frames - 2) + [mask_black]
     return frames, mask
 
-def generate_video(prompt, negative_prompt, first_frame, last_frame, height, width, num_frames, num_steps, guidance_scale, seed):
-    if first_frame is None:
-        first_frame = load_image("https://huggingface.co/datasets/huggingface/documentation-images/resolve/main/diffusers/flf2v_input_first_frame.png")
-    if last_frame is None:
-        last_frame = load_image("https://huggingface.co/datasets/huggingface/documentation-images/resolve/main/diffusers/flf2v_input_last_frame.png")
-    
-    video_frames, mask = prepare_video_and_mask(first_frame, last_frame, height, width, num_frames)
-    
-    generator = torch.Generator(device="cuda").manual_seed(seed)
-    
-    output = pipe(
+def to_uint8_frames(video):
+    # (1, 3, frames, h, w) VAE output in [-1, 1] -> (frames, h, w, 3) uint8, rounded the way the
+    # pipeline's postprocessing plus export_to_video round
+    import torch
+    video = ((video[0] / 2 + 0.5).clamp(0, 1) * 255).to(torch.uint8)
+    return video.permute(1, 2, 3, 0).cpu().numpy()
+
+def denormalize_latents(vae, latents):
+    # What the pipeline does to its latents before handing them to the VAE
+    import torch
+    latents = latents.to(vae.dtype)
+    mean = torch.tensor(vae.config.latents_mean).view(1, vae.config.z_dim, 1, 1, 1).to(latents.device, latents.dtype)
+    inverse_std = 1.0 / torch.tensor(vae.config.latents_std).view(1, vae.config.z_dim, 1, 1, 1).to(latents.device, latents.dtype)
+    return latents / inverse_std + mean
+
+def onload(vae):
+    # Under model CPU offload the VAE is moved to the GPU by a hook on decode(); calling its decoder
+    # directly has to trigger that hook by hand
+    hook = getattr(vae, "_hf_hook", None)
+    if hook is not None and hasattr(hook, "pre_forward"):
+        hook.pre_forward(vae)
+
+def streams_decoding(vae):
+    # decode_frames' per-frame loop drives private parts of diffusers' AutoencoderKLWan (its feature
+    # cache and the decoder's first_chunk flag, as of diffusers 0.41). A VAE laid out any other way is
+    # decoded whole with vae.decode instead.
+    if not all(hasattr(vae, name) for name in ("clear_cache", "post_quant_conv", "decoder")):
+        return False
+    try:
+        parameters = inspect.signature(vae.decoder.forward).parameters
+    except (TypeError, ValueError):
+        return False
+    if not {"feat_cache", "feat_idx", "first_chunk"} <= set(parameters):
+        return False
+    vae.clear_cache()
+    return hasattr(vae, "_feat_map") and hasattr(vae, "_conv_idx")
+
+def decode_frames(vae, latents):
+    # Yields the video as uint8 frames while the VAE decodes it: the Wan VAE is causal in time and
+    # decodes one latent frame (1 video frame, then 4 per latent frame) at a time against a feature
+    # cache, so each chunk can be encoded and dropped before the next is decoded. AutoencoderKLWan
+    # .decode runs the same loop but concatenates every chunk into one float tensor first.
+    import torch
+    with torch.no_grad():
+        onload(vae)
+        latents = denormalize_latents(vae, latents)
+        if getattr(vae, "use_tiling", False) or getattr(vae.config, "patch_size", None) is not None \
+                or not streams_decoding(vae):
+            # Tiled and patched decoding have no per-frame form; decode whole, still convert in chunks
+            video = vae.decode(latents, return_dict=False)[0]
+            for start in range(0, video.shape[2], 4):
+                yield to_uint8_frames(video[:, :, start:start + 4])
+            return
+        vae.clear_cache()
+        try:
+            x = vae.post_quant_conv(latents)
+            for i in range(x.shape[2]):
+                vae._conv_idx = [0]
+                out = vae.decoder(x[:, :, i:i + 1], feat_cache=vae._feat_map, feat_idx=vae._conv_idx,
+                                  first_chunk=i == 0)
+                yield to_uint8_frames(out.clamp(-1, 1))
+        finally:
+            vae.clear_cache()
+
+def preview_image(vae, latents):
+    # The middle frame of the video as it stands at this step. A single latent frame decodes like the
+    # first frame of a video, to one image, for about 1/(frames/4) of the cost of decoding the video.
+    middle = latents.shape[2] // 2
+    frames = next(decode_frames(vae, latents[:, :, middle:middle + 1]))
+    return PIL.Image.fromarray(frames[0])
+
+def prompt_inputs(pipe, prompt, negative_prompt, guidance_scale):
+    # The pipeline's prompt arguments and the seconds its PromptCache saved. Without guidance
+    # (guidance_scale <= 1) the pipeline never uses the negative prompt, so it is not encoded.
+    cache = getattr(pipe, "prompt_cache", None)
+    if cache is None:
+        return {"prompt": prompt, "negative_prompt": negative_prompt}, 0.0
+    prompt_embeds, saved = cache.embed(prompt)
+    prompts = {"prompt_embeds": prompt_embeds}
+    if guidance_scale > 1:
+        prompts["negative_prompt_embeds"], negative_saved = cache.embed(negative_prompt or "")
+        saved += negative_saved
+    return prompts, saved
+
+def render_video(pipe, request, video_path, on_step=None, tiny=False, timings=None, on_preview=None, previews=0):
+    # Runs one generation on a loaded pipeline and writes the MP4. `request` holds the Gradio inputs;
+    # on_step(step, total) is called after every denoising step and may raise to abort the run.
+    # `timings`, if given, is filled with the seconds spent on prompts (and saved by the cache) and on
+    # decoding and encoding. With on_preview, on_preview(image, step) is called `previews` times
+    # during denoising with the middle frame decoded from the latents so far.
+    # Frames go to the encoder as the VAE produces them, so the finished video is never held in memory.
+    import torch
+    from video_encoder import FPS, open_video_writer
+
+    first_frame, last_frame = request.get("first_frame"), request.get("last_frame")
+    if first_frame is None or last_frame is None:
+        default_first, default_last = default_frames(tiny)
+        first_frame = default_first if first_frame is None else first_frame
+        last_frame = default_last if last_frame is None else last_frame
+    height, width, num_frames = int(request["height"]), int(request["width"]), int(request["num_frames"])
+    num_steps = int(request["num_steps"])
+
+    video_frames, mask = prepare_video_tensors(first_frame, last_frame, height, width, num_frames)
+
+    # Seeded where the pipeline executes (offloaded pipelines report cuda), so a seed gives the same
+    # video it gave before on GPU
+    generator = torch.Generator(device=pipe._execution_device).manual_seed(int(request["seed"]))
+
+    preview_every = max(1, num_steps // (previews + 1)) if on_preview is not None and previews else 0
+
+    def step_end(pipeline, step, timestep, tensors):
+        if on_step is not None:
+            on_step(step + 1, num_steps)
+        if preview_every and (step + 1) % preview_every == 0 and step + 1 < num_steps:
+            on_preview(preview_image(pipeline.vae, tensors["latents"]), step + 1)
+        return tensors
+
+    guidance_scale = float(request["guidance_scale"])
+    start = time.perf_counter()
+    prompts, saved = prompt_inputs(pipe, request["prompt"], request["negative_prompt"], guidance_scale)
+    if timings is not None:
+        timings["prompt_s"] = time.perf_counter() - start
+        timings["prompt_saved_s"] = saved
+
+    latents = pipe(
         video=video_frames,
         mask=mask,
-        prompt=prompt,
-        negative_prompt=negative_prompt,
+        **prompts,
         height=height,
         width=width,
         num_frames=num_frames,
         num_inference_steps=num_steps,
         guidance_scale=guidance_scale,
         generator=generator,
-    ).frames[0]
-    
-    video_path = "/tmp/output.mp4"
-    export_to_video(output, video_path, fps=16)
+        callback_on_step_end=step_end,
+        output_type="latent",
+    ).frames
+
+    start = time.perf_counter()
+    writer = open_video_writer(video_path, width, height, fps=int(request.get("fps") or FPS))
+    try:
+        for frames in decode_frames(pipe.vae, latents):
+            writer.write(frames)
+        writer.close()
+    except BaseException:
+        try:
+            writer.close()
+        finally:
+            if os.path.exists(video_path):
+                os.remove(video_path)
+        raise
+    if timings is not None:
+        timings["decode_s"] = time.perf_counter() - start
     return video_path
 
+client = None  # where generate_video sends jobs; set by main()
 
-default_prompt = "CG animation style, a small blue bird takes off from the ground, flapping its wings. The bird's feathers are delicate, with a unique pattern on its chest. The background shows a blue sky with white clouds under bright sunshine. The camera follows the bird upward, capturing its flight and the vastness of the sky from a close-up, low-angle perspective."
-default_negative = "Bright tones, overexposed, static, blurred details, subtitles, style, works, paintings, images, static, overall gray, worst quality, low quality, JPEG compression residue, ugly, incomplete, extra fingers, poorly drawn hands, poorly drawn faces, deformed, disfigured, misshapen limbs, fused fingers, still picture, messy background, three legs, many people in the background, walking backwards"
+def stream_video(prompt, negative_prompt, first_frame, last_frame, height, width, num_frames, num_steps, guidance_scale, seed, progress=None):
+    # Thin client: queue the job on the video worker and follow it, yielding ("preview", image) each
+    # time the worker has decoded a new preview frame and finally ("video", path)
+    request = {
+        "prompt": prompt, "negative_prompt": negative_prompt, "first_frame": first_frame, "last_frame": last_frame,
+        "height": height, "width": width, "num_frames": num_frames, "num_steps": num_steps,
+        "guidance_scale": guidance_scale, "seed": seed,
+    }
+    job_id = client.submit(request)
+    preview_step = 0
+    while True:
+        status = client.status(job_id)
+        if status["status"] == "done":
+            timings = status.get("timings") or {}
+            if "prompt_s" in timings:
+                print(f"Video {job_id}: prompt encoding {timings['prompt_s']:.2f} s, "
+                      f"{timings['prompt_saved_s']:.2f} s saved by the prompt cache, "
+                      f"decode and encode {timings['decode_s']:.2f} s")
+            yield "video", client.video_path(job_id)
+            return
+        if status["status"] in ("failed", "cancelled"):
+            raise Exception(status.get("error") or f"Video job {status['status']}")
+        if status.get("preview_step", 0) > preview_step:
+            preview_step = status["preview_step"]
+            image = client.preview(job_id)
+            if image is not None:
+                yield "preview", image
+        if progress is not None:
+            if status["status"] == "queued":
+                progress(0, desc=f"Queued ({status['position']} ahead)")
+            else:
+                progress((status["step"], status["total_steps"]), desc="Generating")
+        time.sleep(0.5)
+
+def generate_video(prompt, negative_prompt, first_frame, last_frame, height, width, num_frames, num_steps, guidance_scale, seed, progress=None):
+    # Path of the finished video, without the previews
+    for kind, value in stream_video(prompt, negative_prompt, first_frame, last_frame, height, width, num_frames,
+                                    num_steps, guidance_scale, seed, progress):
+        if kind == "video":
+            return value
+
+def build_interface(preset="512"):
+    import gradio as gr
+    size = PRESETS[preset]
+
+    def run(prompt, negative_prompt, first_frame, last_frame, height, width, num_frames, num_steps, guidance_scale, seed,
+            progress=gr.Progress()):
+        preview = None
+        try:
+            for kind, value in stream_video(prompt, negative_prompt, first_frame, last_frame, height, width, num_frames,
+                                            num_steps, guidance_scale, seed, progress=progress):
+                if kind == "preview":
+                    preview = value
+                    yield preview, None
+                else:
+                    yield preview, value
+        except Exception as e:
+            raise gr.Error(str(e))
+
+    return gr.Interface(
+        fn=run,
+        inputs=[
+            gr.Textbox(label="Prompt", value=default_prompt, lines=3),
+            gr.Textbox(label="Negative Prompt", value=default_negative, lines=3),
+            gr.Image(label="First Frame (upload or use default)", type="pil"),
+            gr.Image(label="Last Frame (upload or use default)", type="pil"),
+            gr.Slider(label="Height", minimum=64, maximum=720, step=16, value=size["height"]),
+            gr.Slider(label="Width", minimum=64, maximum=1280, step=16, value=size["width"]),
+            gr.Slider(label="Number of Frames", minimum=5, maximum=129, step=4, value=size["num_frames"]),
+            gr.Slider(label="Inference Steps", minimum=1, maximum=100, step=1, value=size["num_steps"]),
+            gr.Slider(label="Guidance Scale", minimum=1.0, maximum=20.0, step=0.5, value=5.0),
+            gr.Number(label="Seed", value=42),
+        ],
+        outputs=[gr.Image(label="Preview (middle frame, updates while generating)", type="pil"),
+                 gr.Video(label="Generated Video")],
+        title="Wan2.1 VACE 1.3B First/Last Frame to Video (Fixed & Working)",
+        description="Official Wan2.1-VACE-1.3B model via Diffusers. The previous model had a broken config causing the 'VACE layers exceed transformer layers' error. Now fixed!"
+    )
+
+def benchmark(tiny=False, preset=None, device=None, runs=3):
+    # Load time, first-run time (includes torch.compile) and steady-state seconds per run and per
+    # denoising step for each dtype / memory-format / compile setting that applies to the device.
+    # python wan.py --tiny --benchmark is a CPU smoke test of the whole pipeline in well under a minute.
+    import resource
+    import tempfile
+    device = select_device(device)
+    preset = preset or ("tiny" if tiny else "cpu" if device == "cpu" else "480p")
+    size = PRESETS[preset]
+    request = dict(size, prompt=default_prompt, negative_prompt=default_negative, first_frame=None, last_frame=None,
+                   guidance_scale=5.0, seed=42)
+    configs = [("fp32", {"dtype": "fp32"})]
+    if str(select_dtype(device)) == "torch.bfloat16":
+        configs.append(("bf16", {"dtype": "bf16"}))
+    configs += [("fp32 channels_last", {"dtype": "fp32", "channels_last": True}),
+                ("fp32 compile", {"dtype": "fp32", "compile": True})]
+    print(f"device {device}, preset {preset} ({size['width']}x{size['height']}, {size['num_frames']} frames, "
+          f"{size['num_steps']} steps), {runs} runs")
+    with tempfile.TemporaryDirectory() as directory:
+        for label, options in configs:
+            try:
+                start = time.perf_counter()
+                pipe = load_pipeline(tiny=tiny, device=device, **dict({"channels_last": False, "compile": False}, **options))
+                load = time.perf_counter() - start
+                times = []
+                timings = {}
+                for run in range(runs + 1):
+                    start = time.perf_counter()
+                    render_video(pipe, request, os.path.join(directory, f"{run}.mp4"), tiny=tiny, timings=timings)
+                    times.append(time.perf_counter() - start)
+            except Exception as e:
+                print(f"{label:<20} failed: {str(e)}")
+                continue
+            steady = sorted(times[1:])[len(times[1:]) // 2]
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            print(f"{label:<20} load {load:6.1f} s  first run {times[0]:6.2f} s  median run {steady:6.2f} s  "
+                  f"{steady / size['num_steps']:6.3f} s/step  prompts {timings['prompt_s']:5.2f} s "
+                  f"({timings['prompt_saved_s']:5.2f} s saved)  peak RSS {peak:7.0f} MB")
+            del pipe
+
+def benchmark_prepare(frame_counts=(81, 105, 129), height=720, width=1280, runs=3):
+    # Building the conditioning inputs and the pipeline's conversion of them (preprocess_conditions,
+    # less the VAE), for the PIL lists and for prepare_video_tensors. Needs no model.
+    import gc
+    import torch
+    from diffusers.video_processor import VideoProcessor
+    stock = VideoProcessor(vae_scale_factor=8)
+    fast = PreparedVideoProcessor(VideoProcessor(vae_scale_factor=8))
+    first = PIL.Image.effect_noise((832, 480), 64).convert("RGB")
+    last = PIL.Image.effect_noise((832, 480), 32).convert("RGB")
+    print(f"{width}x{height}, median of {runs} runs")
+    for num_frames in frame_counts:
+        for label, prepare, processor in (("PIL lists", prepare_video_and_mask, stock),
+                                          ("tensors", prepare_video_tensors, fast)):
+            times = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                video, mask = prepare(first, last, height, width, num_frames)
+                built = time.perf_counter() - start
+                video = processor.preprocess_video(video, height, width).to(dtype=torch.float32)
+                mask = torch.clamp((processor.preprocess_video(mask, height, width) + 1) / 2, min=0, max=1)
+                times.append((built, time.perf_counter() - start))
+                del video, mask
+                gc.collect()
+            built, total = sorted(times, key=lambda t: t[1])[len(times) // 2]
+            print(f"{num_frames:>4} frames  {label:<10} build {built * 1000:8.1f} ms  "
+                  f"build + pipeline conversion {total * 1000:8.1f} ms")
+
+def main():
+    import argparse
+    from video_worker import VideoWorker, LocalClient, HTTPClient
+    global client
+
+    parser = argparse.ArgumentParser(description="Wan2.1 VACE video generation front end")
+    parser.add_argument("--server", default=os.environ.get("IRIS_VIDEO_SERVER"), help="URL of a running video_worker.py")
+    parser.add_argument("--tiny", action="store_true", help="run a tiny random pipeline (testing)")
+    parser.add_argument("--device", help="auto (default), cuda, mps or cpu")
+    parser.add_argument("--preset", choices=sorted(PRESETS), help="default size, frames and steps in the UI")
+    parser.add_argument("--benchmark", action="store_true", help="time generation on this machine and exit")
+    parser.add_argument("--benchmark-prepare", action="store_true", help="time building the conditioning video and exit")
+    parser.add_argument("--no-share", action="store_true", help="don't create a public Gradio link")
+    args = parser.parse_args()
+
+    if args.benchmark_prepare:
+        benchmark_prepare()
+        return
+    if args.benchmark:
+        benchmark(tiny=args.tiny, preset=args.preset, device=args.device)
+        return
+    if args.server:
+        client = HTTPClient(args.server)
+    else:
+        client = LocalClient(VideoWorker(tiny=args.tiny, device=args.device).start())
+    if args.preset is None:
+        args.preset = "tiny" if args.tiny else "cpu" if not args.server and select_device(args.device) == "cpu" else "512"
+    build_interface(args.preset).queue(default_concurrency_limit=None).launch(share=not args.no_share)
 
-iface = gr.Interface(
-    fn=generate_video,
-    inputs=[
-        gr.Textbox(label="Prompt", value=default_prompt, lines=3),
-        gr.Textbox(label="Negative Prompt", value=default_negative, lines=3),
-        gr.Image(label="First Frame (upload or use default)", type="pil"),
-        gr.Image(label="Last Frame (upload or use default)", type="pil"),
-        gr.Slider(label="Height", minimum=256, maximum=720, step=64, value=512),
-        gr.Slider(label="Width", minimum=256, maximum=1280, step=64, value=512),
-        gr.Slider(label="Number of Frames", minimum=16, maximum=129, step=1, value=81),
-        gr.Slider(label="Inference Steps", minimum=10, maximum=100, step=1, value=30),
-        gr.Slider(label="Guidance Scale", minimum=1.0, maximum=20.0, step=0.5, value=5.0),
-        gr.Number(label="Seed", value=42),
-    ],
-    outputs=gr.Video(label="Generated Video"),
-    title="Wan2.1 VACE 1.3B First/Last Frame to Video (Fixed & Working)",
-    description="Official Wan2.1-VACE-1.3B model via Diffusers. The previous model had a broken config causing the 'VACE layers exceed transformer layers' error. Now fixed!"
-)
-
-iface.launch(share=True)
+if __name__ == "__main__":
+    main()
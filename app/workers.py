@@ -0,0 +1,91 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class JobCancelled(Exception):
+    pass
+
+class PoolBusy(Exception):
+    pass
+
+class Job:
+    def __init__(self, key):
+        self.key = key
+        self.future = None
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def check(self):
+        # Long-running jobs call this between steps to bail out once they have been superseded
+        if self.cancelled:
+            raise JobCancelled()
+
+class WorkerPool:
+    # Fixed-size thread pool shared by the controller. Jobs are submitted under a key; a new job
+    # for the same key cancels the stale one. At most max_pending jobs may be queued or running.
+    def __init__(self, max_workers=2, max_pending=8):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="iris-worker")
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.latest = {}
+        self.lock = threading.Lock()
+
+    def submit(self, key, fn, *args, on_result=None, on_error=None, block=False, timeout=None):
+        # fn is called as fn(job, *args) so it can poll job.check()
+        if not self.slots.acquire(blocking=block, timeout=timeout if block else None):
+            raise PoolBusy("Too many requests in progress, please wait a moment.")
+
+        job = Job(key)
+        with self.lock:
+            stale = self.latest.get(key)
+            self.latest[key] = job
+        if stale is not None:
+            stale.cancel()
+
+        def run():
+            if job.cancelled:
+                return
+            try:
+                result = fn(job, *args)
+                if not job.cancelled and on_result is not None:
+                    on_result(result)
+            except JobCancelled:
+                pass
+            except Exception as e:
+                if not job.cancelled and on_error is not None:
+                    on_error(e)
+
+        try:
+            job.future = self.executor.submit(run)
+        except Exception:
+            self.slots.release()
+            raise
+        # Release on completion or cancellation, so cancelled queued jobs free their slot too
+        job.future.add_done_callback(lambda _: self._finish(job))
+        return job
+
+    def cancel(self, key):
+        with self.lock:
+            job = self.latest.pop(key, None)
+        if job is not None:
+            job.cancel()
+
+    def _finish(self, job):
+        self.slots.release()
+        with self.lock:
+            if self.latest.get(job.key) is job:
+                del self.latest[job.key]
+
+    def shutdown(self, wait=False):
+        with self.lock:
+            jobs = list(self.latest.values())
+            self.latest.clear()
+        for job in jobs:
+            job.cancel()
+        self.executor.shutdown(wait=wait, cancel_futures=True)